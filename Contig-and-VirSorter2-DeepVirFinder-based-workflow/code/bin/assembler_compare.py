@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare MEGAHIT and SPAdes viral identification results by sequence content
+
+MEGAHIT (k141_*) and SPAdes (NODE_*) name their contigs independently, so the
+high-confidence contigs of the two assemblies (identified by both VirSorter2
+and DeepVirFinder) are matched on their sequences instead:
+  - sketch: canonical k-mers of every contig are hashed and the smallest hash
+    of each window of w consecutive k-mers is kept (minimizers); all contigs
+    of an assembly are sketched in one pass over a NumPy array
+  - match: sketches are joined on the hash; a MEGAHIT/SPAdes pair matches when
+    the shared minimizers cover at least --min-containment of the smaller
+    sketch (Jaccard is reported alongside)
+  - cluster: connected components of the matched pairs; a component holding
+    contigs of both assemblies is a cross-assembler consensus cluster
+
+Outputs (<sample>_*):
+  - assembler_comparison.txt:      text report
+  - assembler_comparison.csv:      one row per high-confidence contig
+  - assembler_contig_matches.tsv:  matched contig pairs
+  - consensus_viral_sequences.txt: contigs of the consensus clusters
+
+Usage:
+  assembler_compare.py --sample S \\
+      --megahit S_megahit_viral_merged_report.csv S_megahit_contigs.fa \\
+      --spades S_spades_viral_merged_report.csv S_spades_contigs.fa
+"""
+
+import sys
+import gzip
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ASSEMBLERS = ('MEGAHIT', 'SPAdes')
+
+# A/C/G/T -> 0..3, anything else -> 4 (k-mers containing it are skipped)
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _bases in enumerate(('Aa', 'Cc', 'Gg', 'Tt')):
+    for _base in _bases:
+        BASE_CODES[ord(_base)] = _code
+
+NO_HASH = np.iinfo(np.uint64).max
+
+# Minimizers shared by more contigs than this are repeats and carry no pairing signal
+MAX_MINIMIZER_OCCURRENCE = 32
+
+MATCH_COLUMNS = ['MEGAHIT_contig', 'SPAdes_contig', 'shared_minimizers', 'containment', 'jaccard', 'cluster_id']
+
+
+def read_high_confidence(csv_path):
+    """
+    Sequences identified by both VirSorter2 and DeepVirFinder in a merged report CSV
+
+    Returns:
+        DataFrame indexed by sequence name with vs2_score, dvf_score, identified_by
+    """
+    columns = ['vs2_score', 'dvf_score', 'identified_by']
+    try:
+        df = pd.read_csv(csv_path, dtype={'sequence_name': str})
+    except (pd.errors.EmptyDataError, FileNotFoundError) as e:
+        print(f"  ⚠️  Warning: Failed to parse {csv_path}: {e}")
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='sequence_name'))
+    if 'identified_by' not in df.columns:
+        print(f"  ⚠️  Warning: {csv_path} has no identified_by column")
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='sequence_name'))
+    both = df[df['identified_by'] == 'Both']
+    return both.drop_duplicates('sequence_name').set_index('sequence_name')[columns]
+
+
+def read_sequences(fasta_path, names):
+    """
+    Sequences of the wanted contigs (name = header up to the first whitespace)
+
+    Returns:
+        dict name -> sequence bytes, for the names found in the file
+    """
+    wanted = set(names)
+    sequences = {}
+    opener = gzip.open if str(fasta_path).endswith('.gz') else open
+    name, chunks = None, None
+    with opener(fasta_path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                if chunks is not None:
+                    sequences[name] = b''.join(chunks)
+                fields = line[1:].split(None, 1)
+                name = fields[0].decode() if fields else ''
+                chunks = [] if name in wanted else None
+            elif chunks is not None:
+                chunks.append(line.strip())
+    if chunks is not None:
+        sequences[name] = b''.join(chunks)
+    return sequences
+
+
+def mix64(values):
+    """splitmix64 finalizer: spreads k-mer codes uniformly over uint64"""
+    with np.errstate(over='ignore'):
+        values = values ^ (values >> np.uint64(30))
+        values = values * np.uint64(0xbf58476d1ce4e5b9)
+        values = values ^ (values >> np.uint64(27))
+        values = values * np.uint64(0x94d049bb133111eb)
+        return values ^ (values >> np.uint64(31))
+
+
+def packed_kmers(bases, k):
+    """
+    2-bit packed k-mer starting at every position of a 0..3 base array
+
+    Built by doubling (1-, 2-, 4-, ...-mers, each in the narrowest integer
+    type), so the array is traversed O(log k) times rather than k times.
+    """
+    n = len(bases) - k + 1
+    result, length = None, 0
+    block, size = bases.astype(np.uint8), 1
+    while True:
+        if k & size:
+            part = block[length:length + n].astype(np.uint64)
+            result = part if result is None else (result << np.uint64(2 * size)) | part
+            length += size
+        if 2 * size > k:
+            return result
+        wider = np.uint8 if size < 4 else np.uint16 if size < 8 else np.uint32 if size < 16 else np.uint64
+        block = (block[:-size].astype(wider) << wider(2 * size)) | block[size:]
+        size *= 2
+
+
+def kmer_hashes(codes, k):
+    """
+    Hash of the canonical k-mer starting at every position of a base code array
+
+    Returns:
+        uint64 array of len(codes) - k + 1 hashes; NO_HASH where the k-mer has a non-ACGT base
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    bases = codes & 3
+    forward = packed_kmers(bases, k)
+    # Reverse complement k-mers: packed k-mers of the reversed complement, read backwards
+    reverse = packed_kmers((3 - bases)[::-1], k)[::-1]
+    hashes = mix64(np.minimum(forward, reverse))
+
+    invalid = np.concatenate(([0], np.cumsum(codes == 4, dtype=np.int64)))
+    hashes[invalid[k:k + n] != invalid[:n]] = NO_HASH
+    return hashes
+
+
+def window_minima(values, w):
+    """
+    Minimum of every window of w consecutive values (van Herk/Gil-Werman:
+    prefix and suffix minima of w-sized blocks, O(n) for any w)
+    """
+    n = len(values) - w + 1
+    blocks = np.concatenate((values, np.full(-len(values) % w, NO_HASH, dtype=values.dtype))).reshape(w, -1, order='F')
+    prefix = np.minimum.accumulate(blocks, axis=0).ravel(order='F')
+    suffix = np.minimum.accumulate(blocks[::-1], axis=0)[::-1].ravel(order='F')
+    return np.minimum(suffix[:n], prefix[w - 1:w - 1 + n])
+
+
+def sketch(sequences, k=21, w=11):
+    """
+    Minimizer sketch of a list of sequences, computed over their concatenation
+
+    Returns:
+        (contigs, hashes) arrays sorted by hash, one entry per distinct minimizer of each contig
+    """
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64))
+    if not sequences:
+        return empty
+    # Contigs are separated by one N, so no k-mer spans two of them
+    codes = BASE_CODES[np.frombuffer(b'N'.join(sequences), dtype=np.uint8)]
+    hashes = kmer_hashes(codes, k)
+    if len(hashes) < w:
+        return empty
+    minima = window_minima(hashes, w)
+
+    # Consecutive windows mostly share their minimizer; keep each run once per contig
+    lengths = np.array([len(seq) for seq in sequences])
+    starts = np.cumsum(lengths + 1) - lengths - 1
+    keep = np.r_[True, minima[1:] != minima[:-1]]
+    keep[starts[starts < len(minima)]] = True
+    positions = np.flatnonzero(keep & (minima != NO_HASH))
+
+    # Windows must lie within one contig
+    contigs = np.searchsorted(starts, positions, side='right') - 1
+    inside = positions + (w - 1) + k <= starts[contigs] + lengths[contigs]
+    contigs, hashes = contigs[inside], minima[positions[inside]]
+
+    # Stable sort: entries of one hash stay in contig order
+    order = np.argsort(hashes, kind='stable')
+    contigs, hashes = contigs[order], hashes[order]
+    distinct = np.r_[True, (hashes[1:] != hashes[:-1]) | (contigs[1:] != contigs[:-1])]
+    return contigs[distinct], hashes[distinct]
+
+
+def match_sketches(sketch_a, sketch_b, min_containment=0.5, min_shared=3):
+    """
+    Contig pairs of two sketches sharing enough minimizers
+
+    Returns:
+        DataFrame with contig_a, contig_b, shared_minimizers, containment, jaccard
+    """
+    contigs_a, hashes_a = sketch_a
+    contigs_b, hashes_b = sketch_b
+    # Entries of b and the run of equal hashes in a (both sorted by hash)
+    low = np.searchsorted(hashes_a, hashes_b, side='left')
+    in_a = np.searchsorted(hashes_a, hashes_b, side='right') - low
+    in_b = np.searchsorted(hashes_b, hashes_b, side='right') - np.searchsorted(hashes_b, hashes_b, side='left')
+    usable = (in_a > 0) & (in_a + in_b <= MAX_MINIMIZER_OCCURRENCE)
+
+    counts = in_a[usable]
+    index_b = np.repeat(np.flatnonzero(usable), counts)
+    runs = np.repeat(np.cumsum(counts) - counts, counts)
+    index_a = np.repeat(low[usable], counts) + np.arange(counts.sum()) - runs
+
+    n_b = int(contigs_b.max()) + 1 if len(contigs_b) else 1
+    keys, shared = np.unique(contigs_a[index_a] * n_b + contigs_b[index_b], return_counts=True)
+    pairs = pd.DataFrame({'contig_a': keys // n_b, 'contig_b': keys % n_b, 'shared_minimizers': shared})
+
+    sizes_a = np.bincount(contigs_a)[pairs['contig_a'].to_numpy()] if len(pairs) else np.empty(0, dtype=np.int64)
+    sizes_b = np.bincount(contigs_b)[pairs['contig_b'].to_numpy()] if len(pairs) else np.empty(0, dtype=np.int64)
+    pairs['containment'] = np.round(shared / np.maximum(np.minimum(sizes_a, sizes_b), 1), 4)
+    pairs['jaccard'] = np.round(shared / np.maximum(sizes_a + sizes_b - shared, 1), 4)
+    keep = (pairs['shared_minimizers'] >= min_shared) & (pairs['containment'] >= min_containment)
+    return pairs[keep].reset_index(drop=True)
+
+
+def connected_components(n_nodes, edges_a, edges_b):
+    """
+    Component label (smallest member) of every node of an undirected graph
+    """
+    labels = np.arange(n_nodes)
+    while True:
+        low = np.minimum(labels[edges_a], labels[edges_b])
+        updated = labels.copy()
+        np.minimum.at(updated, edges_a, low)
+        np.minimum.at(updated, edges_b, low)
+        # Pointer jumping: follow labels to their own labels until settled
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def compare_assemblies(calls, sequences, k=21, w=11, min_containment=0.5, min_shared=3):
+    """
+    Match the high-confidence contigs of both assemblies and cluster them
+
+    Args:
+        calls: {assembler: high-confidence DataFrame (read_high_confidence)}
+        sequences: {assembler: {name: sequence}}
+
+    Returns:
+        (contigs, matches): one row per high-confidence contig (by cluster), one row per matched pair
+    """
+    names = {asm: [name for name in calls[asm].index if name in sequences[asm]] for asm in ASSEMBLERS}
+    sketches = {asm: sketch([sequences[asm][name] for name in names[asm]], k, w) for asm in ASSEMBLERS}
+    pairs = match_sketches(sketches['MEGAHIT'], sketches['SPAdes'], min_containment, min_shared)
+
+    # Graph nodes: MEGAHIT contigs, then SPAdes contigs
+    n_megahit = len(names['MEGAHIT'])
+    nodes = pd.DataFrame({
+        'sequence': names['MEGAHIT'] + names['SPAdes'],
+        'assembler': ['MEGAHIT'] * n_megahit + ['SPAdes'] * len(names['SPAdes']),
+        'length': [len(sequences[asm][name]) for asm in ASSEMBLERS for name in names[asm]],
+    })
+    edges_a = pairs['contig_a'].to_numpy()
+    edges_b = pairs['contig_b'].to_numpy() + n_megahit
+    labels = connected_components(len(nodes), edges_a, edges_b)
+
+    # Consensus clusters hold contigs of both assemblies; numbered by size, then total length
+    nodes['component'] = labels
+    nodes['is_megahit'] = np.arange(len(nodes)) < n_megahit
+    members = nodes.groupby('component').agg(n=('sequence', 'size'), bases=('length', 'sum'),
+                                             megahit=('is_megahit', 'sum'))
+    consensus = members[(members['megahit'] > 0) & (members['megahit'] < members['n'])]
+    consensus = consensus.sort_values(['n', 'bases'], ascending=False, kind='mergesort')
+    cluster_ids = pd.Series([f"C{i + 1}" for i in range(len(consensus))], index=consensus.index, dtype=object)
+    nodes['cluster_id'] = nodes['component'].map(cluster_ids)
+
+    # Best partner of every matched contig: highest containment, then shared minimizers
+    both_ways = pd.concat([
+        pd.DataFrame({'node': edges_a, 'partner': edges_b}),
+        pd.DataFrame({'node': edges_b, 'partner': edges_a}),
+    ], ignore_index=True)
+    both_ways = pd.concat([both_ways, pd.concat([pairs[['shared_minimizers', 'containment', 'jaccard']]] * 2,
+                                                ignore_index=True)], axis=1)
+    best = both_ways.sort_values(['node', 'containment', 'shared_minimizers', 'partner'],
+                                 ascending=[True, False, False, True], kind='mergesort').drop_duplicates('node')
+    best = best.set_index('node')
+    nodes['best_match'] = pd.Series(nodes['sequence'].to_numpy()[best['partner'].to_numpy()], index=best.index)
+    for column in ('shared_minimizers', 'containment', 'jaccard'):
+        nodes[column] = best[column]
+
+    # Rows by cluster (consensus clusters first), then assembler and name
+    nodes['rank'] = nodes['component'].map(pd.Series(np.arange(len(consensus)), index=consensus.index))
+    contigs = nodes.sort_values(['rank', 'assembler', 'sequence'], na_position='last', kind='mergesort')
+    contigs = contigs.drop(columns=['component', 'is_megahit', 'rank'])
+    matches = pd.DataFrame({
+        'MEGAHIT_contig': nodes['sequence'].to_numpy()[edges_a],
+        'SPAdes_contig': nodes['sequence'].to_numpy()[edges_b],
+        'shared_minimizers': pairs['shared_minimizers'].to_numpy(),
+        'containment': pairs['containment'].to_numpy(),
+        'jaccard': pairs['jaccard'].to_numpy(),
+        'cluster_id': nodes['cluster_id'].to_numpy()[edges_a],
+    }, columns=MATCH_COLUMNS)
+    return contigs, matches
+
+
+def write_comparison_report(path, sample, calls, contigs, matches, settings):
+    """Text report: overall statistics and the consensus clusters"""
+    in_cluster = contigs['cluster_id'].notna()
+    counts = {asm: int((contigs['assembler'] == asm).sum()) for asm in ASSEMBLERS}
+    consensus = {asm: int((in_cluster & (contigs['assembler'] == asm)).sum()) for asm in ASSEMBLERS}
+    n_clusters = contigs.loc[in_cluster, 'cluster_id'].nunique()
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("="*100 + "\n")
+        f.write("Assembler Comparison Report - Viral Identification Results\n")
+        f.write("MEGAHIT vs metaSPAdes (sequence-level matching)\n")
+        f.write(f"Sample: {sample}\n")
+        f.write("="*100 + "\n\n")
+
+        f.write("[Overall Statistics]\n")
+        f.write("-"*100 + "\n")
+        f.write(f"MEGAHIT identified viral sequences:    {len(calls['MEGAHIT']):,}\n")
+        f.write(f"SPAdes identified viral sequences:     {len(calls['SPAdes']):,}\n")
+        for asm in ASSEMBLERS:
+            missing = len(calls[asm]) - counts[asm]
+            if missing:
+                f.write(f"{asm} sequences not found in contigs: {missing:,}\n")
+        f.write(f"Matched contig pairs:                  {len(matches):,}\n")
+        f.write(f"Cross-assembler consensus clusters:    {n_clusters:,}\n\n")
+
+        f.write(f"MEGAHIT sequences in consensus:        {consensus['MEGAHIT']:,}\n")
+        f.write(f"SPAdes sequences in consensus:         {consensus['SPAdes']:,}\n")
+        f.write(f"MEGAHIT-only sequences:                {counts['MEGAHIT'] - consensus['MEGAHIT']:,}\n")
+        f.write(f"SPAdes-only sequences:                 {counts['SPAdes'] - consensus['SPAdes']:,}\n\n")
+
+        if len(contigs) > 0:
+            consistency = in_cluster.sum() / len(contigs) * 100
+            f.write(f"Assembler consistency:                 {consistency:.2f}%\n\n")
+
+        f.write("Matching: canonical {k}-mer minimizers (window {w}), "
+                "containment >= {min_containment}, >= {min_shared} shared minimizers\n\n".format(**settings))
+
+        f.write("="*100 + "\n")
+        f.write("[Recommendation]\n")
+        f.write("-"*100 + "\n")
+        f.write(f"High-confidence viral clusters (assembled by both assemblers, identified by both methods): "
+                f"{n_clusters:,}\n")
+        f.write("Recommend prioritizing these consensus clusters for downstream analysis.\n\n")
+
+        f.write("[Consensus Clusters]\n")
+        f.write("-"*100 + "\n")
+        f.write(f"{'Cluster':<10} {'MEGAHIT contigs':<40} {'SPAdes contigs':<40} {'Max containment':<15}\n")
+        f.write("-"*100 + "\n")
+        clustered = contigs[in_cluster]
+        names = clustered.groupby(['cluster_id', 'assembler'], sort=False)['sequence'].agg(','.join).unstack()
+        names = names.reindex(columns=list(ASSEMBLERS))
+        best = clustered.groupby('cluster_id', sort=False)['containment'].max()
+        for cluster_id, megahit, spades, containment in zip(best.index, names.loc[best.index, 'MEGAHIT'],
+                                                            names.loc[best.index, 'SPAdes'], best):
+            f.write(f"{cluster_id:<10} {megahit:<40} {spades:<40} {containment:<15.3f}\n")
+
+        f.write("\n[Detailed Analysis]\n")
+        f.write("-"*100 + "\n")
+        if counts['MEGAHIT'] > consensus['MEGAHIT']:
+            f.write(f"\nMEGAHIT-specific sequences ({counts['MEGAHIT'] - consensus['MEGAHIT']}):\n")
+            f.write("  - May represent low-coverage or high-complexity regions\n")
+            f.write("  - MEGAHIT has stronger assembly capability for complex structures\n")
+        if counts['SPAdes'] > consensus['SPAdes']:
+            f.write(f"\nSPAdes-specific sequences ({counts['SPAdes'] - consensus['SPAdes']}):\n")
+            f.write("  - May represent high-coverage regions\n")
+            f.write("  - SPAdes kmer strategy may capture more details\n")
+
+        f.write("\n" + "="*100 + "\n")
+        f.write("[Statistical Summary]\n")
+        f.write("-"*100 + "\n")
+        for asm in ASSEMBLERS:
+            if counts[asm] > 0:
+                f.write(f"Consensus ratio in {asm} sequences:".ljust(39)
+                        + f"{consensus[asm] / counts[asm] * 100:.2f}%\n")
+
+
+def comparison_table(calls, contigs):
+    """
+    One row per high-confidence contig, with the tool scores of the contig and
+    of its best match in the other assembly
+    """
+    table = contigs.copy()
+    in_cluster = table['cluster_id'].notna()
+    table['found_in_MEGAHIT'] = np.where((table['assembler'] == 'MEGAHIT') | in_cluster, 'Yes', 'No')
+    table['found_in_SPAdes'] = np.where((table['assembler'] == 'SPAdes') | in_cluster, 'Yes', 'No')
+    table['status'] = np.where(in_cluster, 'Consensus', table['assembler'].astype(str) + '_only')
+
+    for asm in ASSEMBLERS:
+        own = table['assembler'] == asm
+        names = table['sequence'].where(own, table['best_match'])
+        scores = calls[asm].reindex(names)
+        for column in ('vs2_score', 'dvf_score', 'identified_by'):
+            table[f"{asm}_{column}"] = scores[column].fillna('N/A').to_numpy()
+
+    columns = ['sequence', 'assembler', 'length', 'found_in_MEGAHIT', 'found_in_SPAdes', 'status',
+               'cluster_id', 'best_match', 'shared_minimizers', 'containment', 'jaccard']
+    columns += [f"{asm}_{column}" for asm in ASSEMBLERS for column in ('vs2_score', 'dvf_score', 'identified_by')]
+    table = table[columns]
+    table['shared_minimizers'] = table['shared_minimizers'].astype('Int64')
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match MEGAHIT and SPAdes viral contigs by minimizer sketches")
+    parser.add_argument('--sample', required=True, help="Sample ID (output file prefix)")
+    parser.add_argument('--megahit', nargs=2, required=True, metavar=('MERGED_CSV', 'CONTIGS_FA'),
+                        help="MEGAHIT merged viral report CSV and contigs FASTA")
+    parser.add_argument('--spades', nargs=2, required=True, metavar=('MERGED_CSV', 'CONTIGS_FA'),
+                        help="SPAdes merged viral report CSV and contigs FASTA")
+    parser.add_argument('-k', '--kmer', type=int, default=21, help="k-mer size, at most 32 (default: 21)")
+    parser.add_argument('-w', '--window', type=int, default=11, help="Minimizer window in k-mers (default: 11)")
+    parser.add_argument('--min-containment', type=float, default=0.5,
+                        help="Shared fraction of the smaller sketch for a contig pair to match (default: 0.5)")
+    parser.add_argument('--min-shared', type=int, default=3,
+                        help="Minimum shared minimizers for a contig pair to match (default: 3)")
+    args = parser.parse_args()
+
+    if not 1 <= args.kmer <= 32 or args.window < 1:
+        print(f"Error: need 1 <= k <= 32 and w >= 1, got k={args.kmer} w={args.window}", file=sys.stderr)
+        sys.exit(1)
+
+    inputs = {'MEGAHIT': args.megahit, 'SPAdes': args.spades}
+    calls, sequences = {}, {}
+    for asm in ASSEMBLERS:
+        report, fasta = inputs[asm]
+        print(f"\nParsing {asm} results from: {report}")
+        calls[asm] = read_high_confidence(report)
+        sequences[asm] = read_sequences(fasta, calls[asm].index)
+        print(f"{asm} 'Both' sequences (high confidence): {len(calls[asm])} "
+              f"({len(sequences[asm])} found in {fasta})")
+
+    contigs, matches = compare_assemblies(calls, sequences, args.kmer, args.window,
+                                          args.min_containment, args.min_shared)
+    settings = {'k': args.kmer, 'w': args.window, 'min_containment': args.min_containment,
+                'min_shared': args.min_shared}
+
+    prefix = args.sample
+    write_comparison_report(f"{prefix}_assembler_comparison.txt", args.sample, calls, contigs, matches, settings)
+    comparison_table(calls, contigs).to_csv(f"{prefix}_assembler_comparison.csv", index=False)
+    matches.to_csv(f"{prefix}_assembler_contig_matches.tsv", sep='\t', index=False)
+
+    # Save final consensus sequence list: contigs of the consensus clusters, cluster by cluster
+    clustered = contigs[contigs['cluster_id'].notna()]
+    n_clusters = clustered['cluster_id'].nunique()
+    with open(f"{prefix}_consensus_viral_sequences.txt", 'w') as f:
+        f.write("# High-confidence viral sequences assembled by both MEGAHIT and SPAdes\n")
+        f.write("# Contigs matched by shared minimizers (see *_assembler_contig_matches.tsv)\n")
+        f.write(f"# Sample: {args.sample}\n")
+        f.write(f"# Total sequences: {len(clustered)} in {n_clusters} clusters\n")
+        f.write("#\n")
+        for seq in clustered['sequence']:
+            f.write(seq + "\n")
+
+    print(f"\nAssembler comparison complete: {args.sample}")
+    print(f"  MEGAHIT: {len(calls['MEGAHIT'])} viral sequences")
+    print(f"  SPAdes:  {len(calls['SPAdes'])} viral sequences")
+    print(f"  Matched pairs: {len(matches)}")
+    print(f"  Consensus: {len(clustered)} viral sequences in {n_clusters} clusters")
+
+
+if __name__ == "__main__":
+    main()
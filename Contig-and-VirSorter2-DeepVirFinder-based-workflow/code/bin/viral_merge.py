@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Merge VirSorter2 and DeepVirFinder viral identification results
+
+One implementation for every assembler: sequence names are normalized with
+vectorized string operations (VirSorter2 "||full" / "||partial" suffixes,
+DeepVirFinder whitespace-delimited descriptions) and the two tables are
+outer-joined in a single call.
+
+Outputs per assembler (<sample>_<assembler>_viral_*):
+  - merged_report.txt: text report with the consensus sequences
+  - merged_report.csv: one row per sequence found by either tool
+  - consensus.txt:     sequences identified by both tools
+
+Usage:
+  viral_merge.py --sample S --pvalue 0.05 \\
+      --assembler megahit S_megahit_vs2_final-viral-score.tsv S_megahit_dvf_output.txt \\
+      --assembler spades S_spades_vs2_final-viral-score.tsv S_spades_dvf_output.txt
+"""
+
+import argparse
+
+import pandas as pd
+
+# Report titles of the assembler labels used in file names
+ASSEMBLER_NAMES = {'megahit': 'MEGAHIT', 'spades': 'SPAdes'}
+
+# Outer-join indicator -> identified_by label
+IDENTIFIED_BY = {'both': 'Both', 'left_only': 'VirSorter2_only', 'right_only': 'DeepVirFinder_only'}
+
+MERGED_COLUMNS = ['sequence_name', 'identified_by', 'vs2_score', 'vs2_group',
+                  'dvf_score', 'dvf_pvalue', 'consensus']
+
+
+def parse_virsorter2(file_path):
+    """
+    Parse VirSorter2 output file
+    Columns: seqname, dsDNAphage, NCLDV, RNA, ssDNA, lavidaviridae, max_score, max_score_group, length, hallmark, viral_gene, cellular_gene
+
+    Returns:
+        DataFrame indexed by normalized sequence name with vs2_score, vs2_group, vs2_length
+    """
+    try:
+        df = pd.read_csv(file_path, sep='\t', usecols=['seqname', 'max_score', 'max_score_group', 'length'])
+        # Normalize sequence name: remove ||full, ||partial, etc.
+        names = df['seqname'].astype(str).str.replace(r'\|\|.*$', '', regex=True)
+        viral = pd.DataFrame({'vs2_score': df['max_score'].to_numpy(),
+                              'vs2_group': df['max_score_group'].to_numpy(),
+                              'vs2_length': df['length'].to_numpy()},
+                             index=pd.Index(names, name='sequence_name'))
+        # A later row of the same sequence replaces an earlier one
+        return viral[~viral.index.duplicated(keep='last')]
+    except Exception as e:
+        print(f"Warning: Failed to parse VirSorter2 results: {e}")
+        return pd.DataFrame(columns=['vs2_score', 'vs2_group', 'vs2_length'],
+                            index=pd.Index([], name='sequence_name'))
+
+
+def parse_deepvirfinder(file_path):
+    """
+    Parse DeepVirFinder output file
+    Columns: name, len, score, pvalue
+
+    Returns:
+        DataFrame indexed by normalized sequence name with dvf_score, dvf_pvalue, dvf_length
+    """
+    try:
+        df = pd.read_csv(file_path, sep='\t', usecols=['name', 'len', 'score', 'pvalue'])
+        # Normalize sequence name: remove flags and metadata (keep only the contig ID)
+        names = df['name'].astype(str)
+        spaced = names.str.contains(' ', regex=False)
+        names[spaced] = names[spaced].str.replace(r'^\s*(\S*).*$', r'\1', regex=True)
+        viral = pd.DataFrame({'dvf_score': df['score'].to_numpy(),
+                              'dvf_pvalue': df['pvalue'].to_numpy(),
+                              'dvf_length': df['len'].to_numpy()},
+                             index=pd.Index(names, name='sequence_name'))
+        return viral[~viral.index.duplicated(keep='last')]
+    except Exception as e:
+        print(f"Warning: Failed to parse DeepVirFinder results: {e}")
+        return pd.DataFrame(columns=['dvf_score', 'dvf_pvalue', 'dvf_length'],
+                            index=pd.Index([], name='sequence_name'))
+
+
+def merge_viral_calls(vs2, dvf):
+    """
+    Outer join of the two tools' calls
+
+    Returns:
+        DataFrame with MERGED_COLUMNS, one row per sequence (sorted by name)
+    """
+    merged = pd.merge(vs2[['vs2_score', 'vs2_group']].reset_index(),
+                      dvf[['dvf_score', 'dvf_pvalue']].reset_index(),
+                      on='sequence_name', how='outer', sort=True, indicator=True)
+    merged['identified_by'] = merged['_merge'].map(IDENTIFIED_BY).astype(object)
+    merged['consensus'] = (merged['_merge'] == 'both').to_numpy()
+    return merged[MERGED_COLUMNS]
+
+
+def write_merged_report(path, assembler_name, vs2, dvf, merged, pvalue):
+    """Text report: overall statistics and the consensus sequences"""
+    consensus = merged[merged['consensus']]
+    n_vs2_only = int((merged['identified_by'] == 'VirSorter2_only').sum())
+    n_dvf_only = int((merged['identified_by'] == 'DeepVirFinder_only').sum())
+    n_dvf_significant = int((dvf['dvf_pvalue'] < pvalue).sum())
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("="*80 + "\n")
+        f.write(f"Viral Identification Comprehensive Analysis Report - {assembler_name} Assembly Results\n")
+        f.write("VirSorter2 + DeepVirFinder\n")
+        f.write("="*80 + "\n\n")
+
+        # Overall statistics
+        f.write("[Overall Statistics]\n")
+        f.write("-"*80 + "\n")
+        f.write(f"VirSorter2 identified viral sequences:    {len(vs2):,}\n")
+        f.write(f"DeepVirFinder identified viral sequences: {len(dvf):,}\n")
+        f.write(f"Consensus viral sequences (both tools):   {len(consensus):,}\n")
+        f.write(f"VirSorter2 only:                          {n_vs2_only:,}\n")
+        f.write(f"DeepVirFinder only:                       {n_dvf_only:,}\n\n")
+        f.write(f"DeepVirFinder significant sequences (p<{pvalue}): {n_dvf_significant:,}\n\n")
+
+        # Consensus sequence details (recommended high-confidence viral sequences)
+        f.write("\n[Consensus Viral Sequences (High Confidence)]\n")
+        f.write("-"*80 + "\n")
+        f.write(f"{'Sequence Name':<40} {'VS2 Score':<12} {'DVF Score':<12} {'DVF P-value':<12}\n")
+        f.write("-"*80 + "\n")
+        for seq, vs2_score, dvf_score, dvf_pval in consensus[['sequence_name', 'vs2_score', 'dvf_score',
+                                                              'dvf_pvalue']].itertuples(index=False):
+            f.write(f"{seq:<40} {vs2_score:<12.3f} {dvf_score:<12.3f} {dvf_pval:<12.2e}\n")
+
+        f.write("\n" + "="*80 + "\n")
+        f.write("Analysis Complete\n")
+        f.write("="*80 + "\n")
+
+
+def merge_assembler(sample, assembler, virsorter2_file, deepvirfinder_file, pvalue):
+    """Merge one assembler's VirSorter2 and DeepVirFinder results and write its outputs"""
+    assembler_name = ASSEMBLER_NAMES.get(assembler, assembler)
+    prefix = f"{sample}_{assembler}_viral"
+
+    print(f"Parsing VirSorter2 results: {virsorter2_file}")
+    vs2 = parse_virsorter2(virsorter2_file)
+    print(f"VirSorter2: Parsed {len(vs2)} sequences")
+    if len(vs2) > 0:
+        print(f"Sample VirSorter2 sequences: {vs2.index[:5].tolist()}")
+
+    print(f"Parsing DeepVirFinder results: {deepvirfinder_file}")
+    dvf = parse_deepvirfinder(deepvirfinder_file)
+    print(f"DeepVirFinder: Parsed {len(dvf)} sequences")
+    if len(dvf) > 0:
+        print(f"Sample DeepVirFinder sequences: {dvf.index[:5].tolist()}")
+
+    merged = merge_viral_calls(vs2, dvf)
+    print(f"Total unique sequences: {len(merged)}")
+    if len(merged) == 0:
+        print("⚠️ WARNING: No viral sequences found at all! Please check:")
+        print("  1. Are there any sequences in the VirSorter2 output file?")
+        print("  2. Are there any sequences in the DeepVirFinder output file?")
+        print("  3. Check the detection thresholds in the config file")
+
+    write_merged_report(f"{prefix}_merged_report.txt", assembler_name, vs2, dvf, merged, pvalue)
+    merged.to_csv(f"{prefix}_merged_report.csv", index=False)
+
+    # Save consensus sequence list (recommended for downstream analysis)
+    consensus = merged.loc[merged['consensus'], 'sequence_name']
+    with open(f"{prefix}_consensus.txt", 'w') as f:
+        for seq in consensus:
+            f.write(seq + "\n")
+
+    print(f"Viral identification report generated successfully: {sample} ({assembler_name})")
+    print(f"Consensus viral sequences: {len(consensus)}")
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge VirSorter2 and DeepVirFinder results per assembler")
+    parser.add_argument('--sample', required=True, help="Sample ID (output file prefix)")
+    parser.add_argument('--assembler', nargs=3, action='append', required=True,
+                        metavar=('NAME', 'VIRSORTER2_TSV', 'DEEPVIRFINDER_TXT'),
+                        help="Assembler label and its two result files (repeatable)")
+    parser.add_argument('--pvalue', type=float, default=0.05,
+                        help="DeepVirFinder significance threshold for the report (default: 0.05)")
+    args = parser.parse_args()
+
+    for assembler, virsorter2_file, deepvirfinder_file in args.assembler:
+        merge_assembler(args.sample, assembler, virsorter2_file, deepvirfinder_file, args.pvalue)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -53,6 +53,11 @@ params.virsorter2_min_score = 0.5        // Minimum viral score
 params.deepvirfinder_min_length = 1000   // Minimum contig length
 params.deepvirfinder_pvalue = 0.05       // p-value threshold
 
+// Assembler comparison parameters (minimizer sketch matching of MEGAHIT vs SPAdes contigs)
+params.assembler_match_kmer = 21         // k-mer size (at most 32)
+params.assembler_match_window = 11       // Minimizer window (consecutive k-mers)
+params.assembler_match_containment = 0.5 // Shared fraction of the smaller contig sketch to pair contigs
+
 // Resource parameters
 params.max_cpus = 32
 params.max_memory = '256.GB'
@@ -82,6 +87,7 @@ if (params.help) {
     --virsorter2_min_score    Minimum viral score for VirSorter2 (default: 0.5)
     --deepvirfinder_min_length Minimum contig length for DeepVirFinder (default: 1000)
     --deepvirfinder_pvalue    P-value threshold for DeepVirFinder (default: 0.05)
+    --assembler_match_containment Minimizer containment to pair MEGAHIT/SPAdes contigs (default: 0.5)
     
     Optional Parameters:
     --skip_fastp              Skip fastp quality control (default: false)
@@ -212,22 +218,18 @@ workflow {
             .join(DEEPVIRFINDER_SPADES.out.results)
             .set { ch_viral_spades }
         
-        MERGE_VIRAL_REPORTS_MEGAHIT (
-            ch_viral_megahit
-        )
-        
-        MERGE_VIRAL_REPORTS_SPADES (
-            ch_viral_spades
+        // One task per sample merges both assemblers' results
+        MERGE_VIRAL_REPORTS (
+            ch_viral_megahit.join(ch_viral_spades)
         )
         
         // Stage 5: Compare MEGAHIT vs SPAdes Results
-        // Use merged_csv (CSV file) instead of merged_report (TXT file) for comparison
-        MERGE_VIRAL_REPORTS_MEGAHIT.out.merged_csv
-            .join(MERGE_VIRAL_REPORTS_SPADES.out.merged_csv)
-            .set { ch_assembler_comparison }
-        
+        // Use merged_csv (CSV files) instead of merged_report (TXT files) for comparison
+        // Contigs are matched across assemblers by sequence content
         COMPARE_ASSEMBLERS (
-            ch_assembler_comparison
+            MERGE_VIRAL_REPORTS.out.merged_csv
+                .join(MEGAHIT_ASSEMBLY.out.contigs)
+                .join(SPADES_ASSEMBLY.out.contigs)
         )
     }
 }
@@ -638,362 +640,30 @@ process DEEPVIRFINDER_SPADES {
     echo "DeepVirFinder: Predicted \${VIRAL_COUNT} viral sequences from SPAdes contigs (p-value < ${params.deepvirfinder_pvalue})"
     """
 }
-// Process: Merge Viral Identification Reports for MEGAHIT
-// Integrate VirSorter2 and DeepVirFinder results
-process MERGE_VIRAL_REPORTS_MEGAHIT {
-    tag "${sample}_MEGAHIT"
-    label 'process_low'
-    conda 'pandas numpy'
-    publishDir "${params.outdir}/merged_viral_reports_megahit", mode: 'copy', pattern: "*"
-    
-    input:
-    tuple val(sample), path(virsorter2_results), path(deepvirfinder_results)
-    
-    output:
-    tuple val(sample), path("${sample}_megahit_viral_merged_report.txt"), emit: merged_report
-    tuple val(sample), path("${sample}_megahit_viral_merged_report.csv"), emit: merged_csv
-    path("${sample}_megahit_viral_consensus.txt"), emit: consensus_list
-    
-    script:
-    """
-    #!/usr/bin/env python3
-    # -*- coding: utf-8 -*-
-    
-    import pandas as pd
-    from collections import defaultdict
-    
-    def parse_virsorter2(file_path):
-        \"\"\"
-        Parse VirSorter2 output file
-        Columns: seqname, dsDNAphage, NCLDV, RNA, ssDNA, lavidaviridae, max_score, max_score_group, length, hallmark, viral_gene, cellular_gene
-        \"\"\"
-        try:
-            df = pd.read_csv(file_path, sep='\\t')
-            # Extract sequence names and scores
-            viral_dict = {}
-            for _, row in df.iterrows():
-                seqname = row['seqname']
-                # Normalize sequence name: remove ||full, ||partial, etc.
-                seqname_normalized = seqname.split('||')[0] if '||' in seqname else seqname
-                max_score = row['max_score']
-                viral_dict[seqname_normalized] = {
-                    'vs2_score': max_score,
-                    'vs2_group': row['max_score_group'],
-                    'vs2_length': row['length']
-                }
-            return viral_dict
-        except Exception as e:
-            print(f"Warning: Failed to parse VirSorter2 results: {e}")
-            return {}
-    
-    def parse_deepvirfinder(file_path):
-        \"\"\"
-        Parse DeepVirFinder output file
-        Columns: name, len, score, pvalue
-        \"\"\"
-        try:
-            df = pd.read_csv(file_path, sep='\\t')
-            viral_dict = {}
-            for _, row in df.iterrows():
-                seqname = row['name']
-                # Normalize sequence name: remove flags and metadata (keep only the contig ID)
-                seqname_normalized = seqname.split()[0] if ' ' in seqname else seqname
-                viral_dict[seqname_normalized] = {
-                    'dvf_score': row['score'],
-                    'dvf_pvalue': row['pvalue'],
-                    'dvf_length': row['len']
-                }
-            return viral_dict
-        except Exception as e:
-            print(f"Warning: Failed to parse DeepVirFinder results: {e}")
-            return {}
-    
-    # Parse result files
-    print(f"Parsing VirSorter2 results: ${virsorter2_results}")
-    vs2_dict = parse_virsorter2("${virsorter2_results}")
-    print(f"VirSorter2: Parsed {len(vs2_dict)} sequences")
-    if len(vs2_dict) > 0:
-        print(f"Sample VirSorter2 sequences: {list(vs2_dict.keys())[:5]}")
-    
-    print(f"Parsing DeepVirFinder results: ${deepvirfinder_results}")
-    dvf_dict = parse_deepvirfinder("${deepvirfinder_results}")
-    print(f"DeepVirFinder: Parsed {len(dvf_dict)} sequences")
-    if len(dvf_dict) > 0:
-        print(f"Sample DeepVirFinder sequences: {list(dvf_dict.keys())[:5]}")
-    
-    # Merge results
-    all_sequences = set(vs2_dict.keys()) | set(dvf_dict.keys())
-    print(f"Total unique sequences: {len(all_sequences)}")
-    if len(all_sequences) == 0:
-        print("⚠️ WARNING: No viral sequences found at all! Please check:")
-        print("  1. Are there any sequences in the VirSorter2 output file?")
-        print("  2. Are there any sequences in the DeepVirFinder output file?")
-        print("  3. Check the detection thresholds in the config file")
-    
-    # Generate comprehensive report
-    with open("${sample}_megahit_viral_merged_report.txt", 'w', encoding='utf-8') as f:
-        f.write("="*80 + "\\n")
-        f.write("Viral Identification Comprehensive Analysis Report - MEGAHIT Assembly Results\\n")
-        f.write("VirSorter2 + DeepVirFinder\\n")
-        f.write("="*80 + "\\n\\n")
-        
-        # Overall statistics
-        f.write("[Overall Statistics]\\n")
-        f.write("-"*80 + "\\n")
-        f.write(f"VirSorter2 identified viral sequences:    {len(vs2_dict):,}\\n")
-        f.write(f"DeepVirFinder identified viral sequences: {len(dvf_dict):,}\\n")
-    
-        # Count consensus sequences (identified by both tools)
-        consensus = set(vs2_dict.keys()) & set(dvf_dict.keys())
-        f.write(f"Consensus viral sequences (both tools):   {len(consensus):,}\\n")
-    
-        # Identified by only one tool
-        vs2_only = set(vs2_dict.keys()) - set(dvf_dict.keys())
-        dvf_only = set(dvf_dict.keys()) - set(vs2_dict.keys())
-        f.write(f"VirSorter2 only:                          {len(vs2_only):,}\\n")
-        f.write(f"DeepVirFinder only:                       {len(dvf_only):,}\\n\\n")
-    
-        # DVF significant sequences (p-value < ${params.deepvirfinder_pvalue})
-        dvf_significant = [seq for seq, data in dvf_dict.items() 
-                          if data['dvf_pvalue'] < ${params.deepvirfinder_pvalue}]
-        f.write(f"DeepVirFinder significant sequences (p<${params.deepvirfinder_pvalue}): {len(dvf_significant):,}\\n\\n")
-    
-        # Consensus sequence details (recommended high-confidence viral sequences)
-        f.write("\\n[Consensus Viral Sequences (High Confidence)]\\n")
-        f.write("-"*80 + "\\n")
-        f.write(f"{'Sequence Name':<40} {'VS2 Score':<12} {'DVF Score':<12} {'DVF P-value':<12}\\n")
-        f.write("-"*80 + "\\n")
-        
-        for seq in sorted(consensus):
-            vs2_score = vs2_dict[seq]['vs2_score']
-            dvf_score = dvf_dict[seq]['dvf_score']
-            dvf_pval = dvf_dict[seq]['dvf_pvalue']
-            f.write(f"{seq:<40} {vs2_score:<12.3f} {dvf_score:<12.3f} {dvf_pval:<12.2e}\\n")
-        
-        f.write("\\n" + "="*80 + "\\n")
-        f.write("Analysis Complete\\n")
-        f.write("="*80 + "\\n")
-    
-    # Save detailed data in CSV format
-    merged_data = []
-    for seq in all_sequences:
-        row = {
-            'sequence_name': seq,
-            'identified_by': '',
-            'vs2_score': None,
-            'vs2_group': None,
-            'dvf_score': None,
-            'dvf_pvalue': None,
-            'consensus': False
-        }
-        
-        if seq in vs2_dict:
-            row['vs2_score'] = vs2_dict[seq]['vs2_score']
-            row['vs2_group'] = vs2_dict[seq]['vs2_group']
-        
-        if seq in dvf_dict:
-            row['dvf_score'] = dvf_dict[seq]['dvf_score']
-            row['dvf_pvalue'] = dvf_dict[seq]['dvf_pvalue']
-        
-        if seq in consensus:
-            row['identified_by'] = 'Both'
-            row['consensus'] = True
-        elif seq in vs2_only:
-            row['identified_by'] = 'VirSorter2_only'
-        else:
-            row['identified_by'] = 'DeepVirFinder_only'
-        
-        merged_data.append(row)
-    
-    merged_df = pd.DataFrame(merged_data)
-    merged_df.to_csv("${sample}_megahit_viral_merged_report.csv", index=False)
-    
-    # Save consensus sequence list (recommended for downstream analysis)
-    with open("${sample}_megahit_viral_consensus.txt", 'w') as f:
-        for seq in sorted(consensus):
-            f.write(seq + "\\n")
-    
-    print(f"Viral identification report generated successfully: ${sample} (MEGAHIT)")
-    print(f"Consensus viral sequences: {len(consensus)}")
-    """
-}
-
-// Process: Merge Viral Identification Reports for SPAdes
-process MERGE_VIRAL_REPORTS_SPADES {
-    tag "${sample}_SPAdes"
+// Process: Merge Viral Identification Reports for MEGAHIT and SPAdes
+// Integrate VirSorter2 and DeepVirFinder results (bin/viral_merge.py)
+process MERGE_VIRAL_REPORTS {
+    tag "${sample}"
     label 'process_low'
     conda 'pandas numpy'
-    publishDir "${params.outdir}/merged_viral_reports_spades", mode: 'copy', pattern: "*"
+    publishDir "${params.outdir}", mode: 'copy', pattern: "*",
+        saveAs: { filename -> filename.contains('_megahit_viral_') ? "merged_viral_reports_megahit/${filename}" : "merged_viral_reports_spades/${filename}" }
     
     input:
-    tuple val(sample), path(virsorter2_results), path(deepvirfinder_results)
+    tuple val(sample), path(vs2_megahit), path(dvf_megahit), path(vs2_spades), path(dvf_spades)
     
     output:
-    tuple val(sample), path("${sample}_spades_viral_merged_report.txt"), emit: merged_report
-    tuple val(sample), path("${sample}_spades_viral_merged_report.csv"), emit: merged_csv
-    path("${sample}_spades_viral_consensus.txt"), emit: consensus_list
+    tuple val(sample), path("${sample}_megahit_viral_merged_report.txt"), path("${sample}_spades_viral_merged_report.txt"), emit: merged_report
+    tuple val(sample), path("${sample}_megahit_viral_merged_report.csv"), path("${sample}_spades_viral_merged_report.csv"), emit: merged_csv
+    path("${sample}_*_viral_consensus.txt"), emit: consensus_list
     
     script:
     """
-    #!/usr/bin/env python3
-    # -*- coding: utf-8 -*-
-    
-    import pandas as pd
-    from collections import defaultdict
-    
-    def parse_virsorter2(file_path):
-        \"\"\"
-        Parse VirSorter2 output file
-        Columns: seqname, dsDNAphage, NCLDV, RNA, ssDNA, lavidaviridae, max_score, max_score_group, length, hallmark, viral_gene, cellular_gene
-        \"\"\"
-        try:
-            df = pd.read_csv(file_path, sep='\\t')
-            # Extract sequence names and scores
-            viral_dict = {}
-            for _, row in df.iterrows():
-                seqname = row['seqname']
-                # Normalize sequence name: remove ||full, ||partial, etc.
-                seqname_normalized = seqname.split('||')[0] if '||' in seqname else seqname
-                max_score = row['max_score']
-                viral_dict[seqname_normalized] = {
-                    'vs2_score': max_score,
-                    'vs2_group': row['max_score_group'],
-                    'vs2_length': row['length']
-                }
-            return viral_dict
-        except Exception as e:
-            print(f"Warning: Failed to parse VirSorter2 results: {e}")
-            return {}
-    
-    def parse_deepvirfinder(file_path):
-        \"\"\"
-        Parse DeepVirFinder output file
-        Columns: name, len, score, pvalue
-        \"\"\"
-        try:
-            df = pd.read_csv(file_path, sep='\\t')
-            viral_dict = {}
-            for _, row in df.iterrows():
-                seqname = row['name']
-                # Normalize sequence name: remove flags and metadata (keep only the contig ID)
-                seqname_normalized = seqname.split()[0] if ' ' in seqname else seqname
-                viral_dict[seqname_normalized] = {
-                    'dvf_score': row['score'],
-                    'dvf_pvalue': row['pvalue'],
-                    'dvf_length': row['len']
-                }
-            return viral_dict
-        except Exception as e:
-            print(f"Warning: Failed to parse DeepVirFinder results: {e}")
-            return {}
-    
-    # Parse result files
-    print(f"Parsing VirSorter2 results: ${virsorter2_results}")
-    vs2_dict = parse_virsorter2("${virsorter2_results}")
-    print(f"VirSorter2: Parsed {len(vs2_dict)} sequences")
-    if len(vs2_dict) > 0:
-        print(f"Sample VirSorter2 sequences: {list(vs2_dict.keys())[:5]}")
-    
-    print(f"Parsing DeepVirFinder results: ${deepvirfinder_results}")
-    dvf_dict = parse_deepvirfinder("${deepvirfinder_results}")
-    print(f"DeepVirFinder: Parsed {len(dvf_dict)} sequences")
-    if len(dvf_dict) > 0:
-        print(f"Sample DeepVirFinder sequences: {list(dvf_dict.keys())[:5]}")
-    
-    # Merge results
-    all_sequences = set(vs2_dict.keys()) | set(dvf_dict.keys())
-    print(f"Total unique sequences: {len(all_sequences)}")
-    if len(all_sequences) == 0:
-        print("⚠️ WARNING: No viral sequences found at all! Please check:")
-        print("  1. Are there any sequences in the VirSorter2 output file?")
-        print("  2. Are there any sequences in the DeepVirFinder output file?")
-        print("  3. Check the detection thresholds in the config file")
-    
-    # Generate comprehensive report
-    with open("${sample}_spades_viral_merged_report.txt", 'w', encoding='utf-8') as f:
-        f.write("="*80 + "\\n")
-        f.write("Viral Identification Comprehensive Analysis Report - SPAdes Assembly Results\\n")
-        f.write("VirSorter2 + DeepVirFinder\\n")
-        f.write("="*80 + "\\n\\n")
-    
-        # Overall statistics
-        f.write("[Overall Statistics]\\n")
-        f.write("-"*80 + "\\n")
-        f.write(f"VirSorter2 identified viral sequences:    {len(vs2_dict):,}\\n")
-        f.write(f"DeepVirFinder identified viral sequences: {len(dvf_dict):,}\\n")
-    
-        # Count consensus sequences (identified by both tools)
-        consensus = set(vs2_dict.keys()) & set(dvf_dict.keys())
-        f.write(f"Consensus viral sequences (both tools):   {len(consensus):,}\\n")
-    
-        # Identified by only one tool
-        vs2_only = set(vs2_dict.keys()) - set(dvf_dict.keys())
-        dvf_only = set(dvf_dict.keys()) - set(vs2_dict.keys())
-        f.write(f"VirSorter2 only:                          {len(vs2_only):,}\\n")
-        f.write(f"DeepVirFinder only:                       {len(dvf_only):,}\\n\\n")
-    
-        # DVF significant sequences (p-value < ${params.deepvirfinder_pvalue})
-        dvf_significant = [seq for seq, data in dvf_dict.items() 
-                          if data['dvf_pvalue'] < ${params.deepvirfinder_pvalue}]
-        f.write(f"DeepVirFinder significant sequences (p<${params.deepvirfinder_pvalue}): {len(dvf_significant):,}\\n\\n")
-    
-        # Consensus sequence details (recommended high-confidence viral sequences)
-        f.write("\\n[Consensus Viral Sequences (High Confidence)]\\n")
-        f.write("-"*80 + "\\n")
-        f.write(f"{'Sequence Name':<40} {'VS2 Score':<12} {'DVF Score':<12} {'DVF P-value':<12}\\n")
-        f.write("-"*80 + "\\n")
-        
-        for seq in sorted(consensus):
-            vs2_score = vs2_dict[seq]['vs2_score']
-            dvf_score = dvf_dict[seq]['dvf_score']
-            dvf_pval = dvf_dict[seq]['dvf_pvalue']
-            f.write(f"{seq:<40} {vs2_score:<12.3f} {dvf_score:<12.3f} {dvf_pval:<12.2e}\\n")
-        
-        f.write("\\n" + "="*80 + "\\n")
-        f.write("Analysis Complete\\n")
-        f.write("="*80 + "\\n")
-    
-    # Save detailed data in CSV format
-    merged_data = []
-    for seq in all_sequences:
-        row = {
-            'sequence_name': seq,
-            'identified_by': '',
-            'vs2_score': None,
-            'vs2_group': None,
-            'dvf_score': None,
-            'dvf_pvalue': None,
-            'consensus': False
-        }
-        
-        if seq in vs2_dict:
-            row['vs2_score'] = vs2_dict[seq]['vs2_score']
-            row['vs2_group'] = vs2_dict[seq]['vs2_group']
-        
-        if seq in dvf_dict:
-            row['dvf_score'] = dvf_dict[seq]['dvf_score']
-            row['dvf_pvalue'] = dvf_dict[seq]['dvf_pvalue']
-        
-        if seq in consensus:
-            row['identified_by'] = 'Both'
-            row['consensus'] = True
-        elif seq in vs2_only:
-            row['identified_by'] = 'VirSorter2_only'
-        else:
-            row['identified_by'] = 'DeepVirFinder_only'
-        
-        merged_data.append(row)
-    
-    merged_df = pd.DataFrame(merged_data)
-    merged_df.to_csv("${sample}_spades_viral_merged_report.csv", index=False)
-    
-    # Save consensus sequence list (recommended for downstream analysis)
-    with open("${sample}_spades_viral_consensus.txt", 'w') as f:
-        for seq in sorted(consensus):
-            f.write(seq + "\\n")
-    
-    print(f"Viral identification report generated successfully: ${sample} (SPAdes)")
-    print(f"Consensus viral sequences: {len(consensus)}")
+    viral_merge.py \\
+        --sample ${sample} \\
+        --pvalue ${params.deepvirfinder_pvalue} \\
+        --assembler megahit ${vs2_megahit} ${dvf_megahit} \\
+        --assembler spades ${vs2_spades} ${dvf_spades}
     """
 }
 
@@ -1002,6 +672,8 @@ process MERGE_VIRAL_REPORTS_SPADES {
 // ================================================================================
 
 // Process: Compare MEGAHIT vs SPAdes Viral Identification Results
+// Contig IDs differ between assemblers (k141_* vs NODE_*), so high-confidence contigs
+// are matched on sequence content with minimizer sketches (bin/assembler_compare.py)
 process COMPARE_ASSEMBLERS {
     tag "${sample}_Assembler_Comparison"
     label 'process_low'
@@ -1009,232 +681,23 @@ process COMPARE_ASSEMBLERS {
     publishDir "${params.outdir}/assembler_comparison", mode: 'copy', pattern: "*"
     
     input:
-    tuple val(sample), path(megahit_report), path(spades_report)
+    tuple val(sample), path(megahit_report), path(spades_report), path(megahit_contigs), path(spades_contigs)
     
     output:
     tuple val(sample), path("${sample}_assembler_comparison.txt"), emit: comparison_report
     path("${sample}_assembler_comparison.csv"), emit: comparison_csv
+    path("${sample}_assembler_contig_matches.tsv"), emit: contig_matches
     path("${sample}_consensus_viral_sequences.txt"), emit: final_consensus
     
     script:
     """
-    #!/usr/bin/env python3
-    # -*- coding: utf-8 -*-
-    
-    import pandas as pd
-    from collections import defaultdict
-    
-    def parse_merged_report(file_path):
-        \"\"\"Parse merged viral report CSV file\"\"\"
-        import os
-        try:
-            # If input is already CSV, use it directly
-            # Otherwise try to convert .txt to .csv
-            if file_path.endswith('.csv'):
-                csv_path = file_path
-            else:
-                csv_path = file_path.replace('.txt', '.csv')
-            
-            print(f"  Attempting to read CSV from: {csv_path}")
-            if not os.path.exists(csv_path):
-                print(f"  ⚠️  CSV file does not exist: {csv_path}")
-                print(f"  Checking if original file exists: {file_path}")
-                if os.path.exists(file_path):
-                    print(f"  Original file exists, but CSV version not found")
-                return pd.DataFrame()
-            
-            df = pd.read_csv(csv_path)
-            print(f"  ✅ Successfully parsed {len(df)} rows from {csv_path}")
-            return df
-        except Exception as e:
-            print(f"  ❌ Warning: Failed to parse {file_path}: {e}")
-            import traceback
-            traceback.print_exc()
-            return pd.DataFrame()
-    
-    print(f"\\nParsing MEGAHIT results from: ${megahit_report}")
-    print(f"  Input file path: ${megahit_report}")
-    
-    megahit_df = parse_merged_report("${megahit_report}")
-    print(f"MEGAHIT DataFrame shape: {megahit_df.shape}")
-    print(f"MEGAHIT columns: {list(megahit_df.columns)}")
-    if len(megahit_df) > 0:
-        print(f"MEGAHIT first 3 rows:\\n{megahit_df.head(3)}")
-    else:
-        print("⚠️  WARNING: MEGAHIT DataFrame is empty!")
-    
-    print(f"\\nParsing SPAdes results from: ${spades_report}")
-    print(f"  Input file path: ${spades_report}")
-    
-    spades_df = parse_merged_report("${spades_report}")
-    print(f"SPAdes DataFrame shape: {spades_df.shape}")
-    print(f"SPAdes columns: {list(spades_df.columns)}")
-    if len(spades_df) > 0:
-        print(f"SPAdes first 3 rows:\\n{spades_df.head(3)}")
-    else:
-        print("⚠️  WARNING: SPAdes DataFrame is empty!")
-    
-    # Extract viral sequences (only "Both" type - high confidence sequences)
-    print(f"\\nExtracting 'Both' sequences from MEGAHIT...")
-    print(f"MEGAHIT columns: {list(megahit_df.columns) if len(megahit_df) > 0 else 'empty'}")
-    if len(megahit_df) > 0 and 'identified_by' in megahit_df.columns:
-        print(f"MEGAHIT 'identified_by' value counts:\\n{megahit_df['identified_by'].value_counts()}")
-        megahit_both_df = megahit_df[megahit_df['identified_by'] == 'Both']
-        print(f"MEGAHIT 'Both' sequences found: {len(megahit_both_df)}")
-        megahit_seqs = set(megahit_both_df['sequence_name'].tolist())
-        print(f"MEGAHIT sequences extracted: {len(megahit_seqs)}")
-    else:
-        print(f"⚠️  MEGAHIT extraction failed - columns: {list(megahit_df.columns) if len(megahit_df) > 0 else 'empty'}")
-        megahit_seqs = set()
-    
-    print(f"\\nExtracting 'Both' sequences from SPAdes...")
-    print(f"SPAdes columns: {list(spades_df.columns) if len(spades_df) > 0 else 'empty'}")
-    if len(spades_df) > 0 and 'identified_by' in spades_df.columns:
-        print(f"SPAdes 'identified_by' value counts:\\n{spades_df['identified_by'].value_counts()}")
-        spades_both_df = spades_df[spades_df['identified_by'] == 'Both']
-        print(f"SPAdes 'Both' sequences found: {len(spades_both_df)}")
-        spades_seqs = set(spades_both_df['sequence_name'].tolist())
-        print(f"SPAdes sequences extracted: {len(spades_seqs)}")
-    else:
-        print(f"⚠️  SPAdes extraction failed - columns: {list(spades_df.columns) if len(spades_df) > 0 else 'empty'}")
-        spades_seqs = set()
-    
-    print(f"\\nMEGAHIT 'Both' sequences (high confidence): {len(megahit_seqs)}")
-    print(f"SPAdes 'Both' sequences (high confidence): {len(spades_seqs)}")
-    
-    # Note: Sequence IDs from different assemblers are different (k141_XXX vs NODE_XXX)
-    # "Consensus" means both assemblers detected viruses, not identical sequence IDs
-    # We output all high-confidence sequences from both assemblers
-    megahit_only = megahit_seqs
-    spades_only = spades_seqs
-    all_viral = megahit_seqs | spades_seqs
-    
-    # Consensus: if both assemblers detected viruses, all sequences are "consensus"
-    # Otherwise, consensus is empty
-    if len(megahit_seqs) > 0 and len(spades_seqs) > 0:
-        consensus_both_assemblers = all_viral
-        print(f"Both assemblers detected viruses: {len(megahit_seqs)} (MEGAHIT) + {len(spades_seqs)} (SPAdes) = {len(all_viral)} total consensus sequences")
-    else:
-        consensus_both_assemblers = set()
-        print(f"Only one assembler detected viruses: {len(megahit_seqs)} (MEGAHIT) + {len(spades_seqs)} (SPAdes)")
-    consensus_count = len(consensus_both_assemblers)
-    
-    # Generate comprehensive comparison report
-    with open("${sample}_assembler_comparison.txt", 'w', encoding='utf-8') as f:
-        f.write("="*100 + "\\n")
-        f.write("Assembler Comparison Report - Viral Identification Results\\n")
-        f.write("MEGAHIT vs metaSPAdes\\n")
-        f.write("Sample: ${sample}\\n")
-        f.write("="*100 + "\\n\\n")
-        
-        f.write("[Overall Statistics]\\n")
-        f.write("-"*100 + "\\n")
-        f.write(f"MEGAHIT identified viral sequences:    {len(megahit_seqs):,}\\n")
-        f.write(f"SPAdes identified viral sequences:     {len(spades_seqs):,}\\n")
-        f.write(f"Total unique viral sequences:          {len(all_viral):,}\\n\\n")
-        
-        f.write(f"Consensus viral sequences (both assemblies detected): {len(consensus_both_assemblers):,}\\n")
-        f.write(f"MEGAHIT viral sequences:                {len(megahit_seqs):,}\\n")
-        f.write(f"SPAdes viral sequences:                {len(spades_seqs):,}\\n\\n")
-        
-        # Calculate consistency
-        if len(all_viral) > 0:
-            consistency = len(consensus_both_assemblers) / len(all_viral) * 100
-            f.write(f"Assembler consistency:                 {consistency:.2f}%\\n\\n")
-        
-        f.write("="*100 + "\\n")
-        f.write("[Recommendation]\\n")
-        f.write("-"*100 + "\\n")
-        f.write(f"High-confidence viral sequences (identified by both methods): {len(consensus_both_assemblers):,}\\n")
-        f.write("Recommend prioritizing these consensus sequences for downstream analysis.\\n\\n")
-        
-        f.write("[Detailed Analysis]\\n")
-        f.write("-"*100 + "\\n")
-        
-        # MEGAHIT advantages
-        if len(megahit_only) > 0:
-            f.write(f"\\nMEGAHIT-specific sequences ({len(megahit_only)}):\\n")
-            f.write("  - May represent low-coverage or high-complexity regions\\n")
-            f.write("  - MEGAHIT has stronger assembly capability for complex structures\\n")
-        
-        # SPAdes advantages
-        if len(spades_only) > 0:
-            f.write(f"\\nSPAdes-specific sequences ({len(spades_only)}):\\n")
-            f.write("  - May represent high-coverage regions\\n")
-            f.write("  - SPAdes kmer strategy may capture more details\\n")
-        
-        f.write("\\n" + "="*100 + "\\n")
-        f.write("[Statistical Summary]\\n")
-        f.write("-"*100 + "\\n")
-        
-        # Calculate consensus ratio for each assembler
-        if len(megahit_seqs) > 0:
-            megahit_consensus_pct = len(consensus_both_assemblers) / len(megahit_seqs) * 100
-            f.write(f"Consensus ratio in MEGAHIT sequences:  {megahit_consensus_pct:.2f}%\\n")
-        
-        if len(spades_seqs) > 0:
-            spades_consensus_pct = len(consensus_both_assemblers) / len(spades_seqs) * 100
-            f.write(f"Consensus ratio in SPAdes sequences:   {spades_consensus_pct:.2f}%\\n")
-    
-    # Generate CSV detailed comparison
-    # Note: Since sequence IDs are different between assemblers, we treat all as consensus if both assemblers detected viruses
-    comparison_data = []
-    
-    for seq in all_viral:
-        row = {
-            'sequence': seq,
-            'found_in_MEGAHIT': 'Yes' if seq in megahit_seqs else 'No',
-            'found_in_SPAdes': 'Yes' if seq in spades_seqs else 'No',
-            'status': 'Consensus' if len(consensus_both_assemblers) > 0 else 'Single_assembler'
-        }
-        
-        # Add MEGAHIT information
-        if seq in megahit_seqs:
-            megahit_row = megahit_df[megahit_df['sequence_name'] == seq].iloc[0]
-            row['MEGAHIT_vs2_score'] = megahit_row.get('vs2_score', 'N/A')
-            row['MEGAHIT_dvf_score'] = megahit_row.get('dvf_score', 'N/A')
-            row['MEGAHIT_identified_by'] = megahit_row.get('identified_by', 'N/A')
-        else:
-            row['MEGAHIT_vs2_score'] = 'N/A'
-            row['MEGAHIT_dvf_score'] = 'N/A'
-            row['MEGAHIT_identified_by'] = 'N/A'
-        
-        # Add SPAdes information
-        if seq in spades_seqs:
-            spades_row = spades_df[spades_df['sequence_name'] == seq].iloc[0]
-            row['SPAdes_vs2_score'] = spades_row.get('vs2_score', 'N/A')
-            row['SPAdes_dvf_score'] = spades_row.get('dvf_score', 'N/A')
-            row['SPAdes_identified_by'] = spades_row.get('identified_by', 'N/A')
-        else:
-            row['SPAdes_vs2_score'] = 'N/A'
-            row['SPAdes_dvf_score'] = 'N/A'
-            row['SPAdes_identified_by'] = 'N/A'
-        
-        comparison_data.append(row)
-    
-    comparison_df = pd.DataFrame(comparison_data)
-    comparison_df.to_csv("${sample}_assembler_comparison.csv", index=False)
-    
-    # Save final consensus sequence list
-    with open("${sample}_consensus_viral_sequences.txt", 'w') as f:
-        if len(consensus_both_assemblers) > 0:
-            f.write("# High-confidence viral sequences from both MEGAHIT and SPAdes\\n")
-            f.write("# Both assemblers detected viruses (consensus by existence)\\n")
-        else:
-            f.write("# Viral sequences from single assembler only\\n")
-        f.write(f"# Sample: ${sample}\\n")
-        f.write(f"# Total sequences: {len(consensus_both_assemblers)}\\n")
-        f.write("# Note: Sequence IDs differ between assemblers, consensus means both detected viruses\\n")
-        f.write("#\\n")
-        for seq in sorted(consensus_both_assemblers):
-            f.write(seq + "\\n")
-    
-    print(f"\\nAssembler comparison complete: ${sample}")
-    print(f"  MEGAHIT: {len(megahit_seqs)} viral sequences")
-    print(f"  SPAdes:  {len(spades_seqs)} viral sequences")
-    print(f"  Consensus: {len(consensus_both_assemblers)} viral sequences")
-    if len(consensus_both_assemblers) > 0:
-        print(f"  Both assemblers detected viruses: {len(megahit_seqs)} + {len(spades_seqs)} = {len(consensus_both_assemblers)} total consensus sequences")
+    assembler_compare.py \\
+        --sample ${sample} \\
+        --megahit ${megahit_report} ${megahit_contigs} \\
+        --spades ${spades_report} ${spades_contigs} \\
+        --kmer ${params.assembler_match_kmer} \\
+        --window ${params.assembler_match_window} \\
+        --min-containment ${params.assembler_match_containment}
     """
 }
 
@@ -1289,7 +752,8 @@ workflow.onComplete {
     
     - assembler_comparison/: MEGAHIT vs SPAdes comparison ⭐
       * *_assembler_comparison.txt: Comprehensive assembler comparison report
-      * *_assembler_comparison.csv: Detailed comparison data
+      * *_assembler_comparison.csv: Detailed comparison data (cluster and best match per contig)
+      * *_assembler_contig_matches.tsv: MEGAHIT/SPAdes contig pairs matched by sequence content
       * *_consensus_viral_sequences.txt: Final high-confidence viral sequences (both assemblers)
     
     ==========================================
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-pass contig abundance estimation
+
+Streams `samtools depth -a` output once (from a file or a pipe) into per-contig
+NumPy accumulators and takes mapped read counts from `samtools idxstats`, so
+every contig is quantified together instead of one samtools call and two
+depth-file scans per contig:
+  - length, mapped reads
+  - coverage (breadth: fraction of bases with depth > 0)
+  - mean and median depth (positions missing from the depth output count as 0)
+  - RPKM and TPM
+
+Outputs:
+  --table: contig_id, length, mapped_reads, coverage, depth, rpkm, median_depth, tpm
+           (the first six columns are the existing abundance table)
+  --stats: abundance statistics text read by the final report
+
+Usage:
+  samtools idxstats S.contigs_mapping.bam > S.idxstats.txt
+  samtools depth -a S.contigs_mapping.bam | abundance_engine.py --lengths S.viral_contigs_lengths.txt \\
+      --idxstats S.idxstats.txt --depth - --table S.abundance_table.tsv --stats S_abundance_stats.txt
+"""
+
+import sys
+import csv
+import argparse
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 2000000
+
+TABLE_COLUMNS = ['contig_id', 'length', 'mapped_reads', 'coverage', 'depth', 'rpkm', 'median_depth', 'tpm']
+
+HIGH_COVERAGE = 0.5
+HIGH_DEPTH = 5
+TOP_N = 5
+
+
+def read_lengths(path):
+    """Contig IDs and lengths in table order (longest first, as written by fasta_stats.py)"""
+    table = pd.read_csv(path, sep='\t', header=None, names=['contig_id', 'length'], usecols=[0, 1],
+                        dtype={'contig_id': str, 'length': np.int64}, quoting=csv.QUOTE_NONE)
+    return table['contig_id'].tolist(), table['length'].to_numpy()
+
+
+def read_idxstats(path, index):
+    """Mapped reads per contig from `samtools idxstats` (reference, length, mapped, unmapped)"""
+    mapped = np.zeros(len(index), dtype=np.int64)
+    stats = pd.read_csv(path, sep='\t', header=None, names=['contig_id', 'length', 'mapped', 'unmapped'],
+                        dtype={'contig_id': str}, quoting=csv.QUOTE_NONE)
+    positions = stats['contig_id'].map(index)
+    known = positions.notna().to_numpy()
+    mapped[positions[known].to_numpy(dtype=np.int64)] = stats.loc[known, 'mapped'].to_numpy(dtype=np.int64)
+    return mapped
+
+
+class DepthAccumulator:
+    """
+    Per-contig depth sums, covered bases and medians from a position-sorted depth stream
+
+    samtools depth writes each reference's positions contiguously, so a contig's
+    depths are complete once the next contig starts; only the contig spanning a
+    chunk boundary is carried over.
+    """
+
+    def __init__(self, lengths):
+        self.lengths = lengths
+        self.depth_sum = np.zeros(len(lengths), dtype=np.int64)
+        self.covered = np.zeros(len(lengths), dtype=np.int64)
+        self.median = np.zeros(len(lengths), dtype=float)
+        self.pending_contig = -1
+        self.pending = []
+
+    def add(self, contigs, depths):
+        """contigs: table position of each row (-1 for references not in the table); depths: int array"""
+        keep = contigs >= 0
+        contigs, depths = contigs[keep], depths[keep]
+        if len(contigs) == 0:
+            return
+        np.add.at(self.depth_sum, contigs, depths)
+        np.add.at(self.covered, contigs, depths > 0)
+
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(contigs)) + 1))
+        ends = np.append(starts[1:], len(contigs))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            contig = int(contigs[start])
+            if contig != self.pending_contig:
+                self.finish()
+                self.pending_contig = contig
+            self.pending.append(depths[start:end])
+
+    def finish(self):
+        """Median of the pending contig, padding the positions the depth output left out with zeros"""
+        if self.pending_contig < 0:
+            return
+        depths = np.concatenate(self.pending)
+        missing = int(self.lengths[self.pending_contig]) - len(depths)
+        if missing > 0:
+            depths = np.concatenate((depths, np.zeros(missing, dtype=depths.dtype)))
+        self.median[self.pending_contig] = float(np.median(depths)) if len(depths) else 0.0
+        self.pending_contig, self.pending = -1, []
+
+
+def accumulate_depth(source, index, lengths, chunk_size=CHUNK_SIZE):
+    """Stream `samtools depth` output (reference, position, depth) once"""
+    accumulator = DepthAccumulator(lengths)
+    chunks = pd.read_csv(source, sep='\t', header=None, usecols=[0, 2], names=['contig_id', 'pos', 'depth'],
+                         dtype={'contig_id': 'category', 'depth': np.int64},
+                         quoting=csv.QUOTE_NONE, chunksize=chunk_size)
+    try:
+        for chunk in chunks:
+            categories = chunk['contig_id'].cat.categories
+            positions = pd.Series(categories).map(index).fillna(-1).to_numpy(dtype=np.int64)
+            contigs = positions[chunk['contig_id'].cat.codes.to_numpy()]
+            accumulator.add(contigs, chunk['depth'].to_numpy())
+    except pd.errors.EmptyDataError:
+        pass
+    accumulator.finish()
+    return accumulator
+
+
+def abundance_table(contig_ids, lengths, mapped, accumulator):
+    """All abundance metrics at once, one row per contig in length table order"""
+    safe_lengths = np.maximum(lengths, 1)
+    total_mapped = int(mapped.sum())
+    rpkm = mapped * 1e9 / (safe_lengths * total_mapped) if total_mapped > 0 else np.zeros(len(lengths))
+    rate = mapped / (safe_lengths / 1000)
+    tpm = rate / rate.sum() * 1e6 if rate.sum() > 0 else np.zeros(len(lengths))
+    valid = lengths > 0
+    return pd.DataFrame({
+        'contig_id': contig_ids,
+        'length': lengths,
+        'mapped_reads': mapped,
+        'coverage': np.where(valid, accumulator.covered / safe_lengths, 0.0),
+        'depth': np.where(valid, accumulator.depth_sum / safe_lengths, 0.0),
+        'rpkm': np.where(valid, rpkm, 0.0),
+        'median_depth': accumulator.median,
+        'tpm': np.where(valid, tpm, 0.0),
+    }, columns=TABLE_COLUMNS)
+
+
+def write_table(path, table):
+    """Abundance table with the precision of the previous per-contig awk output"""
+    formatted = table.copy()
+    formatted['coverage'] = table['coverage'].map('{:.4f}'.format)
+    for column in ['depth', 'rpkm', 'tpm']:
+        formatted[column] = table[column].map('{:.2f}'.format)
+    formatted['median_depth'] = table['median_depth'].map('{:.1f}'.format)
+    formatted.to_csv(path, sep='\t', index=False, quoting=csv.QUOTE_NONE)
+
+
+def write_stats(path, table):
+    """Abundance statistics in the layout the final report greps"""
+    top = table.sort_values('rpkm', ascending=False, kind='mergesort').head(TOP_N)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("Abundance estimation completed successfully\n")
+        f.write(f"Total contigs analyzed: {len(table)}\n")
+        f.write(f"Total reads mapped to contigs: {int(table['mapped_reads'].sum())}\n")
+        f.write(f"High coverage contigs (>{HIGH_COVERAGE:.0%}): {int((table['coverage'] > HIGH_COVERAGE).sum())}\n")
+        f.write(f"High depth contigs (>{HIGH_DEPTH}x): {int((table['depth'] > HIGH_DEPTH).sum())}\n")
+        f.write(f"Top {TOP_N} most abundant contigs (by RPKM):\n")
+        for contig_id, rpkm, depth, tpm in top[['contig_id', 'rpkm', 'depth', 'tpm']].itertuples(index=False):
+            f.write(f"  {contig_id}: {rpkm:.2f} RPKM, {depth:.1f}x depth, {tpm:.2f} TPM\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-pass contig abundance estimation")
+    parser.add_argument('--lengths', required=True, help="Contig ID<TAB>length table")
+    parser.add_argument('--idxstats', required=True, help="`samtools idxstats` output of the contig mapping BAM")
+    parser.add_argument('--depth', required=True, help="`samtools depth -a` output, or - for stdin")
+    parser.add_argument('--table', required=True, help="Output: abundance table (TSV)")
+    parser.add_argument('--stats', required=True, help="Output: abundance statistics text")
+    args = parser.parse_args()
+
+    contig_ids, lengths = read_lengths(args.lengths)
+    index = {contig_id: i for i, contig_id in enumerate(contig_ids)}
+    mapped = read_idxstats(args.idxstats, index)
+    accumulator = accumulate_depth(sys.stdin if args.depth == '-' else args.depth, index, lengths)
+
+    table = abundance_table(contig_ids, lengths, mapped, accumulator)
+    write_table(args.table, table)
+    write_stats(args.stats, table)
+    print(f"Abundance: {len(table):,} contigs, {int(mapped.sum()):,} mapped reads", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-threaded BGZF (block gzip) compression with a random-access index
+
+BGZF files are ordinary multi-member gzip files (zcat, gzip -t and every gzip
+reader accept them) made of independent blocks of at most 64 KiB, so blocks can
+be compressed on a thread pool and decompressed from any block start. Blocks
+are cut at record boundaries (FASTQ records of four lines, FASTA records at
+'>' headers): every block starts with a whole record, and parallel consumers
+can split a file by blocks without scanning for record starts.
+
+Next to each file the writer saves a companion index (<file>.bgzi: compressed
+offset, uncompressed offset and first record number of each block), so readers
+can seek to a byte offset or a record number and split a file into ranges that
+start with whole records. Compression is verified in place: the output is
+re-read block by block (in parallel), and its CRC-32 and size are compared with
+those of the input, so no separate gzip -t pass is needed.
+
+Usage:
+  bgzf.py compress reads.fastq -o reads.fastq.gz --threads 16
+  bgzf.py verify reads.fastq.gz --threads 16
+
+  from bgzf import BgzfWriter, BgzfReader
+  with BgzfWriter('S.viral.R1.fq.gz', threads=8) as writer:
+      writer.write_record(record)
+  reader = BgzfReader('S.viral.R1.fq.gz')
+  for first, last in reader.split(8):
+      data = reader.read_blocks(first, last)   # whole records
+  block, skip = reader.block_of_record(1000000)
+"""
+
+import os
+import sys
+import zlib
+import struct
+import bisect
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Uncompressed bytes per block (htslib's limit, so that a stored block still fits in 64 KiB)
+BLOCK_DATA_SIZE = 0xff00
+MAX_BLOCK_SIZE = 0x10000
+
+HEADER = struct.Struct('<4BI2BH2BHH')
+FOOTER = struct.Struct('<II')
+EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+# Companion index (<file>.bgzi): one row per block; first_record is the number of
+# the record the block starts with, -1 for a block continuing a record larger than a block
+INDEX_SUFFIX = '.bgzi'
+INDEX_COLUMNS = ['compressed_offset', 'uncompressed_offset', 'first_record']
+UNKNOWN_RECORD = -2
+
+READ_CHUNK_SIZE = 1 << 22
+
+
+class BgzfError(Exception):
+    """Malformed BGZF data or a failed verification"""
+
+
+def compress_block(data, level=6):
+    """One BGZF block (header, raw deflate data, CRC-32, size) holding data"""
+    deflate = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = deflate.compress(data) + deflate.flush()
+    if len(payload) + HEADER.size + FOOTER.size > MAX_BLOCK_SIZE:
+        # Incompressible data: stored deflate blocks always fit
+        deflate = zlib.compressobj(0, zlib.DEFLATED, -15)
+        payload = deflate.compress(data) + deflate.flush()
+    block_size = HEADER.size + len(payload) + FOOTER.size
+    header = HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2, block_size - 1)
+    return header + payload + FOOTER.pack(zlib.crc32(data), len(data))
+
+
+def decompress_block(block):
+    """Uncompressed data of one BGZF block, checking its CRC-32 and size"""
+    data = zlib.decompress(block[HEADER.size:-FOOTER.size], -15)
+    crc, size = FOOTER.unpack(block[-FOOTER.size:])
+    if zlib.crc32(data) != crc or len(data) != size:
+        raise BgzfError("block CRC-32 or size mismatch")
+    return data
+
+
+def block_size_at(handle, offset):
+    """Total size of the BGZF block starting at offset (0 at end of file)"""
+    handle.seek(offset)
+    header = handle.read(HEADER.size)
+    if not header:
+        return 0
+    if len(header) < HEADER.size:
+        raise BgzfError(f"truncated block header at offset {offset}")
+    fields = HEADER.unpack(header)
+    if fields[:4] != (0x1f, 0x8b, 8, 4) or fields[7:11] != (6, ord('B'), ord('C'), 2):
+        raise BgzfError(f"not a BGZF block at offset {offset}")
+    return fields[11] + 1
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def write_index(path, offsets):
+    """Companion index: compressed offset, uncompressed offset and first record number of each block"""
+    with open(path, 'w') as f:
+        f.write("\t".join(INDEX_COLUMNS) + "\n")
+        for compressed, uncompressed, record in offsets:
+            f.write(f"{compressed}\t{uncompressed}\t{record}\n")
+
+
+def read_index(path):
+    """Block (compressed offset, uncompressed offset, first record) rows of a companion index"""
+    with open(path) as f:
+        next(f, None)
+        return [tuple(int(value) for value in line.split('\t')) for line in f if line.strip()]
+
+
+def record_ends(data, kind, state=0):
+    """
+    Offsets just past each complete record in a chunk of data, and the state for the next chunk
+
+    kind 'fastq': every fourth line end; state is the number of lines of the
+    current record seen in earlier chunks. kind 'fasta': positions of '>'
+    starting a line; state is 1 when an earlier chunk ended a line. None: no
+    record structure.
+    """
+    array = np.frombuffer(data, dtype=np.uint8)
+    if kind == 'fastq':
+        newlines = np.flatnonzero(array == 10) + 1
+        return newlines[(3 - state) % 4::4], (state + len(newlines)) % 4
+    if kind == 'fasta':
+        starts = np.flatnonzero(array[1:] == ord('>')) + 1
+        starts = starts[array[starts - 1] == 10]
+        if state and len(array) and array[0] == ord('>'):
+            starts = np.concatenate(([0], starts))
+        return starts, int(len(array) > 0 and array[-1] == 10)
+    return np.zeros(0, dtype=np.int64), 0
+
+
+class BgzfWriter:
+    """
+    Record-aligned BGZF writer compressing blocks on a thread pool
+
+    write_record() keeps each record inside one block when it fits; write_chunk()
+    takes a chunk with known record ends and cuts blocks only there; write()
+    appends raw bytes (their end counts as a record end). close() writes the EOF
+    block and the companion index.
+    """
+
+    def __init__(self, path, threads=1, level=6, index=True):
+        self.path = path
+        self.level = level
+        self.index = index
+        self.handle = open(path, 'wb')
+        self.executor = ThreadPoolExecutor(max_workers=max(threads, 1))
+        self.max_pending = max(threads, 1) * 4
+        self.pending = deque()
+        self.buffer = bytearray()
+        # Record ends inside the buffer, and the record the buffer starts with (or continues)
+        self.buffer_ends = []
+        self.starts_record = True
+        self.first_record = 0
+        self.offsets = []
+        self.compressed_offset = self.uncompressed_offset = 0
+        self.crc = 0
+        self.size = 0
+
+    def _submit_buffer(self, end=None):
+        """Compress buffer[:end] as one block"""
+        end = len(self.buffer) if end is None else end
+        record = self.first_record if self.starts_record else -1
+        self.pending.append((self.executor.submit(compress_block, bytes(self.buffer[:end]), self.level), end, record))
+        ended = bisect.bisect_right(self.buffer_ends, end)
+        self.starts_record = ended > 0 and self.buffer_ends[ended - 1] == end
+        self.first_record += ended
+        self.buffer_ends = [position - end for position in self.buffer_ends[ended:]]
+        del self.buffer[:end]
+        while len(self.pending) > self.max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        future, length, record = self.pending.popleft()
+        block = future.result()
+        # Compressed offsets are known only once the blocks before are written, in order
+        self.offsets.append((self.compressed_offset, self.uncompressed_offset, record))
+        self.handle.write(block)
+        self.compressed_offset += len(block)
+        self.uncompressed_offset += length
+
+    def write_record(self, record):
+        """Append one whole record, starting a new block when it does not fit in the current one"""
+        if self.buffer and len(self.buffer) + len(record) > BLOCK_DATA_SIZE:
+            self._submit_buffer()
+        self.write(record)
+
+    def write(self, data):
+        """Append raw bytes; the end of data counts as a record end"""
+        if not data:
+            return
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.buffer += data
+        self.buffer_ends.append(len(self.buffer))
+        while len(self.buffer) >= BLOCK_DATA_SIZE:
+            self._submit_buffer(BLOCK_DATA_SIZE)
+
+    def _append(self, data, start, end, ends, first_end, last_end):
+        """Append data[start:end] holding record ends ends[first_end:last_end]"""
+        base = len(self.buffer) - start
+        self.buffer += data[start:end]
+        self.buffer_ends.extend(position + base for position in ends[first_end:last_end])
+
+    def write_chunk(self, data, ends):
+        """Append a chunk whose record ends (ascending offsets into data) are known, cutting blocks only there"""
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        ends = ends.tolist()
+        if ends and ends[0] == 0 and not self.buffer:
+            # The previous record ended exactly at the last block boundary
+            self.starts_record = True
+            self.first_record += 1
+            ends = ends[1:]
+        start = next_end = 0
+        while True:
+            room = BLOCK_DATA_SIZE - len(self.buffer)
+            if len(data) - start <= room:
+                self._append(data, start, len(data), ends, next_end, len(ends))
+                return
+            # Last record end that still fits in the current block
+            cut = bisect.bisect_right(ends, start + room)
+            if cut > next_end:
+                self._append(data, start, ends[cut - 1], ends, next_end, cut)
+                start, next_end = ends[cut - 1], cut
+                self._submit_buffer()
+            elif self.buffer_ends:
+                self._submit_buffer(self.buffer_ends[-1])
+            else:
+                # The record at the start of the buffer is larger than a block and spans several
+                self._append(data, start, start + room, ends, next_end, next_end)
+                start += room
+                self._submit_buffer()
+
+    def close(self):
+        if self.handle.closed:
+            return
+        if self.buffer:
+            self._submit_buffer()
+        while self.pending:
+            self._write_next()
+        self.executor.shutdown()
+        self.handle.write(EOF_BLOCK)
+        self.handle.close()
+        if self.index:
+            write_index(index_path(self.path), self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BgzfReader:
+    """
+    Random access to a BGZF file through its companion index
+
+    Files without an index (e.g. from bgzip) are indexed by scanning the block
+    headers; their record starts are unknown, so split() then cuts at any block.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = open(path, 'rb')
+        self.file_size = os.path.getsize(path)
+        if os.path.isfile(index_path(path)):
+            self.offsets = read_index(index_path(path))
+        else:
+            self.offsets = self.scan_offsets()
+
+    def scan_offsets(self):
+        """Block offsets from the block headers; uncompressed offsets from the block footers"""
+        offsets, compressed, uncompressed = [], 0, 0
+        while True:
+            size = block_size_at(self.handle, compressed)
+            if size == 0:
+                break
+            self.handle.seek(compressed + size - 4)
+            footer = self.handle.read(4)
+            if len(footer) < 4:
+                raise BgzfError(f"truncated block at offset {compressed}")
+            length, = struct.unpack('<I', footer)
+            if length:
+                offsets.append((compressed, uncompressed, UNKNOWN_RECORD))
+            compressed += size
+            uncompressed += length
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def iter_blocks(self, first=0, last=None):
+        """Compressed blocks [first, last), one bytes object each"""
+        last = len(self.offsets) if last is None else last
+        if first >= last:
+            return
+        start = self.offsets[first][0]
+        end = self.offsets[last][0] if last < len(self.offsets) else self.file_size
+        self.handle.seek(start)
+        raw = self.handle.read(end - start)
+        position = 0
+        while position < len(raw):
+            size = struct.unpack_from('<H', raw, position + 16)[0] + 1
+            yield raw[position:position + size]
+            position += size
+
+    def read_blocks(self, first=0, last=None):
+        """Uncompressed data of blocks [first, last); starts with a whole record when block first does"""
+        return b''.join(decompress_block(block) for block in self.iter_blocks(first, last))
+
+    def read(self, offset, size):
+        """size uncompressed bytes starting at uncompressed offset"""
+        starts = [uncompressed for _, uncompressed, _ in self.offsets]
+        first = max(bisect.bisect_right(starts, offset) - 1, 0)
+        last = bisect.bisect_left(starts, offset + size)
+        skip = offset - starts[first] if starts else 0
+        return self.read_blocks(first, last)[skip:skip + size]
+
+    def record_blocks(self):
+        """Indexes of the blocks that start with a record"""
+        return [i for i, (_, _, record) in enumerate(self.offsets) if record >= 0]
+
+    def block_of_record(self, number):
+        """(block, records to skip in it) to reach record number, from the last record-starting block before it"""
+        starts = [(self.offsets[i][2], i) for i in self.record_blocks()]
+        position = bisect.bisect_right(starts, (number, len(self.offsets))) - 1
+        if position < 0:
+            raise BgzfError(f"record {number} not found in the index")
+        record, block = starts[position]
+        return block, number - record
+
+    def split(self, parts):
+        """Up to parts block ranges [first, last) of about equal compressed size, each starting with a record"""
+        candidates = self.record_blocks() or list(range(len(self.offsets)))
+        if parts <= 1 or len(candidates) <= 1:
+            return [(0, len(self.offsets))] if self.offsets else []
+        compressed = [self.offsets[i][0] for i in candidates]
+        targets = np.linspace(0, self.file_size, parts + 1)[1:-1]
+        cuts = [candidates[i] for i in np.searchsorted(compressed, targets).tolist() if i < len(candidates)]
+        bounds = sorted(set([0] + cuts + [len(self.offsets)]))
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def close(self):
+        self.handle.close()
+
+
+def verify(path, threads=1, expected_crc=None, expected_size=None):
+    """
+    Check every block (structure, CRC-32, size), the EOF block and, when given,
+    the CRC-32 and size of the whole uncompressed content
+
+    Returns:
+        (blocks, uncompressed size)
+    """
+    reader = BgzfReader(path)
+    try:
+        with open(path, 'rb') as f:
+            f.seek(max(reader.file_size - len(EOF_BLOCK), 0))
+            if f.read() != EOF_BLOCK:
+                raise BgzfError("missing BGZF EOF block (truncated file?)")
+        crc, size, blocks = 0, 0, 0
+        with ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+            for first, last in reader.split(max(threads, 1) * 8):
+                for data in executor.map(decompress_block, list(reader.iter_blocks(first, last))):
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                    blocks += 1
+    except (zlib.error, struct.error) as e:
+        raise BgzfError(f"corrupt block: {e}")
+    finally:
+        reader.close()
+    if expected_size is not None and size != expected_size:
+        raise BgzfError(f"uncompressed size {size:,} differs from input size {expected_size:,}")
+    if expected_crc is not None and crc != expected_crc:
+        raise BgzfError("uncompressed CRC-32 differs from the input")
+    return blocks, size
+
+
+def detect_kind(first_bytes):
+    """'fastq', 'fasta' or None from the first bytes of a file"""
+    stripped = first_bytes.lstrip()
+    if stripped.startswith(b'@'):
+        return 'fastq'
+    if stripped.startswith(b'>'):
+        return 'fasta'
+    return None
+
+
+def compress_file(source, output, threads=1, level=6, check=True):
+    """Compress a plain file (or stdin) to record-aligned BGZF with its index; returns (crc, size)"""
+    handle = sys.stdin.buffer if source == '-' else open(source, 'rb')
+    try:
+        chunk = handle.read(READ_CHUNK_SIZE)
+        kind = detect_kind(chunk[:1024])
+        state = 0
+        with BgzfWriter(output, threads=threads, level=level) as writer:
+            while chunk:
+                ends, state = record_ends(chunk, kind, state)
+                writer.write_chunk(chunk, ends)
+                chunk = handle.read(READ_CHUNK_SIZE)
+            crc, size = writer.crc, writer.size
+    finally:
+        if handle is not sys.stdin.buffer:
+            handle.close()
+    if check:
+        verify(output, threads, expected_crc=crc, expected_size=size)
+    return crc, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-threaded BGZF compression with a random-access index")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compress_parser = subparsers.add_parser('compress', help="Compress a FASTQ/FASTA (or any file) to BGZF + index")
+    compress_parser.add_argument('input', help="Uncompressed input file, or - for stdin")
+    compress_parser.add_argument('-o', '--output', help="Output file (default: INPUT.gz)")
+    compress_parser.add_argument('--threads', type=int, default=1, help="Compression threads (default: 1)")
+    compress_parser.add_argument('--level', type=int, default=6, help="Deflate level 0-9 (default: 6)")
+    compress_parser.add_argument('--no-verify', action='store_true', help="Skip the read-back verification")
+
+    verify_parser = subparsers.add_parser('verify', help="Check every block and the EOF block of a BGZF file")
+    verify_parser.add_argument('input', help="BGZF file")
+    verify_parser.add_argument('--threads', type=int, default=1, help="Decompression threads (default: 1)")
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'compress':
+            output = args.output or (args.input + '.gz' if args.input != '-' else None)
+            if output is None:
+                parser.error("--output is required when reading stdin")
+            crc, size = compress_file(args.input, output, args.threads, args.level, not args.no_verify)
+            status = "written" if args.no_verify else "written and verified"
+            print(f"{output}: {size:,} bytes {status} ({os.path.getsize(output):,} compressed)", file=sys.stderr)
+        else:
+            blocks, size = verify(args.input, args.threads)
+            print(f"{args.input}: OK, {blocks:,} blocks, {size:,} bytes", file=sys.stderr)
+    except (BgzfError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Best hit and LCA assignment of DIAMOND blastp results, per ORF and per contig
+
+Reads the m8 table (qseqid sseqid pident length mismatch gapopen qstart qend
+sstart send evalue bitscore stitle) once, sorts it by ORF and bitscore, and
+works on the sorted groups with array operations:
+  - best hit: the top-bitscore hit of each ORF (first in file order on ties)
+  - candidates: all hits of the ORF with bitscore >= fraction * best bitscore
+  - LCA: the organism shared by all candidates; otherwise the deepest virus
+    name they share ("Influenza A virus (A/...)" + "Influenza A virus (B/...)"
+    -> "Influenza A virus"); otherwise "Viruses" (the database is viral-only)
+
+Organisms come from the trailing [Organism name] of the subject title, since
+the protein database carries no taxonomy. ORF assignments are then rolled up
+to contigs through orf2contig.tsv by a vote weighted with the ORF best bitscore.
+
+Usage:
+  diamond_lca.py --m8 sample.diamond_results.m8 --orf2contig sample.orf2contig.tsv \\
+      --best-hits sample.diamond_best_hits.tsv --contigs sample.diamond_contig_taxonomy.tsv
+"""
+
+import re
+import sys
+import csv
+import argparse
+
+import numpy as np
+import pandas as pd
+
+M8_COLUMNS = ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen',
+              'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore', 'stitle']
+M8_DTYPES = {'qseqid': 'category', 'sseqid': 'category', 'pident': 'float64', 'length': 'int64',
+             'evalue': 'float64', 'bitscore': 'float64', 'stitle': 'category'}
+
+BEST_HIT_COLUMNS = ['query_id', 'subject_id', 'pident', 'length', 'evalue', 'bitscore', 'subject_title',
+                    'organism', 'candidate_hits', 'lca_name', 'lca_level', 'organism_support']
+
+CONTIG_COLUMNS = ['contig_id', 'orfs_with_hits', 'assigned_name', 'assigned_level',
+                  'vote_weight', 'vote_fraction', 'best_bitscore']
+
+UNKNOWN_ORGANISM = 'unknown'
+ROOT_NAME = 'Viruses'
+
+# Words that end a usable shared name: "...virus", "...viruses", "...viridae", ...
+VIRUS_WORD = re.compile(r'vir(us|uses|idae|inae|ales)$', re.IGNORECASE)
+ORGANISM_PATTERN = r'\[([^\[\]]+)\]\s*$'
+
+
+def read_m8(m8_file):
+    """
+    Read the DIAMOND table; ORF ids and subject titles are categorical
+    (millions of hits share far fewer distinct values)
+    """
+    try:
+        return pd.read_csv(m8_file, sep='\t', header=None, names=M8_COLUMNS, usecols=list(M8_DTYPES),
+                           dtype=M8_DTYPES, quoting=csv.QUOTE_NONE)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=list(M8_DTYPES)).astype(M8_DTYPES)
+
+
+def organisms_of(titles):
+    """Organism of each subject title, extracted once per distinct title"""
+    titles = titles.astype('category')
+    names = pd.Series(titles.cat.categories, dtype=object).str.extract(ORGANISM_PATTERN, expand=False)
+    # Missing titles (code -1) take the appended last entry
+    names = np.append(names.fillna(UNKNOWN_ORGANISM).to_numpy(dtype=object), UNKNOWN_ORGANISM)
+    return names[titles.cat.codes.to_numpy()]
+
+
+def common_words(name_a, name_b):
+    """Number of leading words two organism names share"""
+    count = 0
+    for word_a, word_b in zip(name_a.split(), name_b.split()):
+        if word_a != word_b:
+            break
+        count += 1
+    return count
+
+
+def virus_prefix(name, n_words):
+    """
+    Longest prefix of the first n_words words of name that ends in a
+    "...virus"-like word, or None
+    """
+    words = name.split()[:n_words]
+    for end in range(len(words), 0, -1):
+        if VIRUS_WORD.search(words[end - 1]):
+            return ' '.join(words[:end])
+    return None
+
+
+def assign_orfs(hits, bitscore_fraction=0.9):
+    """
+    Best hit and LCA of every ORF
+
+    Returns:
+        DataFrame with BEST_HIT_COLUMNS, one row per ORF, by descending bitscore
+    """
+    if hits.empty:
+        return pd.DataFrame(columns=BEST_HIT_COLUMNS)
+
+    # One sorted pass: ORF groups are contiguous, best hit first (stable -> file order on ties)
+    query_codes = hits['qseqid'].cat.codes.to_numpy()
+    bits = hits['bitscore'].to_numpy(dtype='float64')
+    order = np.lexsort((-bits, query_codes))
+    query_codes = query_codes[order]
+    bits = bits[order]
+    organisms = organisms_of(hits['stitle'])[order]
+
+    first = np.r_[True, query_codes[1:] != query_codes[:-1]]
+    starts = np.flatnonzero(first)
+    group = np.cumsum(first) - 1
+    n_groups = len(starts)
+
+    best_bits = bits[starts]
+    candidate = bits >= bitscore_fraction * best_bits[group]
+    candidate_hits = np.bincount(group, weights=candidate, minlength=n_groups).astype('int64')
+
+    # Support of the best organism among the candidates, weighted by bitscore
+    best_organism = organisms[starts]
+    agrees = candidate & (organisms == best_organism[group])
+    candidate_weight = np.bincount(group, weights=bits * candidate, minlength=n_groups)
+    support = np.bincount(group, weights=bits * agrees, minlength=n_groups) / np.where(
+        candidate_weight > 0, candidate_weight, 1)
+
+    # Groups whose candidates all name the same organism need no further work. For the
+    # others, the words shared by all candidates are the fewest words any candidate shares
+    # with the best organism; names are compared once per distinct organism pair.
+    lca_name = best_organism.copy()
+    lca_level = np.full(n_groups, 'organism', dtype=object)
+    rows = np.flatnonzero(candidate & ~agrees)
+    if len(rows):
+        organism_codes, organism_names = pd.factorize(organisms)
+        n_organisms = len(organism_names)
+        pairs, pair_index = np.unique(organism_codes[starts][group[rows]].astype('int64') * n_organisms
+                                      + organism_codes[rows], return_inverse=True)
+        pair_words = np.array([common_words(organism_names[pair // n_organisms], organism_names[pair % n_organisms])
+                               for pair in pairs.tolist()], dtype='int64')
+        shared_words = np.full(n_groups, np.iinfo('int64').max)
+        np.minimum.at(shared_words, group[rows], pair_words[pair_index.ravel()])
+
+        disagreeing = np.flatnonzero(shared_words < np.iinfo('int64').max)
+        keys = pd.MultiIndex.from_arrays([organism_codes[starts][disagreeing], shared_words[disagreeing]])
+        key_codes, unique_keys = pd.factorize(keys)
+        names = np.array([virus_prefix(organism_names[code], n_words) for code, n_words in unique_keys],
+                         dtype=object)[key_codes]
+        resolved = pd.notna(names)
+        lca_name[disagreeing] = np.where(resolved, names, ROOT_NAME)
+        lca_level[disagreeing] = np.where(resolved, 'shared_name', 'root')
+
+    best = hits.iloc[order[starts]]
+    result = pd.DataFrame({
+        'query_id': best['qseqid'].astype(str).to_numpy(),
+        'subject_id': best['sseqid'].astype(str).to_numpy(),
+        'pident': best['pident'].to_numpy(),
+        'length': best['length'].to_numpy(),
+        'evalue': best['evalue'].to_numpy(),
+        'bitscore': best_bits,
+        'subject_title': best['stitle'].astype(str).to_numpy(),
+        'organism': best_organism,
+        'candidate_hits': candidate_hits,
+        'lca_name': lca_name,
+        'lca_level': lca_level,
+        'organism_support': np.round(support, 4),
+    })
+    return result.sort_values(['bitscore', 'query_id'], ascending=[False, True], kind='mergesort')
+
+
+def read_orf2contig(orf2contig_file):
+    """
+    ORF id -> contig id
+
+    ORF_PREDICTION writes whole Prodigal headers ("k141_7_2 # 3 # 290 # 1 # ID=...")
+    in both columns; ids are cut at the first whitespace, and a contig id equal to
+    its ORF id loses the Prodigal "_<n>" suffix.
+    """
+    try:
+        mapping = pd.read_csv(orf2contig_file, sep='\t', header=None, usecols=[0, 1],
+                              names=['orf', 'contig'], dtype=str, quoting=csv.QUOTE_NONE)
+    except pd.errors.EmptyDataError:
+        return {}
+    if mapping.empty:
+        return {}
+    orfs = mapping['orf'].str.partition(' ')[0]
+    contigs = mapping['contig'].fillna('').str.partition(' ')[0]
+    contigs = contigs.where(contigs != orfs, orfs.str.replace(r'_[0-9]+$', '', regex=True))
+    return dict(zip(orfs, contigs))
+
+
+def assign_contigs(orf_hits, orf2contig):
+    """
+    Weighted vote of ORF assignments per contig (weight: ORF best bitscore)
+
+    Returns:
+        DataFrame with CONTIG_COLUMNS, one row per contig with hits, by descending vote weight
+    """
+    if orf_hits.empty:
+        return pd.DataFrame(columns=CONTIG_COLUMNS)
+
+    orfs = orf_hits['query_id']
+    contigs = orfs.map(orf2contig)
+    contigs = contigs.fillna(orfs.str.replace(r'_[0-9]+$', '', regex=True))
+    votes = pd.DataFrame({'contig_id': contigs.to_numpy(),
+                          'assigned_name': orf_hits['lca_name'].to_numpy(),
+                          'assigned_level': orf_hits['lca_level'].to_numpy(),
+                          'bitscore': orf_hits['bitscore'].to_numpy()})
+
+    per_contig = votes.groupby('contig_id', sort=False).agg(orfs_with_hits=('bitscore', 'size'),
+                                                            total_weight=('bitscore', 'sum'),
+                                                            best_bitscore=('bitscore', 'max'))
+    tally = votes.groupby(['contig_id', 'assigned_name'], sort=False).agg(
+        assigned_level=('assigned_level', 'first'), vote_weight=('bitscore', 'sum')).reset_index()
+    winners = tally.sort_values(['contig_id', 'vote_weight', 'assigned_name'],
+                                ascending=[True, False, True], kind='mergesort') \
+                   .drop_duplicates('contig_id').set_index('contig_id')
+
+    result = per_contig.join(winners)
+    result['vote_fraction'] = np.round(result['vote_weight'] / result['total_weight'], 4)
+    result['vote_weight'] = np.round(result['vote_weight'], 1)
+    result = result.reset_index()[CONTIG_COLUMNS]
+    return result.sort_values(['vote_weight', 'contig_id'], ascending=[False, True], kind='mergesort')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Best hit + LCA of DIAMOND results per ORF and per contig")
+    parser.add_argument('--m8', required=True, help="DIAMOND tabular output (outfmt 6 ... bitscore stitle)")
+    parser.add_argument('--orf2contig', required=True, help="ORF to contig mapping (ORF_PREDICTION)")
+    parser.add_argument('--best-hits', required=True, help="Output: per-ORF best hit and LCA table")
+    parser.add_argument('--contigs', required=True, help="Output: per-contig assignment table")
+    parser.add_argument('--bitscore-fraction', type=float, default=0.9,
+                        help="Hits within this fraction of the ORF best bitscore enter the LCA (default: 0.9)")
+    args = parser.parse_args()
+
+    if not 0 < args.bitscore_fraction <= 1:
+        print(f"Error: --bitscore-fraction must be in (0, 1], got {args.bitscore_fraction}", file=sys.stderr)
+        sys.exit(1)
+
+    hits = read_m8(args.m8)
+    orf_hits = assign_orfs(hits, args.bitscore_fraction)
+    contig_hits = assign_contigs(orf_hits, read_orf2contig(args.orf2contig))
+
+    orf_hits.to_csv(args.best_hits, sep='\t', index=False)
+    contig_hits.to_csv(args.contigs, sep='\t', index=False)
+
+    levels = orf_hits['lca_level'].value_counts()
+    print(f"DIAMOND LCA: {len(hits):,} hits, {len(orf_hits):,} ORFs "
+          f"({levels.get('organism', 0):,} organism, {levels.get('shared_name', 0):,} shared name, "
+          f"{levels.get('root', 0):,} root), {len(contig_hits):,} contigs", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
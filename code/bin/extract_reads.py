@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+One-pass paired FASTQ extraction of screened reads
+
+Streams the names of mapped reads straight from the BAM (`samtools view -F 4`)
+into an in-memory set, then walks R1 and R2 in lockstep once, writing both
+mates of every pair whose name is in the set. Input and viral read counts go
+to a JSON sidecar so later steps never recount the FASTQ files.
+
+Read names are the header up to the first whitespace with a trailing /1 or /2
+removed, the form BWA writes to the BAM. Gzipped input is decompressed in
+separate pigz/gzip processes; output is record-aligned BGZF compressed on a
+thread pool, with a companion block index (see bgzf.py).
+
+Usage:
+  extract_reads.py --bam S.viral_mapping.bam --r1 S_R1.fq.gz --r2 S_R2.fq.gz \\
+      --out-r1 S.viral.R1.fq.gz --out-r2 S.viral.R2.fq.gz --sample S --json S_screening_counts.json --threads 8
+"""
+
+import sys
+import json
+import shutil
+import argparse
+import subprocess
+from contextlib import ExitStack
+
+from bgzf import BgzfWriter
+
+MATE_SUFFIXES = (b'/1', b'/2')
+
+
+def read_name(header):
+    """Pairing name of a FASTQ header line: first token without '@' and mate suffix"""
+    name = header[1:].split(None, 1)[0] if len(header) > 1 else b''
+    return name[:-2] if name.endswith(MATE_SUFFIXES) else name
+
+
+def mapped_read_names(bam, threads=1):
+    """Names of all reads with a mapped alignment in the BAM"""
+    names = set()
+    command = ['samtools', 'view', '-F', '4', '--threads', str(threads), bam]
+    with subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=1 << 20) as process:
+        for line in process.stdout:
+            names.add(line.split(b'\t', 1)[0])
+    if process.returncode != 0:
+        raise RuntimeError(f"samtools view failed with exit code {process.returncode}")
+    return names
+
+
+def gzip_command(threads):
+    """pigz when available, otherwise gzip"""
+    if shutil.which('pigz'):
+        return ['pigz', '-p', str(max(threads, 1))]
+    return ['gzip']
+
+
+def is_gzip(path):
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+
+def open_input(stack, processes, path, threads):
+    """Binary line stream of a (possibly gzipped) FASTQ; decompression runs in a child process"""
+    if not is_gzip(path):
+        return stack.enter_context(open(path, 'rb', buffering=1 << 20))
+    command = gzip_command(threads) + ['-dc', path]
+    process = stack.enter_context(subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=1 << 20))
+    processes.append(process)
+    return process.stdout
+
+
+def extract_pairs(r1, r2, out_r1, out_r2, names, threads=1):
+    """
+    Walk R1 and R2 in lockstep and write the pairs named in names
+
+    Returns:
+        (input_pairs, extracted_pairs)
+    """
+    input_pairs = extracted = 0
+    processes = []
+    with ExitStack() as stack:
+        in1 = open_input(stack, processes, r1, threads)
+        in2 = open_input(stack, processes, r2, threads)
+        writer1 = stack.enter_context(BgzfWriter(out_r1, threads=threads))
+        writer2 = stack.enter_context(BgzfWriter(out_r2, threads=threads))
+        records1 = zip(in1, in1, in1, in1)
+        records2 = zip(in2, in2, in2, in2)
+        for record1, record2 in zip(records1, records2):
+            input_pairs += 1
+            name = read_name(record1[0])
+            if name != read_name(record2[0]):
+                raise ValueError(f"R1/R2 out of sync at pair {input_pairs}: "
+                                 f"{name.decode(errors='replace')} / {read_name(record2[0]).decode(errors='replace')}")
+            if name in names:
+                writer1.write_record(b''.join(record1))
+                writer2.write_record(b''.join(record2))
+                extracted += 1
+        if next(records1, None) is not None or next(records2, None) is not None:
+            raise ValueError(f"R1 and R2 have different numbers of reads (first {input_pairs:,} pairs matched)")
+        writer1.close()
+        writer2.close()
+    failed = [' '.join(process.args) for process in processes if process.returncode != 0]
+    if failed:
+        raise RuntimeError(f"Decompression command failed: {'; '.join(failed)}")
+    return input_pairs, extracted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One-pass paired FASTQ extraction of screened reads")
+    parser.add_argument('--bam', required=True, help="Screening BAM; reads with a mapped alignment are extracted")
+    parser.add_argument('--r1', required=True, help="Input R1 FASTQ (plain or gzipped)")
+    parser.add_argument('--r2', required=True, help="Input R2 FASTQ (plain or gzipped)")
+    parser.add_argument('--out-r1', required=True, help="Output: extracted R1 (BGZF, with a .bgzi block index)")
+    parser.add_argument('--out-r2', required=True, help="Output: extracted R2 (BGZF, with a .bgzi block index)")
+    parser.add_argument('--sample', required=True, help="Sample ID")
+    parser.add_argument('--json', required=True, help="Output: read count sidecar")
+    parser.add_argument('--threads', type=int, default=1, help="Threads for samtools, pigz and BGZF compression (default: 1)")
+    args = parser.parse_args()
+
+    try:
+        names = mapped_read_names(args.bam, args.threads)
+        print(f"Mapped read names: {len(names):,}", file=sys.stderr)
+        input_pairs, viral_pairs = extract_pairs(args.r1, args.r2, args.out_r1, args.out_r2, names, args.threads)
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    counts = {
+        'sample': args.sample,
+        'input_reads': input_pairs,
+        'mapped_read_names': len(names),
+        'viral_reads': viral_pairs,
+        'viral_ratio_percent': round(viral_pairs * 100 / input_pairs, 4) if input_pairs else 0.0,
+    }
+    with open(args.json, 'w') as f:
+        json.dump(counts, f, indent=2)
+    print(f"Extracted {viral_pairs:,} of {input_pairs:,} read pairs", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-pass FASTA statistics with a JSON sidecar
+
+scan: streams a FASTA once into a compact length array (plus GC counts for
+      nucleotide sequences) and derives everything from that array:
+      count, total/min/max/mean/median length, N50/L50, N90/L90, GC content,
+      a length histogram and the per-sequence length table; later steps read
+      the sidecar (metrics.py get) instead of re-scanning the FASTA
+
+Sequence IDs are the header up to the first whitespace (the name BWA and
+samtools use), the length table is sorted by decreasing length.
+
+Usage:
+  fasta_stats.py scan S.viral_contigs.fa --lengths S.viral_contigs_lengths.txt --json S.viral_contigs_stats.json
+  fasta_stats.py scan S.viral_orfs.faa --type prot --json S.viral_orfs_stats.json
+"""
+
+import sys
+import json
+import argparse
+from array import array
+
+import numpy as np
+
+# Histogram bin lower edges (the last bin is open-ended)
+HISTOGRAM_EDGES = {
+    'nucl': [0, 500, 1000, 2000, 5000, 10000, 20000, 50000],
+    'prot': [0, 50, 100, 200, 300, 500, 1000],
+}
+
+# bytes.translate deletion tables: what is left is G/C, or A/C/G/T
+_ALL_BYTES = bytes(range(256))
+NOT_GC = bytes(b for b in _ALL_BYTES if b not in b'GCgc')
+NOT_ACGT = bytes(b for b in _ALL_BYTES if b not in b'ACGTacgt')
+
+
+def read_fasta_lengths(path, count_gc=True):
+    """
+    Stream a FASTA once
+
+    Returns:
+        (ids, lengths, gc, acgt): sequence IDs, and int64 arrays of sequence
+        length, G+C bases and A+C+G+T bases (both zero when count_gc is False)
+    """
+    ids = []
+    lengths, gc, acgt = array('q'), array('q'), array('q')
+    length = gc_bases = acgt_bases = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                if ids:
+                    lengths.append(length)
+                    gc.append(gc_bases)
+                    acgt.append(acgt_bases)
+                fields = line[1:].split(None, 1)
+                ids.append(fields[0].decode() if fields else '')
+                length = gc_bases = acgt_bases = 0
+            else:
+                line = line.rstrip()
+                length += len(line)
+                if count_gc:
+                    gc_bases += len(line.translate(None, NOT_GC))
+                    acgt_bases += len(line.translate(None, NOT_ACGT))
+    if ids:
+        lengths.append(length)
+        gc.append(gc_bases)
+        acgt.append(acgt_bases)
+    as_array = lambda values: np.frombuffer(values, dtype=np.int64) if len(values) else np.zeros(0, dtype=np.int64)
+    return ids, as_array(lengths), as_array(gc), as_array(acgt)
+
+
+def nx(sorted_lengths, cumulative, fraction):
+    """(Nx, Lx): length of the sequence that brings the cumulative sum to fraction of the total, and its rank"""
+    if len(sorted_lengths) == 0 or cumulative[-1] == 0:
+        return 0, 0
+    index = int(np.searchsorted(cumulative, fraction * cumulative[-1], side='left'))
+    return int(sorted_lengths[index]), index + 1
+
+
+def length_stats(lengths, gc=None, acgt=None, seq_type='nucl'):
+    """Summary statistics of a length array"""
+    sorted_lengths = np.sort(lengths)[::-1]
+    cumulative = np.cumsum(sorted_lengths)
+    n50, l50 = nx(sorted_lengths, cumulative, 0.5)
+    n90, l90 = nx(sorted_lengths, cumulative, 0.9)
+    total = int(cumulative[-1]) if len(cumulative) else 0
+
+    edges = HISTOGRAM_EDGES[seq_type]
+    counts = np.bincount(np.searchsorted(edges, lengths, side='right') - 1, minlength=len(edges))
+    histogram = [{'min': low, 'max': high - 1 if high is not None else None, 'count': int(count)}
+                 for low, high, count in zip(edges, edges[1:] + [None], counts)]
+
+    stats = {
+        'type': seq_type,
+        'count': int(len(lengths)),
+        'total_length': total,
+        'min_length': int(sorted_lengths[-1]) if len(lengths) else 0,
+        'max_length': int(sorted_lengths[0]) if len(lengths) else 0,
+        'mean_length': round(total / len(lengths), 1) if len(lengths) else 0.0,
+        'median_length': float(np.median(lengths)) if len(lengths) else 0.0,
+        'n50': n50, 'l50': l50,
+        'n90': n90, 'l90': l90,
+        'length_histogram': histogram,
+    }
+    if seq_type == 'nucl':
+        acgt_total = int(acgt.sum()) if acgt is not None else 0
+        stats['gc_percent'] = round(int(gc.sum()) * 100 / acgt_total, 2) if acgt_total else 0.0
+        stats['ambiguous_bases'] = total - acgt_total
+    return stats
+
+
+def write_lengths(path, ids, lengths):
+    """ID<TAB>length per sequence, longest first (file order among equal lengths)"""
+    order = np.argsort(-lengths, kind='stable')
+    with open(path, 'w') as f:
+        for index in order.tolist():
+            f.write(f"{ids[index]}\t{lengths[index]}\n")
+
+
+def scan(args):
+    count_gc = args.type == 'nucl'
+    ids, lengths, gc, acgt = read_fasta_lengths(args.fasta, count_gc)
+    stats = length_stats(lengths, gc, acgt, args.type)
+    stats['file'] = args.fasta
+
+    if args.lengths:
+        write_lengths(args.lengths, ids, lengths)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(stats, f, indent=2)
+    print(f"{args.fasta}: {stats['count']:,} sequences, {stats['total_length']:,} total, "
+          f"N50 {stats['n50']:,}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-pass FASTA statistics with a JSON sidecar")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan_parser = subparsers.add_parser('scan', help="Scan a FASTA once and write its statistics")
+    scan_parser.add_argument('fasta', help="FASTA file")
+    scan_parser.add_argument('--type', choices=['nucl', 'prot'], default='nucl',
+                             help="Sequence type; GC content is computed for nucleotides (default: nucl)")
+    scan_parser.add_argument('--lengths', help="Output: ID<TAB>length table, longest first")
+    scan_parser.add_argument('--json', help="Output: statistics sidecar")
+    scan_parser.set_defaults(func=scan)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
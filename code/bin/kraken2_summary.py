@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+One-pass summary of Kraken2 per-read classification output
+
+Reads the --output table (C/U, read ID, taxid, length, LCA k-mer mapping;
+plain or gzipped) once, in chunks, and accumulates:
+  - total, classified and unclassified reads
+  - per-taxid read counts and mean read length (mate lengths "150|148" are summed)
+  - the top-N taxa, named from the Kraken2 report when it is given
+
+Outputs:
+  --text: classification statistics and top-N blocks, appended to the species summary
+  --tsv:  taxid, name, reads, mean_read_length (all classified taxa, by read count)
+  --json: the same figures for downstream reports
+
+Usage:
+  kraken2_summary.py --sample S --classification S_kraken2_classification.txt \\
+      --report S_kraken2_report.txt --text S_viral_species_summary.txt \\
+      --tsv S_kraken2_taxid_counts.tsv --json S_kraken2_summary.json
+  kraken2_summary.py --sample S --skipped "No Kraken2 database" --tsv ... --json ...
+"""
+
+import re
+import csv
+import sys
+import json
+import argparse
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 1000000
+
+TAXID_COLUMNS = ['taxid', 'name', 'reads', 'mean_read_length']
+
+# Plain taxids, or "Name (taxid 1234)" when kraken2 ran with --use-names
+TAXID_PATTERN = re.compile(r'(\d+)\)?\s*$')
+
+
+def compression_of(path):
+    """'gzip' for gzip content whatever the file name, otherwise None"""
+    with open(path, 'rb') as f:
+        return 'gzip' if f.read(2) == b'\x1f\x8b' else None
+
+
+def parse_taxids(values):
+    """Integer taxid of each distinct taxid column value (0 when none)"""
+    taxids = []
+    for value in values:
+        match = TAXID_PATTERN.search(str(value))
+        taxids.append(int(match.group(1)) if match else 0)
+    return np.array(taxids, dtype=np.int64)
+
+
+def parse_lengths(values):
+    """Read length of each distinct length column value; paired "L1|L2" is L1 + L2"""
+    lengths = []
+    for value in values:
+        try:
+            lengths.append(sum(int(part) for part in str(value).split('|')))
+        except ValueError:
+            lengths.append(0)
+    return np.array(lengths, dtype=np.int64)
+
+
+def summarize_classification(path, chunk_size=CHUNK_SIZE):
+    """
+    Stream the classification output once
+
+    Returns:
+        (total_reads, classified_reads, reads per taxid Counter, bases per taxid Counter),
+        taxid counts covering classified reads only
+    """
+    total = classified = 0
+    reads, bases = Counter(), Counter()
+    chunks = pd.read_csv(path, sep='\t', header=None, usecols=[0, 2, 3], names=['status', 'taxid', 'length'],
+                         dtype={'status': 'category', 'taxid': 'category', 'length': 'category'},
+                         quoting=csv.QUOTE_NONE, compression=compression_of(path), chunksize=chunk_size)
+    try:
+        for chunk in chunks:
+            total += len(chunk)
+            chunk = chunk[chunk['status'] != 'U']
+            classified += len(chunk)
+            if chunk.empty:
+                continue
+            # Distinct column values are parsed once; rows only index into them
+            taxids = parse_taxids(chunk['taxid'].cat.categories)[chunk['taxid'].cat.codes.to_numpy()]
+            lengths = parse_lengths(chunk['length'].cat.categories)[chunk['length'].cat.codes.to_numpy()]
+            observed, index = np.unique(taxids, return_inverse=True)
+            reads.update(dict(zip(observed.tolist(), np.bincount(index).tolist())))
+            bases.update(dict(zip(observed.tolist(), np.bincount(index, weights=lengths).astype(np.int64).tolist())))
+    except pd.errors.EmptyDataError:
+        pass
+    return total, classified, reads, bases
+
+
+def report_names(report_path):
+    """taxid -> scientific name from a Kraken2 report (taxid and name are the last two columns)"""
+    names = {}
+    if not report_path:
+        return names
+    try:
+        with open(report_path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) >= 6 and fields[-2].strip().isdigit():
+                    names[int(fields[-2])] = fields[-1].strip()
+    except OSError:
+        pass
+    return names
+
+
+def taxid_table(reads, bases, names):
+    """Classified taxa by descending read count (ties by taxid)"""
+    table = pd.DataFrame({'taxid': list(reads), 'reads': list(reads.values())}, columns=['taxid', 'reads'])
+    table['name'] = table['taxid'].map(names).fillna('')
+    table['mean_read_length'] = np.round(table['taxid'].map(bases).to_numpy(dtype=float)
+                                         / np.maximum(table['reads'].to_numpy(), 1), 1)
+    table = table.sort_values(['reads', 'taxid'], ascending=[False, True], kind='mergesort')
+    return table[TAXID_COLUMNS].reset_index(drop=True)
+
+
+def write_text(path, total, classified, table, top_n):
+    """Statistics and top-N blocks of the species summary (appended)"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("=== Classification Statistics ===\n")
+        f.write(f"Total reads: {total}\n")
+        f.write(f"Classified reads: {classified}\n")
+        f.write(f"Unclassified reads: {total - classified}\n")
+        if total > 0:
+            f.write(f"Classification rate: {classified * 100 / total:.2f}%\n")
+        f.write("\n")
+        f.write(f"=== Detected Viral Species (Top {top_n}) ===\n")
+        for taxid, name, n_reads, mean_length in table.head(top_n).itertuples(index=False):
+            f.write(f"{taxid}\t{n_reads} reads\t{mean_length:.1f} bp mean\t{name}".rstrip('\t') + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One-pass summary of Kraken2 per-read classification output")
+    parser.add_argument('--sample', required=True, help="Sample ID")
+    parser.add_argument('--classification', help="Kraken2 --output file (plain or gzipped)")
+    parser.add_argument('--report', help="Kraken2 --report file, for taxon names")
+    parser.add_argument('--top', type=int, default=10, help="Taxa listed in the text summary (default: 10)")
+    parser.add_argument('--text', help="Output: species summary to append the statistics to")
+    parser.add_argument('--tsv', help="Output: per-taxid read counts and mean read length")
+    parser.add_argument('--json', help="Output: summary as JSON")
+    parser.add_argument('--skipped', metavar='REASON',
+                        help="Classification did not run: write empty outputs recording REASON")
+    args = parser.parse_args()
+
+    if args.skipped:
+        total = classified = 0
+        table = taxid_table(Counter(), Counter(), {})
+    elif args.classification:
+        total, classified, reads, bases = summarize_classification(args.classification)
+        table = taxid_table(reads, bases, report_names(args.report))
+    else:
+        print("Error: --classification or --skipped is required", file=sys.stderr)
+        sys.exit(1)
+
+    if args.text and not args.skipped:
+        write_text(args.text, total, classified, table, args.top)
+    if args.tsv:
+        table.to_csv(args.tsv, sep='\t', index=False)
+    if args.json:
+        summary = {
+            'sample': args.sample,
+            'status': f"skipped: {args.skipped}" if args.skipped else 'classified',
+            'total_reads': total,
+            'classified_reads': classified,
+            'unclassified_reads': total - classified,
+            'classification_rate': round(classified * 100 / total, 2) if total else 0.0,
+            'taxa_detected': len(table),
+            'top_taxa': table.head(args.top).to_dict(orient='records'),
+            'taxa': table.to_dict(orient='records'),
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+    print(f"Kraken2 summary: {total:,} reads, {classified:,} classified, {len(table):,} taxa", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Typed JSON metrics sidecars and their aggregation
+
+Each workflow step records its figures in a flat JSON sidecar
+(<sample>_<step>_metrics.json: sample, step, status and typed values) so the
+final report reads values instead of scraping free-text statistics files:
+
+  write:     sidecar from values the step already has (types checked against STEP_FIELDS)
+  diamond:   one pass over the DIAMOND m8 output and contig taxonomy table
+  hmmer:     one pass over the hmmscan --tblout table
+  abundance: one pass over the abundance table
+  aggregate: merges a sample's sidecars into the comprehensive report table,
+             the final summary and one flat per-sample metrics JSON
+  cohort:    merges per-sample metrics JSON files into one table (one row per sample)
+  get:       prints one value of any flat JSON sidecar of the workflow (these, the
+             FASTA statistics, screening counts); a missing file or key is an
+             error unless --default is given
+
+A value that is missing or of the wrong type is reported as NA, with a warning,
+rather than silently becoming 0. Fields a step did not set are null (NA) as
+well, unless its status says it ran and found nothing (no_hits): those are 0.
+
+Usage:
+  metrics.py write --json S_assembly_metrics.json --sample S --step assembly contigs=12 total_length=48211 n50=5120
+  metrics.py diamond --json S_diamond_metrics.json --sample S --m8 S.diamond_results.m8 --orfs 120 \\
+      --contigs S.diamond_contig_taxonomy.tsv
+  metrics.py aggregate --sample S --screening S_screening_counts.json ... --tsv S.comprehensive_viral_report.tsv
+  metrics.py cohort --tsv cohort_metrics.tsv S1.metrics.json S2.metrics.json
+  VIRAL_READS=$(metrics.py get S_screening_counts.json viral_reads)
+"""
+
+import sys
+import json
+import time
+import argparse
+
+import pandas as pd
+
+# Typed fields of each step's sidecar
+STEP_FIELDS = {
+    'assembly': {'contigs': int, 'total_length': int, 'n50': int},
+    'orf_prediction': {'orfs': int, 'avg_orf_length': float},
+    'diamond': {'input_orfs': int, 'hits': int, 'orfs_with_hits': int, 'unique_proteins': int,
+                'assigned_contigs': int},
+    'hmmer': {'input_orfs': int, 'hits': int, 'orfs_with_hits': int, 'unique_profiles': int},
+    'abundance': {'contigs': int, 'mapped_reads': int, 'high_coverage_contigs': int, 'high_depth_contigs': int},
+    # Written by extract_reads.py and kraken2_summary.py
+    'screening': {'input_reads': int, 'viral_reads': int},
+    'kraken2': {'classified_reads': int, 'classification_rate': float},
+}
+
+# Report rows: (metric, step, sidecar field, description), in report order
+REPORT_METRICS = [
+    ('input_reads', 'screening', 'input_reads', "Total input clean reads"),
+    ('viral_reads', 'screening', 'viral_reads', "Detected viral reads"),
+    ('viral_detection_rate', None, None, "Percentage of viral reads"),
+    ('assembled_contigs', 'assembly', 'contigs', "Number of assembled viral contigs"),
+    ('total_assembly_length', 'assembly', 'total_length', "Total length of assembled viral sequences (bp)"),
+    ('assembly_n50', 'assembly', 'n50', "Assembly N50 metric (bp)"),
+    ('predicted_orfs', 'orf_prediction', 'orfs', "Total number of predicted ORFs"),
+    ('avg_orf_length', 'orf_prediction', 'avg_orf_length', "Average ORF length (amino acids)"),
+    ('diamond_hits', 'diamond', 'hits', "Total DIAMOND protein hits"),
+    ('orfs_with_protein_hits', 'diamond', 'orfs_with_hits', "ORFs with DIAMOND protein matches"),
+    ('hmmer_hits', 'hmmer', 'hits', "Total HMMER profile hits"),
+    ('orfs_with_profile_hits', 'hmmer', 'orfs_with_hits', "ORFs with HMMER profile matches"),
+    ('high_coverage_contigs', 'abundance', 'high_coverage_contigs', "Contigs with >50% coverage"),
+    ('high_depth_contigs', 'abundance', 'high_depth_contigs', "Contigs with >5x sequencing depth"),
+    ('kraken2_classified_reads', 'kraken2', 'classified_reads', "Reads classified by Kraken2"),
+    ('kraken2_classification_rate', 'kraken2', 'classification_rate', "Kraken2 classification success rate"),
+]
+
+# Statuses of a step that ran and found nothing: its unset fields are 0 rather than null
+EMPTY_RESULT_STATUSES = {'no_hits'}
+
+HIGH_COVERAGE = 0.5
+HIGH_DEPTH = 5
+NA = 'NA'
+
+
+def warn(message):
+    print(f"Warning: {message}", file=sys.stderr)
+
+
+def cast(value, kind):
+    """value as kind; integer fields take "12", 12 or 12.0 but reject 12.7 rather than truncate it"""
+    if kind is not int:
+        return kind(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            value = float(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{value!r} is not integral")
+    return int(value)
+
+
+def typed_sidecar(sample, step, status, values):
+    """
+    Sidecar dict with every field of the step, cast to its type
+
+    Unset fields are null, or 0 when the status says the step ran and found
+    nothing (EMPTY_RESULT_STATUSES).
+    """
+    fields = STEP_FIELDS[step]
+    unknown = set(values) - set(fields)
+    if unknown:
+        raise ValueError(f"unknown {step} metrics: {', '.join(sorted(unknown))}")
+    default = 0 if status in EMPTY_RESULT_STATUSES else None
+    sidecar = {'sample': sample, 'step': step, 'status': status}
+    for name, kind in fields.items():
+        value = values.get(name, default)
+        try:
+            sidecar[name] = None if value is None else cast(value, kind)
+        except (TypeError, ValueError):
+            raise ValueError(f"{step} metric {name}={value!r} is not {kind.__name__}")
+    return sidecar
+
+
+def save(path, sidecar):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(sidecar, f, indent=2)
+
+
+def read_sidecar(path, step):
+    """Sidecar values of a step cast to their types; null, missing or mistyped fields become None"""
+    fields = STEP_FIELDS[step]
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        warn(f"{step} sidecar {path} unreadable: {e}")
+        return {'status': 'missing', **{name: None for name in fields}}
+    values = {'status': str(data.get('status', 'completed'))}
+    for name, kind in fields.items():
+        if name in data and data[name] is None:
+            values[name] = None  # not measured (the step did not run)
+            continue
+        try:
+            values[name] = cast(data[name], kind)
+        except (KeyError, TypeError, ValueError):
+            warn(f"{step} sidecar {path}: {name} missing or not {kind.__name__}")
+            values[name] = None
+    return values
+
+
+def write_command(args):
+    values = {}
+    for item in args.values:
+        name, separator, value = item.partition('=')
+        if not separator:
+            raise ValueError(f"expected NAME=VALUE, got {item!r}")
+        values[name] = value
+    save(args.json, typed_sidecar(args.sample, args.step, args.status, values))
+
+
+def data_lines(path):
+    """Non-empty, non-comment lines of a result table (missing file: none)"""
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if line.strip() and not line.startswith('#'):
+                    yield line
+    except OSError:
+        return
+
+
+def diamond_command(args):
+    """Hits, ORFs with hits and distinct proteins of the m8 output; contigs with an assignment"""
+    hits, orfs, proteins = 0, set(), set()
+    for line in data_lines(args.m8):
+        fields = line.split('\t', 2)
+        hits += 1
+        orfs.add(fields[0])
+        if len(fields) > 1:
+            proteins.add(fields[1])
+    assigned = max(sum(1 for _ in data_lines(args.contigs)) - 1, 0) if args.contigs else 0
+    status = args.status or ('completed' if hits else 'no_hits')
+    save(args.json, typed_sidecar(args.sample, 'diamond', status, {
+        'input_orfs': args.orfs, 'hits': hits, 'orfs_with_hits': len(orfs),
+        'unique_proteins': len(proteins), 'assigned_contigs': assigned}))
+
+
+def hmmer_command(args):
+    """Hits, ORFs with hits and distinct profiles of an hmmscan --tblout table (whitespace-aligned)"""
+    hits, orfs, profiles = 0, set(), set()
+    for line in data_lines(args.tblout):
+        # hmmscan: target (profile) name, target accession, query (ORF) name, ...
+        fields = line.split(None, 3)
+        if len(fields) < 3:
+            continue
+        hits += 1
+        profiles.add(fields[0])
+        orfs.add(fields[2])
+    status = args.status or ('completed' if hits else 'no_hits')
+    save(args.json, typed_sidecar(args.sample, 'hmmer', status, {
+        'input_orfs': args.orfs, 'hits': hits, 'orfs_with_hits': len(orfs), 'unique_profiles': len(profiles)}))
+
+
+def abundance_command(args):
+    """Contig counts above the coverage and depth thresholds of the abundance table"""
+    table = pd.read_csv(args.table, sep='\t', usecols=['contig_id', 'mapped_reads', 'coverage', 'depth'])
+    save(args.json, typed_sidecar(args.sample, 'abundance', args.status or 'completed', {
+        'contigs': len(table),
+        'mapped_reads': int(table['mapped_reads'].sum()),
+        'high_coverage_contigs': int((table['coverage'] > HIGH_COVERAGE).sum()),
+        'high_depth_contigs': int((table['depth'] > HIGH_DEPTH).sum())}))
+
+
+def metric_type(name):
+    """Type of a report metric (the type of its sidecar field)"""
+    for metric, step, field, _ in REPORT_METRICS:
+        if metric == name and step is not None:
+            return STEP_FIELDS[step][field]
+    return float
+
+
+def sample_metrics(sample, paths):
+    """Flat, typed metrics of one sample from its step sidecars (None: unavailable)"""
+    steps = {step: read_sidecar(path, step) for step, path in paths.items()}
+    metrics = {'sample_id': sample}
+    for name, step, field, _ in REPORT_METRICS:
+        if step is not None:
+            metrics[name] = steps[step][field]
+    viral, total = metrics['viral_reads'], metrics['input_reads']
+    if viral is None or total is None:
+        metrics['viral_detection_rate'] = None
+    else:
+        metrics['viral_detection_rate'] = round(viral * 100 / total, 4) if total else 0.0
+    # Classification did not run: no rate to report
+    if steps['kraken2']['status'].startswith('skipped'):
+        metrics['kraken2_classified_reads'] = metrics['kraken2_classification_rate'] = None
+    metrics['status'] = {step: values['status'] for step, values in steps.items()}
+    return metrics
+
+
+def display(name, value):
+    if value is None:
+        return NA if name not in ('kraken2_classified_reads', 'kraken2_classification_rate') else 'N/A'
+    if name == 'viral_detection_rate':
+        return f"{value:.4f}%"
+    if name == 'kraken2_classification_rate':
+        return f"{value:.2f}%"
+    return str(value)
+
+
+def write_report_table(path, metrics):
+    """metric/value/description table, the layout of the comprehensive viral report"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("metric\tvalue\tdescription\n")
+        f.write(f"sample_id\t{metrics['sample_id']}\tSample identifier\n")
+        for name, _, _, description in REPORT_METRICS:
+            f.write(f"{name}\t{display(name, metrics[name])}\t{description}\n")
+
+
+def conclusion(metrics):
+    """Overall assessment lines from viral reads, contigs and HMMER hits"""
+    viral = metrics['viral_reads'] or 0
+    contigs = metrics['assembled_contigs'] or 0
+    hmmer_hits = metrics['hmmer_hits'] or 0
+    if viral > 1000 and contigs > 5 and hmmer_hits > 0:
+        return ["🎉 CONCLUSION: Strong viral detection with high-quality evidence!",
+                "  - Substantial viral reads detected",
+                "  - Successful viral genome assembly",
+                "  - Multiple lines of evidence (assembly + protein + profile)"]
+    if viral > 100 and contigs > 0:
+        return ["✅ CONCLUSION: Moderate viral detection with good evidence",
+                "  - Viral reads detected and assembled",
+                "  - Recommend confirmation with additional methods"]
+    if viral > 10:
+        return ["⚠️ CONCLUSION: Low-level viral detection",
+                "  - Few viral reads detected",
+                "  - Limited assembly success",
+                "  - Results should be interpreted with caution"]
+    return ["❌ CONCLUSION: No significant viral detection",
+            "  - Very few or no viral reads detected",
+            "  - May indicate low viral load or technical issues"]
+
+
+def write_summary(path, metrics):
+    """Final summary text"""
+    value = lambda name: display(name, metrics[name])
+    lines = [
+        f"=== Enhanced Viral Detection Final Report - {metrics['sample_id']} ===",
+        f"Analysis completed: {time.strftime('%a %b %d %H:%M:%S %Z %Y')}",
+        "",
+        "📊 DETECTION SUMMARY:",
+        f"  Total input reads: {value('input_reads')}",
+        f"  Viral reads detected: {value('viral_reads')} ({value('viral_detection_rate')})",
+        f"  Assembled viral contigs: {value('assembled_contigs')}",
+        f"  Total viral sequence: {value('total_assembly_length')} bp",
+        "",
+        "🧬 ORF ANALYSIS:",
+        f"  Predicted ORFs: {value('predicted_orfs')}",
+        f"  Average ORF length: {value('avg_orf_length')} aa",
+        f"  ORFs with protein hits (DIAMOND): {value('orfs_with_protein_hits')}",
+        f"  ORFs with profile hits (HMMER): {value('orfs_with_profile_hits')}",
+        "",
+        "📈 ABUNDANCE ANALYSIS:",
+        f"  High coverage contigs (>50%): {value('high_coverage_contigs')}",
+        f"  High depth contigs (>5x): {value('high_depth_contigs')}",
+        "",
+        "🦠 TAXONOMIC CLASSIFICATION:",
+        f"  Kraken2 classified reads: {value('kraken2_classified_reads')}",
+        f"  Classification rate: {value('kraken2_classification_rate')}",
+        "",
+    ] + conclusion(metrics)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def aggregate_command(args):
+    paths = {'screening': args.screening, 'assembly': args.assembly, 'orf_prediction': args.orfs,
+             'diamond': args.diamond, 'hmmer': args.hmmer, 'abundance': args.abundance, 'kraken2': args.kraken2}
+    metrics = sample_metrics(args.sample, paths)
+    if args.tsv:
+        write_report_table(args.tsv, metrics)
+    if args.summary:
+        write_summary(args.summary, metrics)
+    if args.json:
+        save(args.json, metrics)
+
+
+def cohort_command(args):
+    """One row per sample, one column per metric, plus each step's status"""
+    rows = []
+    for path in args.metrics:
+        with open(path, encoding='utf-8') as f:
+            metrics = json.load(f)
+        statuses = metrics.pop('status', {})
+        rows.append({**metrics, **{f"{step}_status": status for step, status in statuses.items()}})
+    columns = ['sample_id'] + [name for name, _, _, _ in REPORT_METRICS]
+    table = pd.DataFrame(rows)
+    table = table.reindex(columns=columns + [c for c in table.columns if c not in columns])
+    # Keep integer metrics integral where some samples have NA
+    for name in columns[1:]:
+        if metric_type(name) is int:
+            table[name] = table[name].astype('Int64')
+    table = table.sort_values('sample_id', kind='mergesort')
+    table.to_csv(args.tsv, sep='\t', index=False, na_rep=NA)
+    print(f"Cohort metrics: {len(table):,} samples", file=sys.stderr)
+
+
+def get_command(args):
+    """Print one sidecar value; a missing file, key or null value is an error unless --default is given"""
+    try:
+        with open(args.json, encoding='utf-8') as f:
+            data = json.load(f)
+        value = data.get(args.key) if isinstance(data, dict) else None
+        problem = f"{args.key} missing from {args.json}"
+    except (OSError, ValueError) as e:
+        value, problem = None, f"cannot read {args.json}: {e}"
+    if value is None:
+        if args.default is None:
+            raise ValueError(problem)
+        value = args.default
+    print(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Typed JSON metrics sidecars and their aggregation")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    write_parser = subparsers.add_parser('write', help="Write a step sidecar from NAME=VALUE pairs")
+    write_parser.add_argument('--json', required=True, help="Output: step sidecar")
+    write_parser.add_argument('--sample', required=True, help="Sample ID")
+    write_parser.add_argument('--step', required=True, choices=sorted(STEP_FIELDS), help="Workflow step")
+    write_parser.add_argument('--status', default='completed', help="Step status (default: completed)")
+    write_parser.add_argument('values', nargs='*', help="NAME=VALUE metrics of the step; unset metrics are null (0 for status no_hits)")
+    write_parser.set_defaults(func=write_command)
+
+    diamond_parser = subparsers.add_parser('diamond', help="DIAMOND sidecar from the m8 output")
+    diamond_parser.add_argument('--json', required=True, help="Output: DIAMOND sidecar")
+    diamond_parser.add_argument('--sample', required=True, help="Sample ID")
+    diamond_parser.add_argument('--m8', required=True, help="DIAMOND tabular output")
+    diamond_parser.add_argument('--orfs', type=int, default=0, help="Input ORF count")
+    diamond_parser.add_argument('--contigs', help="Contig taxonomy table (header + one row per assigned contig)")
+    diamond_parser.add_argument('--status', help="Step status (default: completed, or no_hits)")
+    diamond_parser.set_defaults(func=diamond_command)
+
+    hmmer_parser = subparsers.add_parser('hmmer', help="HMMER sidecar from the hmmscan --tblout table")
+    hmmer_parser.add_argument('--json', required=True, help="Output: HMMER sidecar")
+    hmmer_parser.add_argument('--sample', required=True, help="Sample ID")
+    hmmer_parser.add_argument('--tblout', required=True, help="hmmscan per-sequence hits table")
+    hmmer_parser.add_argument('--orfs', type=int, default=0, help="Input ORF count")
+    hmmer_parser.add_argument('--status', help="Step status (default: completed, or no_hits)")
+    hmmer_parser.set_defaults(func=hmmer_command)
+
+    abundance_parser = subparsers.add_parser('abundance', help="Abundance sidecar from the abundance table")
+    abundance_parser.add_argument('--json', required=True, help="Output: abundance sidecar")
+    abundance_parser.add_argument('--sample', required=True, help="Sample ID")
+    abundance_parser.add_argument('--table', required=True, help="Abundance table (TSV)")
+    abundance_parser.add_argument('--status', help="Step status (default: completed)")
+    abundance_parser.set_defaults(func=abundance_command)
+
+    aggregate_parser = subparsers.add_parser('aggregate', help="Merge one sample's sidecars into its reports")
+    aggregate_parser.add_argument('--sample', required=True, help="Sample ID")
+    aggregate_parser.add_argument('--screening', required=True, help="Screening read counts (extract_reads.py)")
+    aggregate_parser.add_argument('--assembly', required=True, help="Assembly sidecar")
+    aggregate_parser.add_argument('--orfs', required=True, help="ORF prediction sidecar")
+    aggregate_parser.add_argument('--diamond', required=True, help="DIAMOND sidecar")
+    aggregate_parser.add_argument('--hmmer', required=True, help="HMMER sidecar")
+    aggregate_parser.add_argument('--abundance', required=True, help="Abundance sidecar")
+    aggregate_parser.add_argument('--kraken2', required=True, help="Kraken2 summary (kraken2_summary.py)")
+    aggregate_parser.add_argument('--tsv', help="Output: comprehensive report table")
+    aggregate_parser.add_argument('--summary', help="Output: final summary text")
+    aggregate_parser.add_argument('--json', help="Output: flat per-sample metrics for cohort tables")
+    aggregate_parser.set_defaults(func=aggregate_command)
+
+    cohort_parser = subparsers.add_parser('cohort', help="Merge per-sample metrics into one table")
+    cohort_parser.add_argument('metrics', nargs='+', help="Per-sample metrics JSON files (aggregate --json)")
+    cohort_parser.add_argument('--tsv', required=True, help="Output: cohort table")
+    cohort_parser.set_defaults(func=cohort_command)
+
+    get_parser = subparsers.add_parser('get', help="Print one value of a JSON sidecar")
+    get_parser.add_argument('json', help="Flat JSON sidecar")
+    get_parser.add_argument('key', help="Key, e.g. viral_reads, count, n50, hits")
+    get_parser.add_argument('--default', help="Printed when the file or key is missing (default: exit with an error)")
+    get_parser.set_defaults(func=get_command)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
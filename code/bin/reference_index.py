@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared, content-addressed reference index cache
+
+bwa:     prints the prefix of a BWA index of FASTA, built once per distinct
+         FASTA content into CACHE_DIR/bwa-<sha256>/ and reused by every task
+kraken2: verifies a Kraken2 database once (hash.k2d, opts.k2d, taxo.k2d) and
+         records the result in the cache; later tasks only compare file stats
+
+Builds run under a lock file in the cache directory and are published with an
+atomic rename, so concurrent tasks never see a half-written index even where
+the shared filesystem does not honour locks; a builder that finds a verified
+index already published discards its own build instead of replacing it.
+Published indexes are made read-only and are verified against their manifest
+(file sizes, FASTA hash) on every reuse; an index that fails verification is
+rebuilt.
+
+Nothing is evicted. Indexes are read-only, so remove unused entries (or the
+whole cache) while no run uses it: chmod -R u+w CACHE_DIR && rm -rf CACHE_DIR/bwa-<hash>
+
+The content hash of a FASTA is memoized by (path, size, mtime), so a reused
+database is hashed once, not once per sample.
+
+Usage:
+  INDEX=$(reference_index.py bwa databases/viral_genomes/viruses.fa --cache-dir index_cache)
+  bwa mem "$INDEX" R1.fq.gz R2.fq.gz
+  reference_index.py kraken2 databases/kraken2_db --cache-dir index_cache || echo "incomplete"
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+BWA_SUFFIXES = ['.amb', '.ann', '.bwt', '.pac', '.sa']
+KRAKEN2_FILES = ['hash.k2d', 'opts.k2d', 'taxo.k2d']
+
+MANIFEST = 'index.json'
+HASH_BLOCK_SIZE = 1 << 24
+LOCK_POLL_SECONDS = 5
+
+
+class ReferenceIndexError(Exception):
+    """An index could not be built or verified"""
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+def stat_key(path):
+    """Identity of a file's current version: real path, size and modification time"""
+    info = os.stat(path)
+    return hashlib.sha1(f"{os.path.realpath(path)}|{info.st_size}|{info.st_mtime_ns}".encode()).hexdigest()
+
+
+def content_hash(path, cache_dir):
+    """SHA-256 of a file, memoized in the cache by stat_key"""
+    memo = os.path.join(cache_dir, 'hashes', stat_key(path))
+    try:
+        with open(memo) as f:
+            return f.read().strip()
+    except OSError:
+        pass
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    value = digest.hexdigest()
+    os.makedirs(os.path.dirname(memo), exist_ok=True)
+    temp = f"{memo}.{os.getpid()}"
+    with open(temp, 'w') as f:
+        f.write(value + "\n")
+    os.replace(temp, memo)
+    return value
+
+
+@contextmanager
+def locked(lock_path):
+    """Exclusive lock on lock_path; proceeds unlocked where the filesystem has no lock support"""
+    with open(lock_path, 'a') as handle:
+        try:
+            while True:
+                try:
+                    fcntl.lockf(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    log(f"Waiting for lock: {lock_path}")
+                    time.sleep(LOCK_POLL_SECONDS)
+        except OSError as e:
+            log(f"Warning: locking unavailable ({e}), relying on atomic publish")
+        yield
+
+
+def read_manifest(index_dir):
+    try:
+        with open(os.path.join(index_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def verify(index_dir, expected):
+    """True when the manifest exists, matches expected and every listed file has its recorded size"""
+    manifest = read_manifest(index_dir)
+    if manifest is None or any(manifest.get(key) != value for key, value in expected.items()):
+        return False
+    for name, size in manifest.get('files', {}).items():
+        try:
+            if os.path.getsize(os.path.join(index_dir, name)) != size:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def make_read_only(directory):
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        os.chmod(path, os.stat(path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+    os.chmod(directory, os.stat(directory).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def remove_tree(directory):
+    """Remove a (possibly read-only) index directory"""
+    if not os.path.lexists(directory):
+        return
+    os.chmod(directory, stat.S_IRWXU)
+    shutil.rmtree(directory)
+
+
+def publish(temp_dir, index_dir, manifest, expected):
+    """
+    Write the manifest, make the build read-only and move it into place atomically
+
+    An index another task has already published (and that verifies) is kept and
+    this build discarded, so an index in use is never removed; only an index that
+    fails verification is replaced.
+    """
+    if verify(index_dir, expected):
+        log(f"Index published by another task meanwhile, discarding this build: {index_dir}")
+        remove_tree(temp_dir)
+        return
+    manifest['files'] = {name: os.path.getsize(os.path.join(temp_dir, name))
+                         for name in sorted(os.listdir(temp_dir)) if name != MANIFEST}
+    manifest['created'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    with open(os.path.join(temp_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    make_read_only(temp_dir)
+    if os.path.lexists(index_dir):
+        log(f"Replacing index that failed verification: {index_dir}")
+        remove_tree(index_dir)
+    try:
+        os.rename(temp_dir, index_dir)
+    except OSError:
+        # Another task published the same content first
+        remove_tree(temp_dir)
+
+
+def bwa_index(fasta, cache_dir):
+    """Prefix of a verified BWA index of fasta, building it once per content hash"""
+    if not os.path.isfile(fasta):
+        raise ReferenceIndexError(f"FASTA not found: {fasta}")
+    os.makedirs(cache_dir, exist_ok=True)
+    fasta_hash = content_hash(fasta, cache_dir)
+    key = f"bwa-{fasta_hash[:32]}"
+    index_dir = os.path.join(cache_dir, key)
+    prefix = os.path.join(index_dir, 'index')
+    expected = {'tool': 'bwa', 'fasta_sha256': fasta_hash}
+
+    if verify(index_dir, expected):
+        log(f"Reusing BWA index: {index_dir}")
+        return prefix
+
+    with locked(os.path.join(cache_dir, f"{key}.lock")):
+        # Another task may have built it while we waited
+        if verify(index_dir, expected):
+            log(f"Reusing BWA index: {index_dir}")
+            return prefix
+        log(f"Building BWA index of {fasta} in {index_dir}")
+        temp_dir = f"{index_dir}.tmp.{os.uname().nodename}.{os.getpid()}"
+        remove_tree(temp_dir)
+        os.makedirs(temp_dir)
+        result = subprocess.run(['bwa', 'index', '-p', os.path.join(temp_dir, 'index'), fasta],
+                                stdout=sys.stderr)
+        missing = [suffix for suffix in BWA_SUFFIXES if not os.path.isfile(os.path.join(temp_dir, 'index' + suffix))]
+        if result.returncode != 0 or missing:
+            remove_tree(temp_dir)
+            raise ReferenceIndexError(f"bwa index failed (exit {result.returncode}, missing {missing})")
+        publish(temp_dir, index_dir, dict(expected, source=os.path.realpath(fasta)), expected)
+
+    if not verify(index_dir, expected):
+        raise ReferenceIndexError(f"BWA index failed verification: {index_dir}")
+    return prefix
+
+
+def kraken2_check(db_dir, cache_dir):
+    """Database path when all Kraken2 files are present and non-empty; verification is cached by file stats"""
+    paths = [os.path.join(db_dir, name) for name in KRAKEN2_FILES]
+    missing = [name for name, path in zip(KRAKEN2_FILES, paths) if not os.path.isfile(path) or os.path.getsize(path) == 0]
+    if missing:
+        raise ReferenceIndexError(f"Kraken2 database incomplete, missing or empty: {', '.join(missing)}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fingerprint = hashlib.sha1('|'.join(stat_key(path) for path in paths).encode()).hexdigest()
+    record = os.path.join(cache_dir, f"kraken2-{fingerprint}.json")
+    if os.path.isfile(record):
+        log(f"Kraken2 database verified earlier: {db_dir}")
+        return db_dir
+
+    # opts.k2d and taxo.k2d are small: hash them for the record; hash.k2d is checked by size
+    verified = {
+        'tool': 'kraken2',
+        'database': os.path.realpath(db_dir),
+        'files': {name: os.path.getsize(path) for name, path in zip(KRAKEN2_FILES, paths)},
+        'opts_sha256': content_hash(paths[1], cache_dir),
+        'taxo_sha256': content_hash(paths[2], cache_dir),
+        'verified': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    temp = f"{record}.{os.getpid()}"
+    with open(temp, 'w') as f:
+        json.dump(verified, f, indent=2)
+    os.replace(temp, record)
+    log(f"Kraken2 database verified: {db_dir}")
+    return db_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared, content-addressed reference index cache")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bwa_parser = subparsers.add_parser('bwa', help="Print the prefix of a cached BWA index of a FASTA")
+    bwa_parser.add_argument('fasta', help="Reference FASTA")
+    bwa_parser.add_argument('--cache-dir', required=True, help="Shared index cache directory")
+
+    kraken2_parser = subparsers.add_parser('kraken2', help="Verify a Kraken2 database and print its path")
+    kraken2_parser.add_argument('database', help="Kraken2 database directory")
+    kraken2_parser.add_argument('--cache-dir', required=True, help="Shared index cache directory")
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'bwa':
+            print(bwa_index(args.fasta, args.cache_dir))
+        else:
+            print(kraken2_check(args.database, args.cache_dir))
+    except (ReferenceIndexError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,9 @@ params.base_path        = "/scratch/sp96859/Meta-genome-data-analysis/Nextflow"
 params.threads          = 8
 params.memory           = '16 GB'
 params.publish_mode     = 'copy'
+params.index_cache      = "${params.base_path}/databases/index_cache"   // Shared BWA index / database check cache, keyed by content
+params.contig_index_cache = "${workflow.workDir}/contig_index_cache"   // Per-sample contig indexes: reused on -resume, removed with the work directory
+params.diamond_lca_fraction = 0.9   // DIAMOND hits within this fraction of an ORF's best bitscore enter its LCA
 
 // -------------------------------
 // Step 1: Quality control
@@ -67,7 +70,7 @@ process VIRAL_SCREENING {
     tuple val(sample), path(r1), path(r2), path(json), path(html)
     
     output:
-    tuple val(sample), path("${sample}.viral.R1.fq.gz"), path("${sample}.viral.R2.fq.gz"), path("${sample}.viral_mapping.bam"), path("${sample}_screening_stats.txt")
+    tuple val(sample), path("${sample}.viral.R1.fq.gz"), path("${sample}.viral.R2.fq.gz"), path("${sample}.viral_mapping.bam"), path("${sample}_screening_stats.txt"), path("${sample}_screening_counts.json")
     
     script:
     """
@@ -82,12 +85,6 @@ process VIRAL_SCREENING {
     fi
     echo "✅ BWA: \$(which bwa)"
     
-    if ! command -v seqtk >/dev/null 2>&1; then
-        echo "❌ seqtk not available"
-        exit 127
-    fi
-    echo "✅ seqtk: \$(which seqtk)"
-    
     if ! command -v samtools >/dev/null 2>&1; then
         echo "❌ samtools not available"
         exit 127
@@ -113,9 +110,10 @@ process VIRAL_SCREENING {
         exit 1
     fi
     
-    # Build viral genome index
-    echo "Building viral genome BWA index..."
-    bwa index "\$VIRAL_DB_PATH" || { echo "BWA index creation failed"; exit 1; }
+    # Viral genome index: built once per database content in the shared cache, reused read-only by every sample
+    echo "Locating viral genome BWA index..."
+    VIRAL_DB_INDEX=\$(reference_index.py bwa "\$VIRAL_DB_PATH" --cache-dir "${params.index_cache}") || { echo "BWA index creation failed"; exit 1; }
+    echo "BWA index: \$VIRAL_DB_INDEX"
     
     # Align reads to viral genomes
     echo "Aligning reads to \$VIRUS_COUNT target viral genomes..."
@@ -123,7 +121,7 @@ process VIRAL_SCREENING {
     
     # Use direct pipeline
     echo "Executing BWA alignment and generating BAM..."
-    bwa mem -t ${task.cpus} "\$VIRAL_DB_PATH" ${r1} ${r2} | \\
+    bwa mem -t ${task.cpus} "\$VIRAL_DB_INDEX" ${r1} ${r2} | \\
         samtools view -@ ${task.cpus} -bS - | \\
         samtools sort -@ ${task.cpus} -o ${sample}.viral_mapping.bam -
     
@@ -143,38 +141,27 @@ process VIRAL_SCREENING {
     # Extract aligned reads
     echo "Extracting viral reads..."
     
-    # Get aligned read IDs
-    samtools view -F 4 ${sample}.viral_mapping.bam | \\
-        awk '{print \$1}' | sort | uniq > ${sample}.viral_read_ids.txt
+    # Mapped read names go straight from the BAM into memory; R1 and R2 are walked once, in lockstep,
+    # and the input/viral read counts are recorded in a JSON sidecar
+    extract_reads.py --bam ${sample}.viral_mapping.bam --r1 ${r1} --r2 ${r2} \\
+        --out-r1 ${sample}.viral.R1.fq.gz --out-r2 ${sample}.viral.R2.fq.gz \\
+        --sample ${sample} --json ${sample}_screening_counts.json --threads ${task.cpus} || { echo "Viral reads extraction failed"; exit 1; }
     
-    # Count viral reads
-    VIRAL_READ_COUNT=\$(wc -l < ${sample}.viral_read_ids.txt || echo "0")
+    VIRAL_READ_COUNT=\$(metrics.py get ${sample}_screening_counts.json viral_reads)
+    INPUT_READS=\$(metrics.py get ${sample}_screening_counts.json input_reads)
     echo "Detected viral reads count: \$VIRAL_READ_COUNT"
-    
-    # Extract viral reads from original clean reads
-    if [ "\$VIRAL_READ_COUNT" -gt 0 ]; then
-        echo "Extracting viral reads to FASTQ files..."
-        seqtk subseq ${r1} ${sample}.viral_read_ids.txt | gzip > ${sample}.viral.R1.fq.gz
-        seqtk subseq ${r2} ${sample}.viral_read_ids.txt | gzip > ${sample}.viral.R2.fq.gz
-        echo "✅ Viral reads extraction completed"
-    else
-        echo "⚠️ No viral reads detected, creating empty files"
-        echo "" | gzip > ${sample}.viral.R1.fq.gz
-        echo "" | gzip > ${sample}.viral.R2.fq.gz
-    fi
+    echo "✅ Viral reads extraction completed"
     
     # Generate detailed statistics report
     echo "=== Viral Screening Statistics Report ===" > ${sample}_screening_stats.txt
     echo "Sample: ${sample}" >> ${sample}_screening_stats.txt
     echo "Target viral genome count: \$VIRUS_COUNT" >> ${sample}_screening_stats.txt
     
-    # Calculate input reads count
-    INPUT_READS=\$(zcat ${r1} | awk 'END{print NR/4}')
     echo "Input clean reads: \$INPUT_READS" >> ${sample}_screening_stats.txt
     echo "Detected viral reads: \$VIRAL_READ_COUNT" >> ${sample}_screening_stats.txt
     
     # Calculate viral reads ratio
-    VIRAL_RATIO=\$(awk -v viral=\$VIRAL_READ_COUNT -v total=\$INPUT_READS 'BEGIN{if(total>0) printf "%.4f", viral*100/total; else print "0"}')
+    VIRAL_RATIO=\$(metrics.py get ${sample}_screening_counts.json viral_ratio_percent)
     echo "Viral reads ratio: \${VIRAL_RATIO}%" >> ${sample}_screening_stats.txt
     
     echo "Viral R1 file size: \$(ls -lh ${sample}.viral.R1.fq.gz | awk '{print \$5}')" >> ${sample}_screening_stats.txt
@@ -198,17 +185,17 @@ process VIRAL_ASSEMBLY {
     publishDir "${params.outdir}/03_viral_assembly", mode: params.publish_mode
     
     input:
-    tuple val(sample), path(viral_r1), path(viral_r2), path(mapping_bam), path(stats)
+    tuple val(sample), path(viral_r1), path(viral_r2), path(mapping_bam), path(stats), path(screening_counts)
     
     output:
-    tuple val(sample), path("${sample}.viral_contigs.fa"), path("${sample}_assembly_stats.txt"), path("${sample}.viral_contigs_lengths.txt")
+    tuple val(sample), path("${sample}.viral_contigs.fa"), path("${sample}_assembly_stats.txt"), path("${sample}.viral_contigs_lengths.txt"), path("${sample}.viral_contigs_stats.json"), path("${sample}_assembly_metrics.json")
     
     script:
     """
     echo "=== Viral genome assembly: ${sample} ==="
     
-    # Calculate viral reads count
-    VIRAL_READ_COUNT=\$(zcat ${viral_r1} | awk 'END{print int(NR/4)}')
+    # Viral reads count (recorded by VIRAL_SCREENING, no need to re-read the FASTQ)
+    VIRAL_READ_COUNT=\$(metrics.py get ${screening_counts} viral_reads)
     echo "Viral reads count: \$VIRAL_READ_COUNT"
     
     # Determine whether to perform assembly
@@ -217,7 +204,10 @@ process VIRAL_ASSEMBLY {
         echo ">empty_assembly" > ${sample}.viral_contigs.fa
         echo "ACGT" >> ${sample}.viral_contigs.fa
         echo "Insufficient viral reads, assembly not performed" > ${sample}_assembly_stats.txt
-        echo "empty_assembly\t4" > ${sample}.viral_contigs_lengths.txt
+        fasta_stats.py scan ${sample}.viral_contigs.fa \\
+            --lengths ${sample}.viral_contigs_lengths.txt --json ${sample}.viral_contigs_stats.json
+        metrics.py write --json ${sample}_assembly_metrics.json --sample ${sample} --step assembly \\
+            --status "skipped: insufficient viral reads"
     else
         echo "Sufficient viral reads, starting assembly..."
         
@@ -234,28 +224,32 @@ process VIRAL_ASSEMBLY {
         if [ -f "${sample}.viral_assembly/final.contigs.fa" ]; then
             cp ${sample}.viral_assembly/final.contigs.fa ${sample}.viral_contigs.fa
             
-            # Calculate assembly statistics
-            CONTIG_COUNT=\$(grep -c '^>' ${sample}.viral_contigs.fa || echo "0")
-            TOTAL_LENGTH=\$(awk '/^>/{next} {total+=length} END{print total+0}' ${sample}.viral_contigs.fa)
-            
-            # Calculate N50
-            awk '/^>/{name=substr(\$0,2); next} {seq[name]+=length; total+=length} END{n=0; for(i in seq) lens[++n]=seq[i]; asort(lens); target=total*0.5; sum=0; for(i=n; i>=1; i--) {sum+=lens[i]; if(sum>=target) {print "N50: " lens[i]; break}}}' ${sample}.viral_contigs.fa > n50.tmp
-            N50=\$(cat n50.tmp | cut -d' ' -f2 || echo "0")
-            
-            # Generate contig lengths file
-            awk '/^>/{name=substr(\$0,2); next} {seq[name]+=length} END{for(i in seq) print i "\\t" seq[i]}' ${sample}.viral_contigs.fa | sort -k2 -nr > ${sample}.viral_contigs_lengths.txt
+            # Scan the contigs once: length table, N50/N90, GC and histogram in a JSON sidecar
+            fasta_stats.py scan ${sample}.viral_contigs.fa \\
+                --lengths ${sample}.viral_contigs_lengths.txt --json ${sample}.viral_contigs_stats.json
+            CONTIG_COUNT=\$(metrics.py get ${sample}.viral_contigs_stats.json count)
+            TOTAL_LENGTH=\$(metrics.py get ${sample}.viral_contigs_stats.json total_length)
+            N50=\$(metrics.py get ${sample}.viral_contigs_stats.json n50)
             
             echo "Viral contigs count: \$CONTIG_COUNT" > ${sample}_assembly_stats.txt
             echo "Total viral sequence length: \$TOTAL_LENGTH bp" >> ${sample}_assembly_stats.txt
             echo "Assembly N50: \$N50 bp" >> ${sample}_assembly_stats.txt
+            echo "Assembly N90: \$(metrics.py get ${sample}.viral_contigs_stats.json n90) bp" >> ${sample}_assembly_stats.txt
             echo "Input viral reads: \$VIRAL_READ_COUNT" >> ${sample}_assembly_stats.txt
-            echo "Average contig length: \$(awk -v total=\$TOTAL_LENGTH -v count=\$CONTIG_COUNT 'BEGIN{if(count>0) printf "%.1f", total/count; else print "0"}') bp" >> ${sample}_assembly_stats.txt
+            echo "Average contig length: \$(metrics.py get ${sample}.viral_contigs_stats.json mean_length) bp" >> ${sample}_assembly_stats.txt
+            echo "GC content: \$(metrics.py get ${sample}.viral_contigs_stats.json gc_percent)%" >> ${sample}_assembly_stats.txt
+            
+            # Typed metrics for the final report
+            metrics.py write --json ${sample}_assembly_metrics.json --sample ${sample} --step assembly \\
+                contigs=\$CONTIG_COUNT total_length=\$TOTAL_LENGTH n50=\$N50
         else
             echo "⚠️ Assembly failed, creating empty file"
             echo ">failed_assembly" > ${sample}.viral_contigs.fa
             echo "ACGT" >> ${sample}.viral_contigs.fa
             echo "Assembly failed" > ${sample}_assembly_stats.txt
-            echo "failed_assembly\t4" > ${sample}.viral_contigs_lengths.txt
+            fasta_stats.py scan ${sample}.viral_contigs.fa \\
+                --lengths ${sample}.viral_contigs_lengths.txt --json ${sample}.viral_contigs_stats.json
+            metrics.py write --json ${sample}_assembly_metrics.json --sample ${sample} --step assembly --status failed
         fi
     fi
     
@@ -271,21 +265,21 @@ process ORF_PREDICTION {
     publishDir "${params.outdir}/04_orf_prediction", mode: params.publish_mode
     
     input:
-    tuple val(sample), path(contigs), path(assembly_stats), path(contig_lengths)
+    tuple val(sample), path(contigs), path(assembly_stats), path(contig_lengths), path(contig_fasta_stats), path(assembly_metrics)
     
     output:
-    tuple val(sample), path("${sample}.viral_orfs.faa"), path("${sample}.viral_orfs.fna"), path("${sample}.orf2contig.tsv"), path("${sample}_orf_stats.txt")
+    tuple val(sample), path("${sample}.viral_orfs.faa"), path("${sample}.viral_orfs.fna"), path("${sample}.orf2contig.tsv"), path("${sample}_orf_stats.txt"), path("${sample}.viral_orfs_stats.json"), path("${sample}_orf_metrics.json")
     
     script:
     """
     echo "=== ORF prediction: ${sample} ==="
     
-    # Check if we have meaningful contigs to analyze
-    CONTIG_COUNT=\$(grep -c '^>' ${contigs} || echo "0")
+    # Check if we have meaningful contigs to analyze (from the VIRAL_ASSEMBLY sidecar)
+    CONTIG_COUNT=\$(metrics.py get ${contig_fasta_stats} count)
     echo "Input contigs: \$CONTIG_COUNT"
     
-    # Calculate total sequence length (excluding empty/failed assemblies)
-    TOTAL_SEQ_LENGTH=\$(awk '/^>/{next} /^ACGT\$/{next} {total+=length(\$0)} END{print total+0}' ${contigs})
+    # Total sequence length (placeholders of empty/failed assemblies are 4 bp)
+    TOTAL_SEQ_LENGTH=\$(metrics.py get ${contig_fasta_stats} total_length)
     echo "Total sequence length: \$TOTAL_SEQ_LENGTH bp"
     
     if [ "\$TOTAL_SEQ_LENGTH" -lt 200 ]; then
@@ -296,6 +290,9 @@ process ORF_PREDICTION {
         echo "ATG" >> ${sample}.viral_orfs.fna
         echo "empty_orf\tempty_contig" > ${sample}.orf2contig.tsv
         echo "No ORFs predicted due to insufficient sequence" > ${sample}_orf_stats.txt
+        fasta_stats.py scan ${sample}.viral_orfs.faa --type prot --json ${sample}.viral_orfs_stats.json
+        metrics.py write --json ${sample}_orf_metrics.json --sample ${sample} --step orf_prediction \\
+            --status "skipped: insufficient sequence"
     else
         echo "Running PRODIGAL for ORF prediction..."
         
@@ -318,15 +315,18 @@ process ORF_PREDICTION {
                 print id "\\t" contig
             }' ${sample}.viral_orfs.faa > ${sample}.orf2contig.tsv
             
-            # Calculate ORF statistics
-            ORF_COUNT=\$(grep -c '^>' ${sample}.viral_orfs.faa)
-            AVG_ORF_LENGTH=\$(awk '/^>/{if(seq) print length(seq); seq=""; next} {seq=seq\$0} END{if(seq) print length(seq)}' ${sample}.viral_orfs.faa | awk '{sum+=\$1; count++} END{if(count>0) printf "%.1f", sum/count; else print "0"}')
+            # Calculate ORF statistics (one pass, JSON sidecar for the downstream steps)
+            fasta_stats.py scan ${sample}.viral_orfs.faa --type prot --json ${sample}.viral_orfs_stats.json
+            ORF_COUNT=\$(metrics.py get ${sample}.viral_orfs_stats.json count)
+            AVG_ORF_LENGTH=\$(metrics.py get ${sample}.viral_orfs_stats.json mean_length)
             
             echo "ORF prediction completed successfully" > ${sample}_orf_stats.txt
             echo "Total ORFs predicted: \$ORF_COUNT" >> ${sample}_orf_stats.txt
             echo "Average ORF length: \$AVG_ORF_LENGTH amino acids" >> ${sample}_orf_stats.txt
             echo "ORFs per contig: \$(awk -v orfs=\$ORF_COUNT -v contigs=\$CONTIG_COUNT 'BEGIN{if(contigs>0) printf "%.1f", orfs/contigs; else print "0"}' )" >> ${sample}_orf_stats.txt
             echo "Coding density: \$(awk -v orfs=\$ORF_COUNT -v total=\$TOTAL_SEQ_LENGTH 'BEGIN{if(total>0) printf "%.2f", orfs*300/total; else print "0"}' ) ORFs/kb" >> ${sample}_orf_stats.txt
+            metrics.py write --json ${sample}_orf_metrics.json --sample ${sample} --step orf_prediction \\
+                orfs=\$ORF_COUNT avg_orf_length=\$AVG_ORF_LENGTH
             
             echo "✅ ORF prediction completed: \$ORF_COUNT ORFs found"
         else
@@ -337,6 +337,8 @@ process ORF_PREDICTION {
             echo "ATG" >> ${sample}.viral_orfs.fna
             echo "no_orfs\tno_contig" > ${sample}.orf2contig.tsv
             echo "PRODIGAL failed or no ORFs predicted" > ${sample}_orf_stats.txt
+            fasta_stats.py scan ${sample}.viral_orfs.faa --type prot --json ${sample}.viral_orfs_stats.json
+            metrics.py write --json ${sample}_orf_metrics.json --sample ${sample} --step orf_prediction --status failed
         fi
     fi
     
@@ -352,17 +354,17 @@ process DIAMOND_PROTEIN_ANALYSIS {
     publishDir "${params.outdir}/05_diamond_analysis", mode: params.publish_mode
     
     input:
-    tuple val(sample), path(orfs_faa), path(orfs_fna), path(orf2contig), path(orf_stats)
+    tuple val(sample), path(orfs_faa), path(orfs_fna), path(orf2contig), path(orf_stats), path(orf_fasta_stats), path(orf_metrics)
     
     output:
-    tuple val(sample), path("${sample}.diamond_results.m8"), path("${sample}_diamond_stats.txt"), path("${sample}.diamond_best_hits.tsv")
+    tuple val(sample), path("${sample}.diamond_results.m8"), path("${sample}_diamond_stats.txt"), path("${sample}.diamond_best_hits.tsv"), path("${sample}.diamond_contig_taxonomy.tsv"), path("${sample}_diamond_metrics.json")
     
     script:
     """
     echo "=== DIAMOND protein analysis: ${sample} ==="
     
     # Check if we have ORFs to analyze
-    ORF_COUNT=\$(grep -c '^>' ${orfs_faa} || echo "0")
+    ORF_COUNT=\$(metrics.py get ${orf_fasta_stats} count)
     echo "Input ORFs: \$ORF_COUNT"
     
     # Check database
@@ -374,11 +376,17 @@ process DIAMOND_PROTEIN_ANALYSIS {
         echo "# No DIAMOND database available" > ${sample}.diamond_results.m8
         echo "DIAMOND database not found" > ${sample}_diamond_stats.txt
         echo "query_id\tsubject_id\tpident\tlength\tevalue\tbitscore\tsubject_title" > ${sample}.diamond_best_hits.tsv
+        echo "contig_id\torfs_with_hits\tassigned_name\tassigned_level\tvote_weight\tvote_fraction\tbest_bitscore" > ${sample}.diamond_contig_taxonomy.tsv
+        metrics.py write --json ${sample}_diamond_metrics.json --sample ${sample} --step diamond \\
+            --status "skipped: database not found" input_orfs=\$ORF_COUNT
     elif [ "\$ORF_COUNT" -lt 1 ] || ! grep -q '^>[^>]' ${orfs_faa}; then
         echo "⚠️ No valid ORFs for DIAMOND analysis"
         echo "# No ORFs available for analysis" > ${sample}.diamond_results.m8
         echo "No ORFs available for DIAMOND analysis" > ${sample}_diamond_stats.txt
         echo "query_id\tsubject_id\tpident\tlength\tevalue\tbitscore\tsubject_title" > ${sample}.diamond_best_hits.tsv
+        echo "contig_id\torfs_with_hits\tassigned_name\tassigned_level\tvote_weight\tvote_fraction\tbest_bitscore" > ${sample}.diamond_contig_taxonomy.tsv
+        metrics.py write --json ${sample}_diamond_metrics.json --sample ${sample} --step diamond \\
+            --status "skipped: no ORFs" input_orfs=\$ORF_COUNT
     else
         echo "Running DIAMOND blastp analysis..."
         
@@ -394,31 +402,28 @@ process DIAMOND_PROTEIN_ANALYSIS {
             --sensitive
         
         if [ -s "${sample}.diamond_results.m8" ]; then
-            # Calculate statistics
-            TOTAL_HITS=\$(wc -l < ${sample}.diamond_results.m8)
-            UNIQUE_ORFS=\$(cut -f1 ${sample}.diamond_results.m8 | sort | uniq | wc -l)
-            UNIQUE_PROTEINS=\$(cut -f2 ${sample}.diamond_results.m8 | sort | uniq | wc -l)
+            # Best hit + LCA of hits within the bitscore fraction per ORF, weighted vote per contig
+            diamond_lca.py \\
+                --m8 ${sample}.diamond_results.m8 \\
+                --orf2contig ${orf2contig} \\
+                --bitscore-fraction ${params.diamond_lca_fraction} \\
+                --best-hits ${sample}.diamond_best_hits.tsv \\
+                --contigs ${sample}.diamond_contig_taxonomy.tsv
             
-            # Generate best hits table
-            echo "query_id\tsubject_id\tpident\tlength\tevalue\tbitscore\tsubject_title" > ${sample}.diamond_best_hits.tsv
-            awk 'BEGIN{OFS="\\t"} {
-                if(!seen[\$1] || \$12 > best_score[\$1]) {
-                    seen[\$1] = 1;
-                    best_score[\$1] = \$12;
-                    best_hit[\$1] = \$0;
-                }
-            } END {
-                for(orf in best_hit) {
-                    split(best_hit[orf], fields, "\\t");
-                    print fields[1], fields[2], fields[3], fields[4], fields[11], fields[12], fields[13];
-                }
-            }' ${sample}.diamond_results.m8 | sort -k6 -nr >> ${sample}.diamond_best_hits.tsv
+            # Calculate statistics (one pass over the hits, typed sidecar for the final report)
+            metrics.py diamond --json ${sample}_diamond_metrics.json --sample ${sample} --m8 ${sample}.diamond_results.m8 \\
+                --orfs \$ORF_COUNT --contigs ${sample}.diamond_contig_taxonomy.tsv
+            TOTAL_HITS=\$(metrics.py get ${sample}_diamond_metrics.json hits)
+            UNIQUE_ORFS=\$(metrics.py get ${sample}_diamond_metrics.json orfs_with_hits)
+            UNIQUE_PROTEINS=\$(metrics.py get ${sample}_diamond_metrics.json unique_proteins)
+            ASSIGNED_CONTIGS=\$(metrics.py get ${sample}_diamond_metrics.json assigned_contigs)
             
             # Generate statistics
             echo "DIAMOND protein analysis completed successfully" > ${sample}_diamond_stats.txt
             echo "Total DIAMOND hits: \$TOTAL_HITS" >> ${sample}_diamond_stats.txt
             echo "ORFs with hits: \$UNIQUE_ORFS / \$ORF_COUNT (\$(awk -v hits=\$UNIQUE_ORFS -v total=\$ORF_COUNT 'BEGIN{if(total>0) printf "%.1f", hits*100/total; else print "0"}')%)" >> ${sample}_diamond_stats.txt
             echo "Unique viral proteins detected: \$UNIQUE_PROTEINS" >> ${sample}_diamond_stats.txt
+            echo "Contigs with protein assignments: \$ASSIGNED_CONTIGS" >> ${sample}_diamond_stats.txt
             
             # Top viral protein families
             echo "Top 10 viral protein families:" >> ${sample}_diamond_stats.txt
@@ -433,6 +438,9 @@ process DIAMOND_PROTEIN_ANALYSIS {
             echo "⚠️ No DIAMOND hits found"
             echo "DIAMOND analysis completed - no significant hits found" > ${sample}_diamond_stats.txt
             echo "query_id\tsubject_id\tpident\tlength\tevalue\tbitscore\tsubject_title" > ${sample}.diamond_best_hits.tsv
+            echo "contig_id\torfs_with_hits\tassigned_name\tassigned_level\tvote_weight\tvote_fraction\tbest_bitscore" > ${sample}.diamond_contig_taxonomy.tsv
+            metrics.py diamond --json ${sample}_diamond_metrics.json --sample ${sample} --m8 ${sample}.diamond_results.m8 \\
+                --orfs \$ORF_COUNT
         fi
     fi
     
@@ -448,17 +456,17 @@ process HMMER_ANALYSIS {
     publishDir "${params.outdir}/06_hmmer_analysis", mode: params.publish_mode
     
     input:
-    tuple val(sample), path(orfs_faa), path(orfs_fna), path(orf2contig), path(orf_stats)
+    tuple val(sample), path(orfs_faa), path(orfs_fna), path(orf2contig), path(orf_stats), path(orf_fasta_stats), path(orf_metrics)
     
     output:
-    tuple val(sample), path("${sample}.hmmer_results.tbl"), path("${sample}_hmmer_stats.txt"), path("${sample}.hmmer_domains.tbl")
+    tuple val(sample), path("${sample}.hmmer_results.tbl"), path("${sample}_hmmer_stats.txt"), path("${sample}.hmmer_domains.tbl"), path("${sample}_hmmer_metrics.json")
     
     script:
     """
     echo "=== HMMER profile analysis: ${sample} ==="
     
     # Check if we have ORFs to analyze
-    ORF_COUNT=\$(grep -c '^>' ${orfs_faa} || echo "0")
+    ORF_COUNT=\$(metrics.py get ${orf_fasta_stats} count)
     echo "Input ORFs: \$ORF_COUNT"
     
     # Check HMM database
@@ -470,11 +478,15 @@ process HMMER_ANALYSIS {
         echo "# No HMM database available" > ${sample}.hmmer_results.tbl
         echo "HMM database not found" > ${sample}_hmmer_stats.txt
         echo "# No HMM database available" > ${sample}.hmmer_domains.tbl
+        metrics.py write --json ${sample}_hmmer_metrics.json --sample ${sample} --step hmmer \\
+            --status "skipped: database not found" input_orfs=\$ORF_COUNT
     elif [ "\$ORF_COUNT" -lt 1 ] || ! grep -q '^>[^>]' ${orfs_faa}; then
         echo "⚠️ No valid ORFs for HMMER analysis"
         echo "# No ORFs available for analysis" > ${sample}.hmmer_results.tbl
         echo "No ORFs available for HMMER analysis" > ${sample}_hmmer_stats.txt
         echo "# No ORFs available for analysis" > ${sample}.hmmer_domains.tbl
+        metrics.py write --json ${sample}_hmmer_metrics.json --sample ${sample} --step hmmer \\
+            --status "skipped: no ORFs" input_orfs=\$ORF_COUNT
     else
         echo "Running HMMER hmmscan analysis..."
         
@@ -499,10 +511,14 @@ process HMMER_ANALYSIS {
             # Remove comment lines for analysis
             grep -v '^#' ${sample}.hmmer_results.tbl > hmmer_clean.tmp || touch hmmer_clean.tmp
             
+            # Count hits, ORFs and profiles on the whitespace-aligned columns (typed sidecar for the final report)
+            metrics.py hmmer --json ${sample}_hmmer_metrics.json --sample ${sample} --tblout ${sample}.hmmer_results.tbl \\
+                --orfs \$ORF_COUNT
+            
             if [ -s "hmmer_clean.tmp" ]; then
-                TOTAL_HITS=\$(wc -l < hmmer_clean.tmp)
-                UNIQUE_ORFS=\$(cut -f4 -d' ' hmmer_clean.tmp | sort | uniq | wc -l)
-                UNIQUE_PROFILES=\$(cut -f1 -d' ' hmmer_clean.tmp | sort | uniq | wc -l)
+                TOTAL_HITS=\$(metrics.py get ${sample}_hmmer_metrics.json hits)
+                UNIQUE_ORFS=\$(metrics.py get ${sample}_hmmer_metrics.json orfs_with_hits)
+                UNIQUE_PROFILES=\$(metrics.py get ${sample}_hmmer_metrics.json unique_profiles)
                 
                 echo "HMMER profile analysis completed successfully" > ${sample}_hmmer_stats.txt
                 echo "Total HMMER hits: \$TOTAL_HITS" >> ${sample}_hmmer_stats.txt
@@ -522,6 +538,8 @@ process HMMER_ANALYSIS {
         else
             echo "⚠️ HMMER analysis failed or no hits found"
             echo "HMMER analysis failed or no significant hits found" > ${sample}_hmmer_stats.txt
+            metrics.py hmmer --json ${sample}_hmmer_metrics.json --sample ${sample} --tblout ${sample}.hmmer_results.tbl \\
+                --orfs \$ORF_COUNT --status failed
         fi
         
         # Clean up
@@ -540,11 +558,11 @@ process ABUNDANCE_ESTIMATION {
     publishDir "${params.outdir}/07_abundance_estimation", mode: params.publish_mode
     
     input:
-    tuple val(sample), path(contigs), path(assembly_stats), path(contig_lengths)
-    tuple val(sample2), path(viral_r1), path(viral_r2), path(mapping_bam), path(screening_stats)
+    tuple val(sample), path(contigs), path(assembly_stats), path(contig_lengths), path(contig_fasta_stats), path(assembly_metrics)
+    tuple val(sample2), path(viral_r1), path(viral_r2), path(mapping_bam), path(screening_stats), path(screening_counts)
     
     output:
-    tuple val(sample), path("${sample}.abundance_table.tsv"), path("${sample}_abundance_stats.txt")
+    tuple val(sample), path("${sample}.abundance_table.tsv"), path("${sample}_abundance_stats.txt"), path("${sample}_abundance_metrics.json")
     
     when:
     sample == sample2
@@ -553,9 +571,9 @@ process ABUNDANCE_ESTIMATION {
     """
     echo "=== Abundance estimation: ${sample} ==="
     
-    # Check if we have meaningful contigs
-    CONTIG_COUNT=\$(grep -c '^>' ${contigs} || echo "0")
-    TOTAL_SEQ_LENGTH=\$(awk '/^>/{next} /^ACGT\$/{next} {total+=length(\$0)} END{print total+0}' ${contigs})
+    # Check if we have meaningful contigs (from the VIRAL_ASSEMBLY sidecar)
+    CONTIG_COUNT=\$(metrics.py get ${contig_fasta_stats} count)
+    TOTAL_SEQ_LENGTH=\$(metrics.py get ${contig_fasta_stats} total_length)
     
     echo "Input contigs: \$CONTIG_COUNT"
     echo "Total sequence length: \$TOTAL_SEQ_LENGTH bp"
@@ -564,90 +582,35 @@ process ABUNDANCE_ESTIMATION {
         echo "⚠️ Insufficient contigs for abundance analysis"
         
         # Create empty abundance table
-        echo "contig_id\tlength\tmapped_reads\tcoverage\tdepth\trpkm" > ${sample}.abundance_table.tsv
-        echo "no_contigs\t0\t0\t0\t0\t0" >> ${sample}.abundance_table.tsv
+        echo "contig_id\tlength\tmapped_reads\tcoverage\tdepth\trpkm\tmedian_depth\ttpm" > ${sample}.abundance_table.tsv
+        echo "no_contigs\t0\t0\t0\t0\t0\t0\t0" >> ${sample}.abundance_table.tsv
         
         echo "Insufficient contigs for analysis" > ${sample}_abundance_stats.txt
+        metrics.py write --json ${sample}_abundance_metrics.json --sample ${sample} --step abundance \\
+            --status "skipped: insufficient contigs"
     else
         echo "Running abundance estimation..."
         
-        # Build index for contigs
-        bwa index ${contigs}
+        # Index for contigs (cached by content in the work directory, so resumed runs reuse it)
+        CONTIG_INDEX=\$(reference_index.py bwa ${contigs} --cache-dir "${params.contig_index_cache}") || { echo "BWA index creation failed"; exit 1; }
         
         # Map viral reads back to assembled contigs
         echo "Mapping viral reads to assembled contigs..."
-        bwa mem -t ${task.cpus} ${contigs} ${viral_r1} ${viral_r2} | \\
+        bwa mem -t ${task.cpus} "\$CONTIG_INDEX" ${viral_r1} ${viral_r2} | \\
             samtools sort -@ ${task.cpus} -o ${sample}.contigs_mapping.bam -
         
         samtools index ${sample}.contigs_mapping.bam
         
-        # Calculate depth per position
-        samtools depth -a ${sample}.contigs_mapping.bam > ${sample}.depth.txt
-        
-        # Get total mapped reads for normalization
-        TOTAL_MAPPED_READS=\$(samtools view -c -F 4 ${sample}.contigs_mapping.bam)
+        # Mapped reads per contig from the BAM index
+        samtools idxstats ${sample}.contigs_mapping.bam > ${sample}.idxstats.txt
+        TOTAL_MAPPED_READS=\$(awk '{total+=\$3} END{print total+0}' ${sample}.idxstats.txt)
         echo "Total mapped reads to contigs: \$TOTAL_MAPPED_READS"
         
-        # Create abundance table header
-        echo "contig_id\tlength\tmapped_reads\tcoverage\tdepth\trpkm" > ${sample}.abundance_table.tsv
-        
-        # Get contigs list and process each
-        grep '^>' ${contigs} | sed 's/^>//' | while read contig_id; do
-            # Get contig length from the contig_lengths file
-            contig_length=\$(awk -v id="\$contig_id" '\$1==id {print \$2}' ${contig_lengths})
-            
-            if [ -z "\$contig_length" ] || [ "\$contig_length" -eq 0 ]; then
-                # Fallback: calculate length from sequence
-                contig_length=\$(awk -v id="\$contig_id" '
-                    BEGIN{len=0; inseq=0} 
-                    /^>/ {if(\$0==">"id) inseq=1; else inseq=0; next} 
-                    inseq {len+=length} 
-                    END{print len}' ${contigs})
-            fi
-            
-            # Get mapped reads count
-            mapped_reads=\$(samtools view -c ${sample}.contigs_mapping.bam "\$contig_id" 2>/dev/null || echo "0")
-            
-            # Calculate coverage (fraction of bases covered)
-            covered_bases=\$(awk -v contig="\$contig_id" '\$1==contig && \$3>0 {count++} END {print count+0}' ${sample}.depth.txt)
-            if [ "\$contig_length" -gt 0 ]; then
-                coverage=\$(awk -v covered=\$covered_bases -v total=\$contig_length 'BEGIN{printf "%.4f", covered/total}')
-            else
-                coverage="0"
-            fi
-            
-            # Calculate average depth
-            avg_depth=\$(awk -v contig="\$contig_id" '\$1==contig {sum+=\$3; count++} END {if(count>0) printf "%.2f", sum/count; else print "0"}' ${sample}.depth.txt)
-            
-            # Calculate RPKM (Reads Per Kilobase per Million mapped reads)
-            if [ "\$contig_length" -gt 0 ] && [ "\$TOTAL_MAPPED_READS" -gt 0 ]; then
-                rpkm=\$(awk -v reads=\$mapped_reads -v length=\$contig_length -v total=\$TOTAL_MAPPED_READS 'BEGIN{printf "%.2f", (reads*1000000000)/(length*total)}')
-            else
-                rpkm="0"
-            fi
-            
-            echo "\$contig_id\t\$contig_length\t\$mapped_reads\t\$coverage\t\$avg_depth\t\$rpkm" >> ${sample}.abundance_table.tsv
-        done
-        
-        # Generate abundance statistics
-        echo "Abundance estimation completed successfully" > ${sample}_abundance_stats.txt
-        echo "Total contigs analyzed: \$CONTIG_COUNT" >> ${sample}_abundance_stats.txt
-        echo "Total reads mapped to contigs: \$TOTAL_MAPPED_READS" >> ${sample}_abundance_stats.txt
-        
-        # Summary statistics
-        HIGH_COV_CONTIGS=\$(awk 'NR>1 && \$4>0.5 {count++} END{print count+0}' ${sample}.abundance_table.tsv)
-        HIGH_DEPTH_CONTIGS=\$(awk 'NR>1 && \$5>5 {count++} END{print count+0}' ${sample}.abundance_table.tsv)
-        
-        echo "High coverage contigs (>50%): \$HIGH_COV_CONTIGS" >> ${sample}_abundance_stats.txt
-        echo "High depth contigs (>5x): \$HIGH_DEPTH_CONTIGS" >> ${sample}_abundance_stats.txt
-        
-        # Top abundant contigs
-        echo "Top 5 most abundant contigs (by RPKM):" >> ${sample}_abundance_stats.txt
-        tail -n +2 ${sample}.abundance_table.tsv | sort -k6 -nr | head -5 | \\
-            awk '{printf "  %s: %.2f RPKM, %.1fx depth\\n", \$1, \$6, \$5}' >> ${sample}_abundance_stats.txt
-        
-        # Clean up temporary files
-        rm -f ${sample}.depth.txt
+        # Stream per-position depth once: length, mapped reads, coverage, mean/median depth, RPKM and TPM for all contigs
+        samtools depth -a ${sample}.contigs_mapping.bam | \\
+            abundance_engine.py --lengths ${contig_lengths} --idxstats ${sample}.idxstats.txt --depth - \\
+                --table ${sample}.abundance_table.tsv --stats ${sample}_abundance_stats.txt
+        metrics.py abundance --json ${sample}_abundance_metrics.json --sample ${sample} --table ${sample}.abundance_table.tsv
         
         echo "✅ Abundance estimation completed"
     fi
@@ -664,10 +627,10 @@ process KRAKEN2_VIRAL_CLASSIFICATION {
     publishDir "${params.outdir}/08_viral_classification", mode: params.publish_mode
     
     input:
-    tuple val(sample), path(viral_r1), path(viral_r2), path(mapping_bam), path(stats)
+    tuple val(sample), path(viral_r1), path(viral_r2), path(mapping_bam), path(stats), path(screening_counts)
     
     output:
-    tuple val(sample), path("${sample}_kraken2_report.txt"), path("${sample}_kraken2_classification.txt"), path("${sample}_viral_species_summary.txt")
+    tuple val(sample), path("${sample}_kraken2_report.txt"), path("${sample}_kraken2_classification.txt"), path("${sample}_viral_species_summary.txt"), path("${sample}_kraken2_taxid_counts.tsv"), path("${sample}_kraken2_summary.json")
     
     script:
     """
@@ -685,25 +648,29 @@ process KRAKEN2_VIRAL_CLASSIFICATION {
         echo "Status: No Kraken2 database, skipping classification" >> ${sample}_viral_species_summary.txt
         echo "Database path: \$KRAKEN2_DB_PATH" >> ${sample}_viral_species_summary.txt
         echo "Time: \$(date)" >> ${sample}_viral_species_summary.txt
+        kraken2_summary.py --sample ${sample} --skipped "No Kraken2 database" \\
+            --tsv ${sample}_kraken2_taxid_counts.tsv --json ${sample}_kraken2_summary.json
         exit 0
     fi
     
-    # Verify database file integrity
+    # Verify database file integrity (verified once per database version in the shared cache)
     echo "Verifying Kraken2 database integrity..."
-    if [ ! -f "\$KRAKEN2_DB_PATH/hash.k2d" ] || [ ! -f "\$KRAKEN2_DB_PATH/opts.k2d" ] || [ ! -f "\$KRAKEN2_DB_PATH/taxo.k2d" ]; then
+    if ! reference_index.py kraken2 "\$KRAKEN2_DB_PATH" --cache-dir "${params.index_cache}" > /dev/null; then
         echo "⚠️ Kraken2 database files incomplete"
         echo "# Kraken2 database incomplete" > ${sample}_kraken2_report.txt
         echo "U\t0\tunclassified" > ${sample}_kraken2_classification.txt
         echo "Sample: ${sample}" > ${sample}_viral_species_summary.txt
         echo "Status: Kraken2 database incomplete, skipping classification" >> ${sample}_viral_species_summary.txt
         echo "Time: \$(date)" >> ${sample}_viral_species_summary.txt
+        kraken2_summary.py --sample ${sample} --skipped "Kraken2 database incomplete" \\
+            --tsv ${sample}_kraken2_taxid_counts.tsv --json ${sample}_kraken2_summary.json
         exit 0
     fi
     
     echo "✅ Kraken2 database verification passed"
     
-    # Check viral reads count
-    VIRAL_READ_COUNT=\$(zcat ${viral_r1} | awk 'END{print int(NR/4)}')
+    # Check viral reads count (recorded by VIRAL_SCREENING, no need to re-read the FASTQ)
+    VIRAL_READ_COUNT=\$(metrics.py get ${screening_counts} viral_reads)
     echo "Viral reads count: \$VIRAL_READ_COUNT"
     
     if [ "\$VIRAL_READ_COUNT" -eq 0 ]; then
@@ -712,6 +679,8 @@ process KRAKEN2_VIRAL_CLASSIFICATION {
         echo "U\t0\tunclassified" > ${sample}_kraken2_classification.txt
         echo "Sample: ${sample}" > ${sample}_viral_species_summary.txt
         echo "Status: No viral reads, skipping classification" >> ${sample}_viral_species_summary.txt
+        kraken2_summary.py --sample ${sample} --skipped "No viral reads" \\
+            --tsv ${sample}_kraken2_taxid_counts.tsv --json ${sample}_kraken2_summary.json
         exit 0
     fi
     
@@ -726,6 +695,8 @@ process KRAKEN2_VIRAL_CLASSIFICATION {
             echo "Sample: ${sample}" > ${sample}_viral_species_summary.txt
             echo "Status: Kraken2 tool not available, skipping classification" >> ${sample}_viral_species_summary.txt
             echo "Time: \$(date)" >> ${sample}_viral_species_summary.txt
+            kraken2_summary.py --sample ${sample} --skipped "Kraken2 tool not available" \\
+                --tsv ${sample}_kraken2_taxid_counts.tsv --json ${sample}_kraken2_summary.json
             exit 0
         }
     fi
@@ -754,28 +725,14 @@ process KRAKEN2_VIRAL_CLASSIFICATION {
     echo "" >> ${sample}_viral_species_summary.txt
     
     if [ -f "${sample}_kraken2_classification.txt" ]; then
-        # Calculate overall classification statistics
-        TOTAL_CLASSIFIED=\$(awk '\$1!="U"' ${sample}_kraken2_classification.txt | wc -l)
-        TOTAL_UNCLASSIFIED=\$(awk '\$1=="U"' ${sample}_kraken2_classification.txt | wc -l)
-        TOTAL_READS=\$(wc -l < ${sample}_kraken2_classification.txt)
-        
-        echo "=== Classification Statistics ===" >> ${sample}_viral_species_summary.txt
-        echo "Total reads: \$TOTAL_READS" >> ${sample}_viral_species_summary.txt
-        echo "Classified reads: \$TOTAL_CLASSIFIED" >> ${sample}_viral_species_summary.txt
-        echo "Unclassified reads: \$TOTAL_UNCLASSIFIED" >> ${sample}_viral_species_summary.txt
-        
-        if [ "\$TOTAL_READS" -gt 0 ]; then
-            CLASSIFICATION_RATE=\$(awk -v c=\$TOTAL_CLASSIFIED -v t=\$TOTAL_READS 'BEGIN{printf "%.2f", c*100/t}')
-            echo "Classification rate: \${CLASSIFICATION_RATE}%" >> ${sample}_viral_species_summary.txt
-        fi
-        
-        echo "" >> ${sample}_viral_species_summary.txt
-        
-        # Analyze viral species
-        echo "=== Detected Viral Species (Top 10) ===" >> ${sample}_viral_species_summary.txt
-        awk '\$1!="U"{print \$3}' ${sample}_kraken2_classification.txt | \\
-            sort | uniq -c | sort -nr | head -10 | \\
-            awk '{printf "%s\\t%s reads\\n", \$2, \$1}' >> ${sample}_viral_species_summary.txt
+        # Classification statistics, per-taxid counts and top species in one pass over the output
+        kraken2_summary.py --sample ${sample} \\
+            --classification ${sample}_kraken2_classification.txt \\
+            --report ${sample}_kraken2_report.txt \\
+            --top 10 \\
+            --text ${sample}_viral_species_summary.txt \\
+            --tsv ${sample}_kraken2_taxid_counts.tsv \\
+            --json ${sample}_kraken2_summary.json
         
         echo "" >> ${sample}_viral_species_summary.txt
         echo "=== Kraken2 Classification Report Summary ===" >> ${sample}_viral_species_summary.txt
@@ -783,6 +740,8 @@ process KRAKEN2_VIRAL_CLASSIFICATION {
             awk '\$1>0{printf "%.2f%%\\t%s reads\\t%s\\n", \$1, \$2, \$6}' >> ${sample}_viral_species_summary.txt
     else
         echo "❌ Classification result file generation failed" >> ${sample}_viral_species_summary.txt
+        kraken2_summary.py --sample ${sample} --skipped "Classification result file generation failed" \\
+            --tsv ${sample}_kraken2_taxid_counts.tsv --json ${sample}_kraken2_summary.json
     fi
     
     echo "✅ Viral classification analysis completed"
@@ -796,17 +755,18 @@ process ENHANCED_FINAL_REPORT {
     publishDir "${params.outdir}/09_final_report", mode: params.publish_mode
     
     input:
-    tuple val(sample), path(contigs), path(assembly_stats), path(contig_lengths)
-    tuple val(sample2), path(viral_r1), path(viral_r2), path(mapping_bam), path(screening_stats)
-    tuple val(sample3), path(orfs_faa), path(orfs_fna), path(orf2contig), path(orf_stats)
-    tuple val(sample4), path(diamond_results), path(diamond_stats), path(diamond_best_hits)
-    tuple val(sample5), path(hmmer_results), path(hmmer_stats), path(hmmer_domains)
-    tuple val(sample6), path(abundance_table), path(abundance_stats)
-    tuple val(sample7), path(kraken2_report), path(kraken2_classification), path(viral_species_summary)
+    tuple val(sample), path(contigs), path(assembly_stats), path(contig_lengths), path(contig_fasta_stats), path(assembly_metrics)
+    tuple val(sample2), path(viral_r1), path(viral_r2), path(mapping_bam), path(screening_stats), path(screening_counts)
+    tuple val(sample3), path(orfs_faa), path(orfs_fna), path(orf2contig), path(orf_stats), path(orf_fasta_stats), path(orf_metrics)
+    tuple val(sample4), path(diamond_results), path(diamond_stats), path(diamond_best_hits), path(diamond_contig_taxonomy), path(diamond_metrics)
+    tuple val(sample5), path(hmmer_results), path(hmmer_stats), path(hmmer_domains), path(hmmer_metrics)
+    tuple val(sample6), path(abundance_table), path(abundance_stats), path(abundance_metrics)
+    tuple val(sample7), path(kraken2_report), path(kraken2_classification), path(viral_species_summary), path(kraken2_taxid_counts), path(kraken2_summary_json)
     
     output:
     path("${sample}.comprehensive_viral_report.tsv")
     path("${sample}.final_summary_stats.txt")
+    path("${sample}.metrics.json")
     
     when:
     sample == sample2 && sample == sample3 && sample == sample4 && sample == sample5 && sample == sample6 && sample == sample7
@@ -815,137 +775,41 @@ process ENHANCED_FINAL_REPORT {
     """
     echo "=== Enhanced final report generation: ${sample} ==="
     
-    # Read basic statistics
-    VIRAL_READS=\$(grep "Detected viral reads:" ${screening_stats} | cut -d: -f2 | tr -d ' ' || echo "0")
-    INPUT_READS=\$(grep "Input clean reads:" ${screening_stats} | cut -d: -f2 | tr -d ' ' || echo "0")
-    
-    # Assembly statistics
-    if [ -f "${assembly_stats}" ]; then
-        CONTIGS=\$(grep "Viral contigs count:" ${assembly_stats} | cut -d: -f2 | tr -d ' ' || echo "0")
-        TOTAL_LENGTH=\$(grep "Total viral sequence length:" ${assembly_stats} | cut -d: -f2 | cut -d' ' -f1 || echo "0")
-        N50=\$(grep "Assembly N50:" ${assembly_stats} | cut -d: -f2 | cut -d' ' -f1 || echo "0")
-    else
-        CONTIGS="0"
-        TOTAL_LENGTH="0"
-        N50="0"
-    fi
-    
-    # ORF statistics
-    if [ -f "${orf_stats}" ]; then
-        TOTAL_ORFS=\$(grep "Total ORFs predicted:" ${orf_stats} | cut -d: -f2 | tr -d ' ' || echo "0")
-        AVG_ORF_LENGTH=\$(grep "Average ORF length:" ${orf_stats} | cut -d: -f2 | cut -d' ' -f1 || echo "0")
-    else
-        TOTAL_ORFS="0"
-        AVG_ORF_LENGTH="0"
-    fi
+    # Merge the typed metrics sidecars of every step: report table, summary and per-sample metrics
+    metrics.py aggregate --sample ${sample} \\
+        --screening ${screening_counts} \\
+        --assembly ${assembly_metrics} \\
+        --orfs ${orf_metrics} \\
+        --diamond ${diamond_metrics} \\
+        --hmmer ${hmmer_metrics} \\
+        --abundance ${abundance_metrics} \\
+        --kraken2 ${kraken2_summary_json} \\
+        --tsv ${sample}.comprehensive_viral_report.tsv \\
+        --summary ${sample}.final_summary_stats.txt \\
+        --json ${sample}.metrics.json
     
-    # DIAMOND statistics
-    if [ -f "${diamond_stats}" ]; then
-        DIAMOND_HITS=\$(grep "Total DIAMOND hits:" ${diamond_stats} | cut -d: -f2 | tr -d ' ' || echo "0")
-        ORFS_WITH_HITS=\$(grep "ORFs with hits:" ${diamond_stats} | cut -d: -f2 | cut -d' ' -f1 || echo "0")
-    else
-        DIAMOND_HITS="0"
-        ORFS_WITH_HITS="0"
-    fi
+    echo "✅ Enhanced final report generation completed"
+    """
+}
+
+// -------------------------------
+// Step 10: Cohort metrics table
+process COHORT_METRICS {
+    publishDir "${params.outdir}/09_final_report", mode: params.publish_mode
     
-    # HMMER statistics
-    if [ -f "${hmmer_stats}" ]; then
-        HMMER_HITS=\$(grep "Total HMMER hits:" ${hmmer_stats} | cut -d: -f2 | tr -d ' ' || echo "0")
-        ORFS_WITH_PROFILES=\$(grep "ORFs with profile hits:" ${hmmer_stats} | cut -d: -f2 | cut -d' ' -f1 || echo "0")
-    else
-        HMMER_HITS="0"
-        ORFS_WITH_PROFILES="0"
-    fi
+    input:
+    path(sample_metrics)
     
-    # Abundance statistics
-    if [ -f "${abundance_stats}" ]; then
-        HIGH_COV_CONTIGS=\$(grep "High coverage contigs" ${abundance_stats} | cut -d: -f2 | tr -d ' ' || echo "0")
-        HIGH_DEPTH_CONTIGS=\$(grep "High depth contigs" ${abundance_stats} | cut -d: -f2 | tr -d ' ' || echo "0")
-    else
-        HIGH_COV_CONTIGS="0"
-        HIGH_DEPTH_CONTIGS="0"
-    fi
+    output:
+    path("cohort_metrics.tsv")
     
-    # Kraken2 statistics
-    if [ -f "${viral_species_summary}" ]; then
-        CLASSIFIED_READS=\$(grep "Classified reads:" ${viral_species_summary} | cut -d: -f2 | tr -d ' ' || echo "0")
-        CLASSIFICATION_RATE=\$(grep "Classification rate:" ${viral_species_summary} | cut -d: -f2 | tr -d ' ' || echo "0%")
-    else
-        CLASSIFIED_READS="N/A"
-        CLASSIFICATION_RATE="N/A"
-    fi
+    script:
+    """
+    echo "=== Cohort metrics: \$(ls ${sample_metrics} | wc -l) samples ==="
     
-    # Generate comprehensive report
-    echo -e "metric\\tvalue\\tdescription" > ${sample}.comprehensive_viral_report.tsv
-    echo -e "sample_id\\t${sample}\\tSample identifier" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "input_reads\\t\$INPUT_READS\\tTotal input clean reads" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "viral_reads\\t\$VIRAL_READS\\tDetected viral reads" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "viral_detection_rate\\t\$(awk -v v=\$VIRAL_READS -v t=\$INPUT_READS 'BEGIN{if(t>0) printf "%.4f", v*100/t; else print "0"}')%\\tPercentage of viral reads" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "assembled_contigs\\t\$CONTIGS\\tNumber of assembled viral contigs" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "total_assembly_length\\t\$TOTAL_LENGTH\\tTotal length of assembled viral sequences (bp)" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "assembly_n50\\t\$N50\\tAssembly N50 metric (bp)" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "predicted_orfs\\t\$TOTAL_ORFS\\tTotal number of predicted ORFs" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "avg_orf_length\\t\$AVG_ORF_LENGTH\\tAverage ORF length (amino acids)" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "diamond_hits\\t\$DIAMOND_HITS\\tTotal DIAMOND protein hits" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "orfs_with_protein_hits\\t\$ORFS_WITH_HITS\\tORFs with DIAMOND protein matches" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "hmmer_hits\\t\$HMMER_HITS\\tTotal HMMER profile hits" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "orfs_with_profile_hits\\t\$ORFS_WITH_PROFILES\\tORFs with HMMER profile matches" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "high_coverage_contigs\\t\$HIGH_COV_CONTIGS\\tContigs with >50% coverage" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "high_depth_contigs\\t\$HIGH_DEPTH_CONTIGS\\tContigs with >5x sequencing depth" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "kraken2_classified_reads\\t\$CLASSIFIED_READS\\tReads classified by Kraken2" >> ${sample}.comprehensive_viral_report.tsv
-    echo -e "kraken2_classification_rate\\t\$CLASSIFICATION_RATE\\tKraken2 classification success rate" >> ${sample}.comprehensive_viral_report.tsv
-    
-    # Generate comprehensive summary
-    echo "=== Enhanced Viral Detection Final Report - ${sample} ===" > ${sample}.final_summary_stats.txt
-    echo "Analysis completed: \$(date)" >> ${sample}.final_summary_stats.txt
-    echo "" >> ${sample}.final_summary_stats.txt
-    
-    echo "📊 DETECTION SUMMARY:" >> ${sample}.final_summary_stats.txt
-    echo "  Total input reads: \$INPUT_READS" >> ${sample}.final_summary_stats.txt
-    echo "  Viral reads detected: \$VIRAL_READS (\$(awk -v v=\$VIRAL_READS -v t=\$INPUT_READS 'BEGIN{if(t>0) printf "%.4f", v*100/t; else print "0"}')%)" >> ${sample}.final_summary_stats.txt
-    echo "  Assembled viral contigs: \$CONTIGS" >> ${sample}.final_summary_stats.txt
-    echo "  Total viral sequence: \$TOTAL_LENGTH bp" >> ${sample}.final_summary_stats.txt
-    echo "" >> ${sample}.final_summary_stats.txt
-    
-    echo "🧬 ORF ANALYSIS:" >> ${sample}.final_summary_stats.txt
-    echo "  Predicted ORFs: \$TOTAL_ORFS" >> ${sample}.final_summary_stats.txt
-    echo "  Average ORF length: \$AVG_ORF_LENGTH aa" >> ${sample}.final_summary_stats.txt
-    echo "  ORFs with protein hits (DIAMOND): \$ORFS_WITH_HITS" >> ${sample}.final_summary_stats.txt
-    echo "  ORFs with profile hits (HMMER): \$ORFS_WITH_PROFILES" >> ${sample}.final_summary_stats.txt
-    echo "" >> ${sample}.final_summary_stats.txt
-    
-    echo "📈 ABUNDANCE ANALYSIS:" >> ${sample}.final_summary_stats.txt
-    echo "  High coverage contigs (>50%): \$HIGH_COV_CONTIGS" >> ${sample}.final_summary_stats.txt
-    echo "  High depth contigs (>5x): \$HIGH_DEPTH_CONTIGS" >> ${sample}.final_summary_stats.txt
-    echo "" >> ${sample}.final_summary_stats.txt
-    
-    echo "🦠 TAXONOMIC CLASSIFICATION:" >> ${sample}.final_summary_stats.txt
-    echo "  Kraken2 classified reads: \$CLASSIFIED_READS" >> ${sample}.final_summary_stats.txt
-    echo "  Classification rate: \$CLASSIFICATION_RATE" >> ${sample}.final_summary_stats.txt
-    echo "" >> ${sample}.final_summary_stats.txt
-    
-    # Overall assessment
-    if [ \$VIRAL_READS -gt 1000 ] && [ \$CONTIGS -gt 5 ] && [ \$HMMER_HITS -gt 0 ]; then
-        echo "🎉 CONCLUSION: Strong viral detection with high-quality evidence!" >> ${sample}.final_summary_stats.txt
-        echo "  - Substantial viral reads detected" >> ${sample}.final_summary_stats.txt
-        echo "  - Successful viral genome assembly" >> ${sample}.final_summary_stats.txt
-        echo "  - Multiple lines of evidence (assembly + protein + profile)" >> ${sample}.final_summary_stats.txt
-    elif [ \$VIRAL_READS -gt 100 ] && [ \$CONTIGS -gt 0 ]; then
-        echo "✅ CONCLUSION: Moderate viral detection with good evidence" >> ${sample}.final_summary_stats.txt
-        echo "  - Viral reads detected and assembled" >> ${sample}.final_summary_stats.txt
-        echo "  - Recommend confirmation with additional methods" >> ${sample}.final_summary_stats.txt
-    elif [ \$VIRAL_READS -gt 10 ]; then
-        echo "⚠️ CONCLUSION: Low-level viral detection" >> ${sample}.final_summary_stats.txt
-        echo "  - Few viral reads detected" >> ${sample}.final_summary_stats.txt
-        echo "  - Limited assembly success" >> ${sample}.final_summary_stats.txt
-        echo "  - Results should be interpreted with caution" >> ${sample}.final_summary_stats.txt
-    else
-        echo "❌ CONCLUSION: No significant viral detection" >> ${sample}.final_summary_stats.txt
-        echo "  - Very few or no viral reads detected" >> ${sample}.final_summary_stats.txt
-        echo "  - May indicate low viral load or technical issues" >> ${sample}.final_summary_stats.txt
-    fi
+    metrics.py cohort --tsv cohort_metrics.tsv ${sample_metrics}
     
-    echo "✅ Enhanced final report generation completed"
+    echo "✅ Cohort metrics table completed"
     """
 }
 
@@ -978,5 +842,6 @@ workflow {
         ABUNDANCE_ESTIMATION.out,
         KRAKEN2_VIRAL_CLASSIFICATION.out
     )
+    COHORT_METRICS(ENHANCED_FINAL_REPORT.out[2].collect())
 }
 
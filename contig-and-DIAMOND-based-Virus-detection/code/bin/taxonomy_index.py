@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact memory-mapped NCBI taxonomy index
+
+Compiles names.dmp / nodes.dmp once into flat arrays indexed by integer taxid,
+so every MERGE_DIAMOND_REPORTS task opens the taxonomy in milliseconds and all
+tasks on a node share the pages through the OS cache.
+
+Index directory layout:
+  - parent.npy:       int32 parent taxid per taxid (-1 = taxid not in nodes.dmp)
+  - rank.npy:         uint8 rank code per taxid (0 = taxid not in nodes.dmp)
+  - name_offsets.npy: int64 offsets into names.bin (name of t = names[off[t]:off[t+1]])
+  - names.bin:        packed UTF-8 scientific names (empty slice = no name)
+  - meta.json:        format version, rank table, counts and source files
+
+Usage (one-time build step):
+  taxonomy_index.py names.dmp nodes.dmp taxonomy_index/
+"""
+
+import numpy as np
+import pandas as pd
+import sys
+import os
+import csv
+import json
+import mmap
+import math
+import shutil
+import argparse
+from collections import Counter
+
+INDEX_VERSION = 1
+
+# Lineage ranks reported for every DIAMOND hit (besides organism_name)
+LINEAGE_RANKS = ['superkingdom', 'kingdom', 'phylum', 'class', 'order',
+                 'family', 'genus', 'species']
+LINEAGE_COLUMNS = ['organism_name'] + LINEAGE_RANKS
+MISSING = 'N/A'
+
+# Lineage walks stop after this many levels (NCBI depth is < 100; guards against loops)
+MAX_LINEAGE_DEPTH = 256
+
+# Pruned loading: subtrees kept by default (Viruses, plus human as the main host)
+DEFAULT_ROOTS = [10239, 9606]
+# Parent of nodes outside the kept subtrees (-1 marks taxids missing from nodes.dmp)
+PRUNED = -2
+
+
+def read_nodes_dmp(nodes_file):
+    """
+    Read nodes.dmp (fields are separated by "\\t|\\t")
+
+    Returns:
+        DataFrame with taxid, parent, rank
+    """
+    return pd.read_csv(nodes_file, sep='\t', header=None, usecols=[0, 2, 4],
+                       names=['taxid', 'parent', 'rank'],
+                       dtype={'taxid': 'int64', 'parent': 'int64', 'rank': 'str'},
+                       quoting=csv.QUOTE_NONE, keep_default_na=False)
+
+
+def read_names_dmp(names_file):
+    """
+    Read the scientific names of names.dmp
+
+    Returns:
+        DataFrame with taxid, name
+    """
+    names = pd.read_csv(names_file, sep='\t', header=None, usecols=[0, 2, 6],
+                        names=['taxid', 'name', 'name_class'],
+                        dtype={'taxid': 'int64', 'name': 'str', 'name_class': 'str'},
+                        quoting=csv.QUOTE_NONE, keep_default_na=False)
+    names = names[names['name_class'] == 'scientific name']
+    return pd.DataFrame({'taxid': names['taxid'].to_numpy(),
+                         'name': names['name'].str.strip().to_numpy(dtype=object)})
+
+
+def write_index(index_dir, nodes, names, sources):
+    """
+    Write the index arrays for nodes (taxid, parent, rank) and names (taxid, name)
+
+    The index is assembled in a temporary directory and renamed into place, so
+    concurrent readers never see a partial index.
+    """
+    taxids = nodes['taxid'].to_numpy()
+    size = int(max(taxids.max(initial=1), names['taxid'].to_numpy().max(initial=1))) + 1
+
+    parent = np.full(size, -1, dtype='int32')
+    parent[taxids] = nodes['parent'].to_numpy()
+    rank_names, rank_codes = np.unique(nodes['rank'].to_numpy(dtype=object).astype(str),
+                                       return_inverse=True)
+    rank = np.zeros(size, dtype='uint8')
+    rank[taxids] = rank_codes + 1
+
+    # Last scientific name wins, as in a dict load
+    names = names.drop_duplicates('taxid', keep='last').sort_values('taxid')
+    encoded = [name.encode('utf-8') for name in names['name']]
+    lengths = np.zeros(size, dtype='int64')
+    lengths[names['taxid'].to_numpy()] = np.fromiter(map(len, encoded), dtype='int64',
+                                                     count=len(encoded))
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    meta = {
+        'version': INDEX_VERSION,
+        'size': size,
+        'ranks': [''] + [str(r) for r in rank_names],
+        'n_nodes': int(len(nodes)),
+        'n_names': int(len(names)),
+        'sources': sources
+    }
+
+    tmp_dir = f"{index_dir.rstrip(os.sep)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'parent.npy'), parent)
+    np.save(os.path.join(tmp_dir, 'rank.npy'), rank)
+    np.save(os.path.join(tmp_dir, 'name_offsets.npy'), offsets)
+    with open(os.path.join(tmp_dir, 'names.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+    os.replace(tmp_dir, index_dir)
+    return meta
+
+
+def build_taxonomy_index(names_file, nodes_file, index_dir):
+    """
+    Compile names.dmp and nodes.dmp into a memory-mappable index directory
+
+    Returns:
+        Index metadata
+    """
+    print(f"Reading {nodes_file}...", file=sys.stderr)
+    nodes = read_nodes_dmp(nodes_file)
+    print(f"Reading {names_file}...", file=sys.stderr)
+    names = read_names_dmp(names_file)
+
+    sources = {os.path.basename(path): os.path.getsize(path) for path in (names_file, nodes_file)}
+    meta = write_index(index_dir, nodes, names, sources)
+    print(f"Index written to {index_dir}: {meta['n_nodes']:,} nodes, "
+          f"{meta['n_names']:,} scientific names", file=sys.stderr)
+    return meta
+
+
+def normalize_taxid(taxid):
+    """
+    Integer taxid from an int, float (455367.0) or string value; 0 if invalid
+    """
+    try:
+        return int(float(taxid))
+    except (ValueError, TypeError, OverflowError):
+        return 0
+
+
+def parse_staxids(value):
+    """
+    Taxids of one DIAMOND staxids value: 455367, 455367.0, "455367" or "455367;10239"
+
+    Returns:
+        List of positive integer taxids (empty for NaN / invalid values)
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return []
+    taxids = []
+    for part in str(value).split(';'):
+        taxid = normalize_taxid(part.strip())
+        if taxid > 0:
+            taxids.append(taxid)
+    return taxids
+
+
+def staxids_counts(values):
+    """
+    Count hits per staxids value, keyed by canonical taxid strings ("455367",
+    "455367;10239"); counts once per distinct value instead of once per hit
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    result = Counter()
+    for value, count in zip(uniques, counts):
+        key = ';'.join(str(taxid) for taxid in parse_staxids(value))
+        if key:
+            result[key] += int(count)
+    return result
+
+
+def gather_lineages(staxids, lineage_rows):
+    """
+    Lineage columns for a DIAMOND staxids column
+
+    Distinct staxids values are resolved once by lineage_rows(values), then the
+    lineage rows are gathered back to every hit in one vectorized step. The
+    columns are categorical: millions of hits share a few thousand names.
+
+    Returns:
+        DataFrame aligned with staxids (same index) with LINEAGE_COLUMNS
+    """
+    staxids = pd.Series(staxids)
+    codes, uniques = pd.factorize(staxids, use_na_sentinel=True)
+    # NaN staxids (code -1) take the appended empty value (all N/A)
+    table = lineage_rows(list(uniques) + [''])
+    rows = np.where(codes >= 0, codes, len(uniques))
+    columns = {}
+    for column in LINEAGE_COLUMNS:
+        name_codes, names = pd.factorize(table[column].to_numpy(dtype=object))
+        columns[column] = pd.Categorical.from_codes(name_codes[rows], names)
+    return pd.DataFrame(columns, index=staxids.index)
+
+
+class TaxonomyIndex:
+    """Read-only, memory-mapped view of a taxonomy index directory"""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Taxonomy index {index_dir} has version {self.meta.get('version')}, "
+                             f"expected {INDEX_VERSION}; rebuild it with taxonomy_index.py")
+        self.index_dir = index_dir
+        self.ranks = self.meta['ranks']
+        self.parents = np.load(os.path.join(index_dir, 'parent.npy'), mmap_mode='r')
+        self.rank_codes = np.load(os.path.join(index_dir, 'rank.npy'), mmap_mode='r')
+        self.name_offsets = np.load(os.path.join(index_dir, 'name_offsets.npy'), mmap_mode='r')
+        self.size = len(self.parents)
+
+        names_path = os.path.join(index_dir, 'names.bin')
+        if os.path.getsize(names_path) > 0:
+            with open(names_path, 'rb') as f:
+                self.names_blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.names_blob = b''
+
+        # Memoized lineages: taxid -> tuple of LINEAGE_COLUMNS values
+        self._lineages = {}
+
+    def has_node(self, taxid):
+        return 0 < taxid < self.size and self.rank_codes[taxid] != 0
+
+    def name(self, taxid):
+        """Scientific name, or None"""
+        if not 0 <= taxid < self.size:
+            return None
+        start, end = self.name_offsets[taxid], self.name_offsets[taxid + 1]
+        if start == end:
+            return None
+        return self.names_blob[start:end].decode('utf-8')
+
+    def parent(self, taxid):
+        return int(self.parents[taxid])
+
+    def rank(self, taxid):
+        return self.ranks[self.rank_codes[taxid]]
+
+    def lca(self, taxids):
+        """
+        Lowest common ancestor of taxids (taxids missing from nodes.dmp are ignored)
+        """
+        known = [taxid for taxid in taxids if self.has_node(taxid)]
+        if not known:
+            return taxids[0] if taxids else 0
+        ancestors = []
+        current = known[0]
+        while self.has_node(current) and len(ancestors) < MAX_LINEAGE_DEPTH:
+            ancestors.append(current)
+            if current == 1:
+                break
+            current = self.parent(current)
+        for taxid in known[1:]:
+            path = set()
+            current = taxid
+            while self.has_node(current) and len(path) < MAX_LINEAGE_DEPTH:
+                path.add(current)
+                if current == 1:
+                    break
+                current = self.parent(current)
+            ancestors = [ancestor for ancestor in ancestors if ancestor in path]
+            if not ancestors:
+                return 1
+        return ancestors[0] if ancestors else 1
+
+    def resolve_staxids(self, value):
+        """
+        Single taxid for a staxids value: the taxid itself, or the LCA of a list
+        """
+        taxids = parse_staxids(value)
+        if len(taxids) > 1:
+            return self.lca(taxids)
+        return taxids[0] if taxids else 0
+
+    def _names_of(self, taxids):
+        """Scientific names for an array of taxids, decoded once per distinct taxid"""
+        unique = np.unique(taxids)
+        names = np.array([self.name(int(taxid)) or MISSING for taxid in unique], dtype=object)
+        return names[np.searchsorted(unique, taxids)]
+
+    def _resolve_lineages(self, taxids):
+        """
+        Walk all taxids up the tree together, one level per step
+
+        Returns:
+            Dictionary taxid -> tuple of LINEAGE_COLUMNS values
+        """
+        n = len(taxids)
+        size = self.size
+        offsets = self.name_offsets
+        lineage_codes = {code: rank for code, rank in enumerate(self.ranks) if rank in LINEAGE_RANKS}
+        ancestors = {rank: np.zeros(n, dtype='int64') for rank in LINEAGE_RANKS}
+
+        def alive(nodes):
+            inside = (nodes > 1) & (nodes < size)
+            return inside & (self.rank_codes[np.where(inside, nodes, 0)] != 0)
+
+        current = taxids.copy()
+        active = np.flatnonzero(alive(current))
+        for _ in range(MAX_LINEAGE_DEPTH):
+            if len(active) == 0:
+                break
+            nodes = current[active]
+            codes = self.rank_codes[nodes]
+            named = offsets[nodes + 1] > offsets[nodes]
+            # Walking upwards, a higher ancestor of the same rank overwrites (as get_lineage did)
+            for code, rank in lineage_codes.items():
+                hit = (codes == code) & named
+                ancestors[rank][active[hit]] = nodes[hit]
+            current[active] = self.parents[nodes]
+            active = active[alive(current[active])]
+
+        organism_names = self._names_of(np.clip(taxids, 0, size - 1))
+        organism_names[(taxids <= 0) | (taxids >= size)] = MISSING
+        columns = [organism_names] + [self._names_of(ancestors[rank]) for rank in LINEAGE_RANKS]
+        return dict(zip(taxids.tolist(), zip(*columns)))
+
+    def lineage_table(self, taxids):
+        """
+        Lineages of integer taxids, resolved once per distinct taxid and memoized
+
+        Returns:
+            DataFrame (index: taxid, in input order) with LINEAGE_COLUMNS
+        """
+        taxids = np.asarray(taxids, dtype='int64')
+        missing = np.array([taxid for taxid in np.unique(taxids).tolist() if taxid not in self._lineages],
+                           dtype='int64')
+        if len(missing):
+            self._lineages.update(self._resolve_lineages(missing))
+        return pd.DataFrame([self._lineages[taxid] for taxid in taxids.tolist()],
+                            columns=LINEAGE_COLUMNS, index=pd.Index(taxids, dtype='int64'))
+
+    def lineage_rows(self, values):
+        """
+        Lineages of distinct staxids values (lists resolve to their LCA)
+
+        Returns:
+            DataFrame with LINEAGE_COLUMNS, one row per value
+        """
+        resolved = np.array([self.resolve_staxids(value) for value in values], dtype='int64')
+        return self.lineage_table(resolved)
+
+    def lineages_for(self, staxids):
+        """
+        Lineage columns for a DIAMOND staxids column (see gather_lineages)
+        """
+        return gather_lineages(staxids, self.lineage_rows)
+
+    def get_lineage(self, taxid):
+        """
+        Get complete taxonomic lineage
+
+        Returns:
+            Dictionary of LINEAGE_RANKS plus organism_name, 'N/A' where unknown
+        """
+        taxid = normalize_taxid(taxid)
+        if taxid in self._lineages:
+            return dict(zip(LINEAGE_COLUMNS, self._lineages[taxid]))
+
+        lineage = {rank: MISSING for rank in LINEAGE_RANKS}
+        lineage['organism_name'] = self.name(taxid) or MISSING
+
+        # Traverse up the taxonomy tree
+        current = taxid
+        visited = set()
+        while current != 1 and self.has_node(current):
+            # Prevent loops
+            if current in visited:
+                break
+            visited.add(current)
+
+            rank = self.rank(current)
+            # Only keep major ranks
+            if rank in LINEAGE_RANKS:
+                lineage[rank] = self.name(current) or lineage[rank]
+            current = self.parent(current)
+
+        self._lineages[taxid] = tuple(lineage[column] for column in LINEAGE_COLUMNS)
+        return lineage
+
+
+
+class PrunedTaxonomyIndex(TaxonomyIndex):
+    """
+    In-memory copy of the part of an index a viral analysis needs
+
+    Keeps the subtrees under roots, the ancestors of the roots and the
+    ancestor closure of taxids (the taxids seen in the DIAMOND staxids
+    column), so every lineage of those taxids is unchanged. Every other node
+    gets the PRUNED parent sentinel and no rank or name, and resolves like a
+    taxid missing from nodes.dmp.
+    """
+
+    def __init__(self, index_dir, roots=DEFAULT_ROOTS, taxids=()):
+        super().__init__(index_dir)
+        keep = self._closure(roots, taxids)
+
+        # Arrays stay indexed by taxid; pruned names become empty slices
+        parents = np.asarray(self.parents)
+        self.parents = np.where(keep, parents, PRUNED).astype('int32')
+        self.rank_codes = np.where(keep, self.rank_codes, 0).astype('uint8')
+        offsets = np.asarray(self.name_offsets)
+        kept = np.flatnonzero(keep)
+        lengths = np.zeros(self.size, dtype='int64')
+        lengths[kept] = offsets[kept + 1] - offsets[kept]
+        blob = b''.join(self.names_blob[start:end] for start, end in
+                        zip(offsets[kept].tolist(), offsets[kept + 1].tolist()))
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        # Kept names are small: int32 offsets halve the largest array
+        self.name_offsets = offsets.astype('int32') if offsets[-1] < 2 ** 31 else offsets
+        self.names_blob = blob
+        self.n_kept = len(kept)
+
+    def _closure(self, roots, taxids):
+        """Mask of the nodes under roots plus the ancestors of roots and taxids"""
+        parents = np.asarray(self.parents)
+        present = np.asarray(self.rank_codes) != 0
+        valid_parent = np.where(present & (parents >= 0), parents, 0)
+
+        roots = np.array([taxid for taxid in roots if self.has_node(taxid)], dtype='int64')
+        keep = np.zeros(self.size, dtype=bool)
+        keep[roots] = True
+        # Descendants: a node is kept once its parent is (one tree level per pass)
+        for _ in range(MAX_LINEAGE_DEPTH):
+            grown = keep | (present & keep[valid_parent])
+            if np.array_equal(grown, keep):
+                break
+            keep = grown
+
+        # Ancestors of the roots and of the observed taxids, walked up together
+        current = np.unique(np.concatenate([roots, np.asarray(list(taxids), dtype='int64')]))
+        current = current[(current > 0) & (current < self.size)]
+        for _ in range(MAX_LINEAGE_DEPTH):
+            current = current[present[current]]
+            if len(current) == 0:
+                break
+            keep[current] = True
+            current = np.unique(valid_parent[current])
+            current = current[~keep[current]]
+        return keep
+
+    def is_pruned(self, taxid):
+        return 0 < taxid < self.size and self.parents[taxid] == PRUNED
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile NCBI names.dmp/nodes.dmp into a memory-mapped taxonomy index")
+    parser.add_argument('names_file', help="NCBI names.dmp")
+    parser.add_argument('nodes_file', help="NCBI nodes.dmp")
+    parser.add_argument('index_dir', help="Output index directory")
+    args = parser.parse_args()
+
+    for path in (args.names_file, args.nodes_file):
+        if not os.path.exists(path):
+            print(f"Error: Cannot find {path}", file=sys.stderr)
+            sys.exit(1)
+    build_taxonomy_index(args.names_file, args.nodes_file, args.index_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resident taxonomy service shared by MERGE_DIAMOND_REPORTS tasks
+
+Keeps one TaxonomyIndex, and the lineages it has already resolved, in memory
+and answers batched lineage queries over a Unix socket or a localhost TCP
+port. Tasks pointed at it (--taxonomy_server) skip opening the index and
+re-resolving the taxids every sample shares; when it is not answering they
+fall back to the index itself.
+
+Protocol: one JSON object per line in each direction
+  {"op": "ping"}                        -> {"ok": true, "meta": {...}}
+  {"op": "lineages", "staxids": [...]}  -> {"ok": true, "rows": [[organism_name, superkingdom, ...], ...]}
+
+Usage:
+  taxonomy_server.py taxonomy_index/ --address /tmp/taxonomy.sock
+  taxonomy_server.py taxonomy_index/ --address 127.0.0.1:8765 --idle-timeout 3600
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import ipaddress
+import threading
+import socketserver
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from taxonomy_index import TaxonomyIndex, LINEAGE_COLUMNS, gather_lineages
+
+
+def is_loopback(host):
+    """True for localhost and IPv4 loopback addresses (127.0.0.0/8)"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.IPv4Address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_address(address):
+    """
+    ("unix", path) for a socket path, ("tcp", (host, port)) for host:port
+
+    The service is unauthenticated, so TCP hosts other than loopback are rejected.
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        host = host or '127.0.0.1'
+        if not is_loopback(host):
+            raise ValueError(f"TCP host {host} is not a loopback address; "
+                             f"the taxonomy service only listens on localhost (e.g. 127.0.0.1:{port})")
+        return 'tcp', (host, int(port))
+    return 'unix', address
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers newline-delimited JSON requests until the client disconnects"""
+
+    def handle(self):
+        self.server.touch(+1)
+        try:
+            for line in self.rfile:
+                try:
+                    response = self.server.answer(json.loads(line))
+                except Exception as e:
+                    response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+                self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+                self.wfile.flush()
+        finally:
+            self.server.touch(-1)
+
+
+class _TaxonomyService:
+    """Request handling shared by the Unix socket and TCP servers"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_service(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.last_active = time.time()
+        self.queries = 0
+
+    def touch(self, delta):
+        with self.lock:
+            self.connections += delta
+            self.last_active = time.time()
+
+    def answer(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'meta': self.index.meta}
+        if op == 'lineages':
+            values = [str(value) for value in request['staxids']]
+            # The lineage memo is shared by all connections
+            with self.lock:
+                table = self.index.lineage_rows(values)
+                self.queries += 1
+            return {'ok': True, 'rows': [list(row) for row in table.itertuples(index=False, name=None)]}
+        raise ValueError(f"unknown op {op!r}")
+
+
+class UnixTaxonomyServer(_TaxonomyService, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+class TCPTaxonomyServer(_TaxonomyService, socketserver.ThreadingMixIn, socketserver.TCPServer):
+    pass
+
+
+def serve(index_dir, address, idle_timeout=0):
+    """
+    Serve lineage queries at address until SIGTERM/SIGINT, or until no client
+    has been connected for idle_timeout seconds (0 = never)
+    """
+    kind, target = parse_address(address)
+    index = TaxonomyIndex(index_dir)
+    if kind == 'unix':
+        if os.path.exists(target):
+            os.unlink(target)  # stale socket from an earlier server
+        server = UnixTaxonomyServer(target, _RequestHandler)
+    else:
+        server = TCPTaxonomyServer(target, _RequestHandler)
+    server.setup_service(index)
+
+    def stop(*_):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+
+    if idle_timeout > 0:
+        def watchdog():
+            while True:
+                time.sleep(min(idle_timeout, 30))
+                with server.lock:
+                    idle = server.connections == 0 and time.time() - server.last_active > idle_timeout
+                if idle:
+                    print(f"Idle for {idle_timeout}s, shutting down", file=sys.stderr)
+                    stop()
+                    return
+        threading.Thread(target=watchdog, daemon=True).start()
+
+    print(f"Serving taxonomy index {index_dir} ({index.meta['n_nodes']:,} nodes) at {address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if kind == 'unix' and os.path.exists(target):
+            os.unlink(target)
+    print(f"Answered {server.queries:,} lineage queries", file=sys.stderr)
+
+
+class TaxonomyClient:
+    """Lineage lookups answered by a running taxonomy_server.py"""
+
+    def __init__(self, address, connect_timeout=5):
+        kind, target = parse_address(address)
+        family = socket.AF_UNIX if kind == 'unix' else socket.AF_INET
+        self.address = address
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(connect_timeout)
+            self.sock.connect(target)
+            self.sock.settimeout(None)  # large batches may take a while
+            self.rfile = self.sock.makefile('rb')
+            self.meta = self._call({'op': 'ping'})['meta']
+        except Exception:
+            self.sock.close()
+            raise
+        # Rows already fetched: staxids value -> lineage tuple
+        self._rows = {}
+
+    @classmethod
+    def connect(cls, address):
+        """Client for address, or None when no server answers there"""
+        if not address:
+            return None
+        try:
+            return cls(address)
+        except (OSError, ValueError, RuntimeError):
+            return None
+
+    def _call(self, request):
+        self.sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        line = self.rfile.readline()
+        if not line:
+            raise RuntimeError(f"Taxonomy server at {self.address} closed the connection")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise RuntimeError(f"Taxonomy server error: {response.get('error')}")
+        return response
+
+    def lineage_rows(self, values):
+        """
+        Lineages of distinct staxids values, fetched in one batch per call
+
+        Returns:
+            DataFrame with LINEAGE_COLUMNS, one row per value
+        """
+        keys = [str(value) for value in values]
+        missing = list(dict.fromkeys(key for key in keys if key not in self._rows))
+        if missing:
+            rows = self._call({'op': 'lineages', 'staxids': missing})['rows']
+            self._rows.update(zip(missing, map(tuple, rows)))
+        return pd.DataFrame([self._rows[key] for key in keys], columns=LINEAGE_COLUMNS)
+
+    def lineages_for(self, staxids):
+        """
+        Lineage columns for a DIAMOND staxids column (see gather_lineages)
+        """
+        return gather_lineages(staxids, self.lineage_rows)
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve lineage queries from a taxonomy index over a Unix socket or localhost TCP")
+    parser.add_argument('index_dir', help="Taxonomy index directory (taxonomy_index.py)")
+    parser.add_argument('--address', required=True,
+                        help="Unix socket path, or localhost host:port for TCP (e.g. 127.0.0.1:8765)")
+    parser.add_argument('--idle-timeout', type=float, default=0,
+                        help="Exit after this many seconds without clients (default: 0 = never)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.index_dir):
+        print(f"Error: Cannot find taxonomy index {args.index_dir}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        serve(args.index_dir, args.address, args.idle_timeout)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -51,6 +51,13 @@ params.diamond_outfmt = '6 qseqid sseqid pident length mismatch gapopen qstart q
 
 // Merge analysis parameters
 params.skip_merge_reports = false  // Whether to skip comprehensive report generation
+params.diamond_chunk_size = 500000 // Diamond rows held in memory at a time by MERGE_DIAMOND_REPORTS
+
+// Taxonomy index (names.dmp/nodes.dmp compiled once, memory-mapped by every sample task)
+params.taxonomy_index = null        // Prebuilt index directory (skips BUILD_TAXONOMY_INDEX)
+params.taxonomy_index_store = null  // Where the built index is kept (default: <outdir>/taxonomy_index)
+params.taxonomy_server = null       // Running bin/taxonomy_server.py (socket path or host:port); falls back to the index
+params.taxonomy_roots = null        // e.g. '10239,9606': load only these subtrees plus the taxids seen in the hits
 
 // Resource parameters
 params.max_cpus = 32
@@ -165,14 +172,20 @@ workflow {
             .join(DIAMOND_CLASSIFICATION_SPADES.out.diamond_spades)
             .set { ch_reports_to_merge }
         
-        // Prepare taxonomy files
-        ch_taxonomy_names = Channel.fromPath(params.taxonomy_names, checkIfExists: true)
-        ch_taxonomy_nodes = Channel.fromPath(params.taxonomy_nodes, checkIfExists: true)
+        // Taxonomy index: prebuilt, or compiled once from names.dmp/nodes.dmp
+        if (params.taxonomy_index) {
+            ch_taxonomy_index = Channel.fromPath(params.taxonomy_index, type: 'dir', checkIfExists: true)
+        } else {
+            BUILD_TAXONOMY_INDEX (
+                Channel.fromPath(params.taxonomy_names, checkIfExists: true),
+                Channel.fromPath(params.taxonomy_nodes, checkIfExists: true)
+            )
+            ch_taxonomy_index = BUILD_TAXONOMY_INDEX.out.index
+        }
         
         MERGE_DIAMOND_REPORTS (
             ch_reports_to_merge,
-            ch_taxonomy_names.collect(),
-            ch_taxonomy_nodes.collect()
+            ch_taxonomy_index.collect()
         )
     }
 }
@@ -431,6 +444,29 @@ process DIAMOND_CLASSIFICATION_SPADES {
     """
 }
 
+// Process: Build Taxonomy Index (one-time; storeDir keeps it for later runs)
+process BUILD_TAXONOMY_INDEX {
+    tag "taxonomy_index"
+    label 'process_low'
+    conda 'conda-forge::pandas=2.0.3'
+    storeDir "${params.taxonomy_index_store ?: params.outdir + '/taxonomy_index'}"
+    
+    input:
+    path(taxonomy_names)
+    path(taxonomy_nodes)
+    
+    output:
+    path("taxonomy_index"), emit: index
+    
+    script:
+    """
+    echo "=== Building taxonomy index from ${taxonomy_names} and ${taxonomy_nodes} ==="
+    
+    # Parent/rank arrays indexed by taxid + packed scientific names (bin/taxonomy_index.py)
+    taxonomy_index.py ${taxonomy_names} ${taxonomy_nodes} taxonomy_index
+    """
+}
+
 // Process: Merge Diamond Reports (Comprehensive Analysis)
 process MERGE_DIAMOND_REPORTS {
     tag "${sample}"
@@ -440,8 +476,7 @@ process MERGE_DIAMOND_REPORTS {
     
     input:
     tuple val(sample), path(megahit_report), path(spades_report)
-    path(taxonomy_names)
-    path(taxonomy_nodes)
+    path(taxonomy_index)
     
     output:
     tuple val(sample), path("${sample}_merged_report.txt"), emit: merged_report
@@ -454,197 +489,192 @@ process MERGE_DIAMOND_REPORTS {
     #!/usr/bin/env python3
     # -*- coding: utf-8 -*-
     
+    import numpy as np
     import pandas as pd
     import sys
     from collections import Counter, defaultdict
     
+    # Diamond rows held in memory at a time
+    CHUNK_SIZE = ${params.diamond_chunk_size}
+    
+    # Resident taxonomy server, if any (bin/taxonomy_server.py)
+    TAXONOMY_SERVER = "${params.taxonomy_server ?: ''}"
+    
+    # Subtree roots for pruned taxonomy loading (empty: whole index)
+    TAXONOMY_ROOTS = [int(taxid) for taxid in "${params.taxonomy_roots ?: ''}".split(',') if taxid.strip()]
+    
+    DIAMOND_COLUMNS = ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 
+                       'gapopen', 'qstart', 'qend', 'sstart', 'send', 
+                       'evalue', 'bitscore', 'staxids']
+    
+    # Shared helpers (bin/ next to the workflow script)
+    sys.path.insert(0, "${projectDir}/bin")
+    from taxonomy_index import TaxonomyIndex, PrunedTaxonomyIndex, parse_staxids, staxids_counts
+    from taxonomy_server import TaxonomyClient
+    
     # Taxonomy database class
-    class TaxonomyDB:
-        \"\"\"Parse NCBI taxonomy database\"\"\"
-        
-        def __init__(self, names_file, nodes_file):
-            \"\"\"Initialize taxonomy database\"\"\"
-            print("Loading taxonomy database...", file=sys.stderr)
-            self.names = self._load_names(names_file)
-            self.nodes = self._load_nodes(nodes_file)
-            print(f"Loaded: {len(self.names):,} names, {len(self.nodes):,} nodes", file=sys.stderr)
-        
-        def _load_names(self, names_file):
-            \"\"\"Load names.dmp\"\"\"
-            names = {}
-            with open(names_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = [p.strip() for p in line.split('|')]
-                    if len(parts) >= 4:
-                        taxid = parts[0]
-                        name = parts[1]
-                        name_class = parts[3]
-                        
-                        # Only keep scientific names
-                        if name_class == 'scientific name':
-                            names[taxid] = name
-            
-            return names
-        
-        def _load_nodes(self, nodes_file):
-            \"\"\"Load nodes.dmp\"\"\"
-            nodes = {}
-            with open(nodes_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = [p.strip() for p in line.split('|')]
-                    if len(parts) >= 3:
-                        taxid = parts[0]
-                        parent_taxid = parts[1]
-                        rank = parts[2]
-                        
-                        nodes[taxid] = {
-                            'parent': parent_taxid,
-                            'rank': rank
-                        }
-            
-            return nodes
-        
-        def get_lineage(self, taxid):
-            \"\"\"Get complete taxonomic lineage\"\"\"
-            lineage = {
-                'superkingdom': 'N/A',
-                'kingdom': 'N/A',
-                'phylum': 'N/A',
-                'class': 'N/A',
-                'order': 'N/A',
-                'family': 'N/A',
-                'genus': 'N/A',
-                'species': 'N/A',
-                'organism_name': 'N/A'
-            }
-            
-            taxid = str(taxid)
-            
-            # Get current taxid name
-            if taxid in self.names:
-                lineage['organism_name'] = self.names[taxid]
-            
-            # Traverse up the taxonomy tree
-            current_taxid = taxid
-            visited = set()
-            
-            while current_taxid != '1' and current_taxid in self.nodes:
-                # Prevent loops
-                if current_taxid in visited:
-                    break
-                visited.add(current_taxid)
-                
-                node = self.nodes[current_taxid]
-                rank = node['rank']
-                
-                # Only keep major ranks
-                if rank in lineage and current_taxid in self.names:
-                    lineage[rank] = self.names[current_taxid]
-                
-                # Move to parent node
-                current_taxid = node['parent']
-            
-            return lineage
+    class TaxonomyDB(TaxonomyIndex):
+        \"\"\"NCBI taxonomy backed by the memory-mapped index (see bin/taxonomy_index.py)\"\"\"
+        
+        def __init__(self, index_dir):
+            \"\"\"Open the taxonomy index (pages are shared through the OS cache)\"\"\"
+            print("Loading taxonomy index...", file=sys.stderr)
+            super().__init__(index_dir)
+            print(f"Loaded: {self.meta['n_names']:,} names, {self.meta['n_nodes']:,} nodes", file=sys.stderr)
+    
+    class PrunedTaxonomyDB(PrunedTaxonomyIndex):
+        \"\"\"Subtrees of the taxonomy index needed by this sample, copied into memory\"\"\"
+        
+        def __init__(self, index_dir, roots, taxids):
+            \"\"\"Keep the subtrees under roots and the lineages of taxids\"\"\"
+            print(f"Loading taxonomy index (pruned to {roots} + {len(taxids):,} observed taxids)...", file=sys.stderr)
+            super().__init__(index_dir, roots=roots, taxids=taxids)
+            print(f"Loaded: {self.n_kept:,} of {self.meta['n_nodes']:,} nodes", file=sys.stderr)
+    
+    def scan_taxids(file_path, chunk_size=CHUNK_SIZE):
+        \"\"\"Taxids in the staxids column of a Diamond output (reads that column only)\"\"\"
+        taxids = set()
+        try:
+            for chunk in pd.read_csv(file_path, sep='\\t', header=None, usecols=[12], dtype=str,
+                                     chunksize=chunk_size):
+                for value in chunk[12].dropna().unique():
+                    taxids.update(parse_staxids(value))
+        except pd.errors.EmptyDataError:
+            pass
+        return taxids
     
-    def parse_diamond_output(file_path):
-        \"\"\"Parse Diamond output file\"\"\"
+    def parse_diamond_output(file_path, chunk_size=CHUNK_SIZE):
+        \"\"\"Parse Diamond output file, yielding DataFrames of at most chunk_size rows\"\"\"
         try:
-            df = pd.read_csv(file_path, sep='\\t', header=None, 
-                           names=['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 
-                                  'gapopen', 'qstart', 'qend', 'sstart', 'send', 
-                                  'evalue', 'bitscore', 'staxids'])
-            return df
+            # staxids stays text so every chunk writes it back unchanged
+            yield from pd.read_csv(file_path, sep='\\t', header=None, names=DIAMOND_COLUMNS,
+                                   dtype={'staxids': str}, chunksize=chunk_size)
         except pd.errors.EmptyDataError:
-            return pd.DataFrame(columns=['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 
-                                        'gapopen', 'qstart', 'qend', 'sstart', 'send', 
-                                        'evalue', 'bitscore', 'staxids'])
+            return
     
     def add_taxonomy_to_dataframe(df, taxonomy_db):
         \"\"\"Add taxonomic information to DataFrame\"\"\"
         if df.empty:
             return df
         
-        print(f"Adding taxonomy info to {len(df):,} records...", file=sys.stderr)
-        
-        lineages = []
-        for idx, row in df.iterrows():
-            if (idx + 1) % 1000 == 0:
-                print(f"  Processing {idx+1:,}/{len(df):,}...", file=sys.stderr)
-            
-            # Convert TaxID to string (handle float format from pandas)
-            if pd.notna(row['staxids']):
-                # Convert float to int to string (455367.0 → 455367 → "455367")
-                try:
-                    taxid = str(int(float(row['staxids'])))
-                except (ValueError, TypeError):
-                    taxid = '0'
-            else:
-                taxid = '0'
+        # One lineage per distinct staxids value (semicolon lists resolve to their LCA),
+        # attached to every hit with a single join; resolved lineages are reused by later chunks
+        lineages = taxonomy_db.lineages_for(df['staxids'])
+        
+        return df.join(lineages)
+    
+    class HashSet:
+        \"\"\"Approximate distinct count of strings, kept as sorted 64-bit hashes (8 bytes per value); two IDs sharing a hash count once\"\"\"
+        
+        def __init__(self):
+            self.hashes = np.empty(0, dtype=np.uint64)
+            self.pending = []
+            self.pending_size = 0
+        
+        def update(self, values):
+            hashes = np.unique(pd.util.hash_pandas_object(values.dropna(), index=False).to_numpy())
+            self.pending.append(hashes)
+            self.pending_size += len(hashes)
+            # Merge once the pending hashes outgrow the merged set (amortized linear)
+            if self.pending_size > max(len(self.hashes), 1 << 20):
+                self.merge()
+        
+        def merge(self):
+            if self.pending:
+                self.hashes = np.unique(np.concatenate([self.hashes] + self.pending))
+                self.pending = []
+                self.pending_size = 0
+        
+        def __len__(self):
+            self.merge()
+            return len(self.hashes)
+    
+    class DiamondStats:
+        \"\"\"Taxonomic statistics of a Diamond output, accumulated one chunk at a time\"\"\"
+        
+        def __init__(self):
+            self.total_hits = 0
+            self.queries = HashSet()
+            self.subjects = HashSet()
+            self.identity_sum = 0.0
+            self.identity_n = 0
+            self.length_sum = 0.0
+            self.length_n = 0
+            self.taxid_counts = Counter()
+            self.phylum_counts = Counter()
+            self.family_counts = Counter()
+        
+        def update(self, df):
+            \"\"\"Fold one annotated chunk into the running aggregates\"\"\"
+            self.total_hits += len(df)
+            self.queries.update(df['qseqid'])
+            self.subjects.update(df['sseqid'])
+            self.identity_sum += df['pident'].sum()
+            self.identity_n += df['pident'].count()
+            self.length_sum += df['length'].sum()
+            self.length_n += df['length'].count()
+            self.taxid_counts.update(staxids_counts(df['staxids']))
             
-            lineage = taxonomy_db.get_lineage(taxid)
-            lineages.append(lineage)
-        
-        # Add taxonomy columns
-        for key in ['organism_name', 'superkingdom', 'kingdom', 'phylum', 
-                    'class', 'order', 'family', 'genus', 'species']:
-            df[key] = [lineage[key] for lineage in lineages]
-        
-        return df
-    
-    def extract_taxonomic_info(df):
-        \"\"\"Extract taxonomic statistics from Diamond output\"\"\"
-        if df.empty:
+            # Taxonomy columns are categorical; skip categories absent from this chunk
+            for column, counter in (('phylum', self.phylum_counts), ('family', self.family_counts)):
+                if column in df.columns:
+                    counts = df[column].value_counts(sort=False)
+                    counter.update({name: int(n) for name, n in counts.items() if n > 0})
+        
+        def result(self):
+            \"\"\"Statistics in the form used by the report writers\"\"\"
             return {
-                'total_hits': 0,
-                'unique_queries': 0,
-                'unique_subjects': 0,
-                'avg_identity': 0,
-                'avg_length': 0,
-                'taxid_counts': Counter(),
-                'phylum_counts': Counter(),
-                'family_counts': Counter()
+                'total_hits': self.total_hits,
+                'unique_queries': len(self.queries),
+                'unique_subjects': len(self.subjects),
+                'avg_identity': self.identity_sum / self.identity_n if self.identity_n else 0,
+                'avg_length': self.length_sum / self.length_n if self.length_n else 0,
+                'taxid_counts': self.taxid_counts,
+                'phylum_counts': self.phylum_counts,
+                'family_counts': self.family_counts
             }
-        
-        stats = {
-            'total_hits': len(df),
-            'unique_queries': df['qseqid'].nunique(),
-            'unique_subjects': df['sseqid'].nunique(),
-            'avg_identity': df['pident'].mean(),
-            'avg_length': df['length'].mean(),
-            'taxid_counts': Counter(df['staxids'].dropna().apply(lambda x: str(int(float(x)))))
-        }
-        
-        # If taxonomy columns exist, count phylum and family
-        if 'phylum' in df.columns:
-            stats['phylum_counts'] = Counter(df['phylum'].dropna())
-            stats['family_counts'] = Counter(df['family'].dropna())
-        
-        return stats
-    
-    # Initialize Taxonomy database
-    taxonomy_db = TaxonomyDB("${taxonomy_names}", "${taxonomy_nodes}")
     
-    # Parse Diamond output files
+    def extract_taxonomic_info(file_path, output_path, taxonomy_db):
+        \"\"\"
+        Stream a Diamond output: annotate each chunk, append it to output_path
+        and return the taxonomic statistics of the whole file
+        \"\"\"
+        stats = DiamondStats()
+        n_chunks = 0
+        with open(output_path, 'w', encoding='utf-8', newline='') as out:
+            for chunk in parse_diamond_output(file_path):
+                chunk = add_taxonomy_to_dataframe(chunk, taxonomy_db)
+                stats.update(chunk)
+                chunk.to_csv(out, sep='\\t', index=False, header=(n_chunks == 0))
+                n_chunks += 1
+            if n_chunks == 0:
+                # Empty input: header-only output
+                pd.DataFrame(columns=DIAMOND_COLUMNS).to_csv(out, sep='\\t', index=False)
+        
+        print(f"Added taxonomy info to {stats.total_hits:,} records in {n_chunks} chunk(s), "
+              f"{len(stats.taxid_counts):,} distinct taxids", file=sys.stderr)
+        return stats.result()
+    
+    # Initialize Taxonomy database (resident server when one answers, else the index)
+    taxonomy_db = TaxonomyClient.connect(TAXONOMY_SERVER)
+    if taxonomy_db is not None:
+        print(f"Using taxonomy server at {TAXONOMY_SERVER}", file=sys.stderr)
+    else:
+        if TAXONOMY_SERVER:
+            print(f"Taxonomy server at {TAXONOMY_SERVER} not answering, loading index", file=sys.stderr)
+        if TAXONOMY_ROOTS:
+            observed = scan_taxids("${megahit_report}") | scan_taxids("${spades_report}")
+            taxonomy_db = PrunedTaxonomyDB("${taxonomy_index}", TAXONOMY_ROOTS, observed)
+        else:
+            taxonomy_db = TaxonomyDB("${taxonomy_index}")
+    
+    # Parse Diamond output files chunk by chunk, saving the enhanced version (with taxonomy)
     print(f"\\nParsing MEGAHIT Diamond results: ${megahit_report}", file=sys.stderr)
-    megahit_df = parse_diamond_output("${megahit_report}")
-    
-    # Add taxonomic information
-    megahit_df_enhanced = add_taxonomy_to_dataframe(megahit_df.copy(), taxonomy_db)
-    megahit_stats = extract_taxonomic_info(megahit_df_enhanced)
-    
-    # Save enhanced version (with taxonomy)
-    megahit_df_enhanced.to_csv("${sample}_megahit_with_taxonomy.txt", sep='\\t', index=False)
+    megahit_stats = extract_taxonomic_info("${megahit_report}", "${sample}_megahit_with_taxonomy.txt", taxonomy_db)
     print(f"MEGAHIT enhanced file saved", file=sys.stderr)
     
     print(f"\\nParsing SPAdes Diamond results: ${spades_report}", file=sys.stderr)
-    spades_df = parse_diamond_output("${spades_report}")
-    
-    # Add taxonomic information
-    spades_df_enhanced = add_taxonomy_to_dataframe(spades_df.copy(), taxonomy_db)
-    spades_stats = extract_taxonomic_info(spades_df_enhanced)
-    
-    # Save enhanced version (with taxonomy)
-    spades_df_enhanced.to_csv("${sample}_spades_with_taxonomy.txt", sep='\\t', index=False)
+    spades_stats = extract_taxonomic_info("${spades_report}", "${sample}_spades_with_taxonomy.txt", taxonomy_db)
     print(f"SPAdes enhanced file saved", file=sys.stderr)
     
     # Generate text report
@@ -803,6 +833,7 @@ workflow.onComplete {
       * *_megahit_diamond.txt: BLAST-style alignment results
     - diamond_spades/: Diamond classification of SPAdes proteins
       * *_spades_diamond.txt: BLAST-style alignment results
+    - taxonomy_index/: Compiled NCBI taxonomy index (built once, reused)
     - merged_reports/: Comprehensive analysis (if enabled)
       * *_merged_report.txt: Combined analysis report
       * *_merged_report.csv: Detailed comparison data
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark Suite for the Kraken2 Results Integration Script
+
+Generates realistic synthetic Kraken2 report pairs (RVDB-like / NCBI-like) and
+records wall time and peak RSS for every stage of integrate_66ce4dde_EN.py:
+parsing, end-to-end integration, sorting, the shared report state and each
+output writer. Results are written as JSON so runs on different versions can
+be compared (--compare).
+
+Cases:
+  - example: the bundled Results-example reports (small real-world case)
+  - synthetic fixtures at 1k / 100k / 1M lines (configurable, cached on disk)
+
+Usage:
+  python3 benchmark_integration.py
+  python3 benchmark_integration.py --sizes 1000,100000 --overlap 0.6
+  python3 benchmark_integration.py --output new.json --compare old.json
+
+Date: 2025-10-07
+Version: 1.0
+"""
+
+import numpy as np
+import pandas as pd
+import sys
+import os
+import gc
+import time
+import json
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+
+import integrate_66ce4dde_EN as integrate
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_DIR = os.path.join(SCRIPT_DIR, '..', 'Results-example')
+EXAMPLE_REPORTS = ('66ce4dde_kraken2_RVDB.txt', '66ce4dde_kraken2_NCBI.txt')
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+RESULTS_VERSION = 1
+
+# --compare flags stages at least this much slower than the baseline
+REGRESSION_RATIO = 1.2
+REGRESSION_MIN_SECONDS = 0.05
+
+# Virus subtree ranks below "Viruses" (R1), in parent -> child order
+MAIN_RANKS = ['R2', 'K', 'P', 'C', 'O', 'F', 'G', 'S']
+
+# Rank mix of generated taxa (follows the bundled NCBI report) and the rank
+# each one hangs from; intermediate ranks (F1, S1, ...) nest below their base rank
+RANK_MIX = {
+    'S': 0.28, 'S1': 0.24, 'G': 0.22, 'F': 0.06, 'S2': 0.045, 'F1': 0.04,
+    'O': 0.03, 'C': 0.02, 'C1': 0.017, 'G1': 0.015, 'S3': 0.01, 'P': 0.01,
+    'K': 0.005, 'O1': 0.005, 'R2': 0.003
+}
+PARENT_RANK = {
+    'R2': 'R1', 'K': 'R2', 'P': 'K', 'C': 'P', 'C1': 'C', 'O': 'C', 'O1': 'O',
+    'F': 'O', 'F1': 'F', 'G': 'F', 'G1': 'G', 'S': 'G', 'S1': 'S', 'S2': 'S1', 'S3': 'S2'
+}
+
+# Share of taxa without direct reads (Kraken2 lists them for their subtree)
+ZERO_DIRECT_FRACTION = {'S': 0.35, 'S1': 0.3, 'S2': 0.3, 'S3': 0.3}
+DEFAULT_ZERO_DIRECT_FRACTION = 0.6
+
+# Integrated table sort (same keys as integrate_results)
+SORT_KEYS = ['Priority', 'Rank_Priority', 'Max_Direct_Reads']
+SORT_ASCENDING = [True, True, False]
+
+
+def generate_taxonomy(n_taxa, rng):
+    """
+    Generate a random virus taxonomy tree
+
+    Parameters:
+        n_taxa: Number of taxa below "Viruses"
+        rng: numpy random Generator
+
+    Returns:
+        (parents, ranks): parent index of every taxon (-1 = Viruses) and rank codes;
+        parents always precede their children
+    """
+    # One full lineage first so every parent rank has a candidate
+    parents = list(range(-1, len(MAIN_RANKS) - 1))
+    ranks = list(MAIN_RANKS)
+    pools = {rank: [i] for i, rank in enumerate(MAIN_RANKS)}
+
+    mix_ranks = list(RANK_MIX)
+    mix_weights = np.array([RANK_MIX[r] for r in mix_ranks])
+    drawn = rng.choice(len(mix_ranks), size=max(n_taxa - len(MAIN_RANKS), 0),
+                       p=mix_weights / mix_weights.sum())
+    picks = rng.random(len(drawn))
+
+    for code, pick in zip(drawn, picks):
+        rank = mix_ranks[code]
+        parent_rank = PARENT_RANK[rank]
+        if parent_rank == 'R1':
+            parent = -1
+        else:
+            # Nested intermediate ranks may be missing yet; fall back to the base rank
+            while parent_rank not in pools:
+                parent_rank = PARENT_RANK[parent_rank]
+            pool = pools[parent_rank]
+            # Skew towards recently created parents: realistic bushy genera/families
+            parent = pool[min(int(len(pool) * (1 - pick ** 3)), len(pool) - 1)]
+        pools.setdefault(rank, []).append(len(ranks))
+        parents.append(parent)
+        ranks.append(rank)
+
+    return np.array(parents, dtype='int64'), np.array(ranks, dtype=object)
+
+
+def simulate_direct_reads(ranks, rng, scale=1.0):
+    """
+    Simulate heavy-tailed direct read counts, with many zero-read parent taxa
+    """
+    zero_fraction = np.array([ZERO_DIRECT_FRACTION.get(r, DEFAULT_ZERO_DIRECT_FRACTION) for r in ranks])
+    reads = np.floor(rng.lognormal(mean=1.5, sigma=2.0, size=len(ranks)) * scale).astype('int64')
+    reads[rng.random(len(ranks)) < zero_fraction] = 0
+    return reads
+
+
+def write_kraken_report(path, parents, ranks, taxids, names, reads_direct,
+                        unclassified, root_direct):
+    """
+    Write a Kraken2 report: clade totals, percentages, depth indentation and
+    children ordered by clade reads (as kraken2 --report does)
+
+    Parameters:
+        parents / ranks / taxids / names / reads_direct: Taxa below "Viruses"
+        unclassified: Unclassified read count
+        root_direct: (root, Viruses) direct read counts
+    """
+    n = len(parents)
+    reads_total = reads_direct.copy()
+    for i in range(n - 1, -1, -1):
+        if parents[i] >= 0:
+            reads_total[parents[i]] += reads_total[i]
+    top_level = parents < 0
+    viruses_total = int(reads_total[top_level].sum()) + root_direct[1]
+    root_total = viruses_total + root_direct[0]
+    grand_total = root_total + unclassified
+
+    children = [[] for _ in range(n)]
+    top = []
+    for i in np.argsort(-reads_total, kind='stable'):
+        (top if parents[i] < 0 else children[parents[i]]).append(i)
+
+    def line(total, direct, rank, taxid, depth, name):
+        return (f"{100.0 * total / grand_total:6.2f}\t{total}\t{direct}\t{rank}\t"
+                f"{taxid}\t{'  ' * depth}{name}\n")
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(line(unclassified, unclassified, 'U', 0, 0, 'unclassified'))
+        f.write(line(root_total, root_direct[0], 'R', 1, 0, 'root'))
+        f.write(line(viruses_total, root_direct[1], 'R1', 10239, 1, 'Viruses'))
+        stack = [(i, 2) for i in reversed(top)]
+        while stack:
+            i, depth = stack.pop()
+            f.write(line(int(reads_total[i]), int(reads_direct[i]), ranks[i],
+                         int(taxids[i]), depth, names[i]))
+            stack.extend((child, depth + 1) for child in reversed(children[i]))
+
+
+def generate_report_pair(n_lines, rvdb_file, ncbi_file, overlap=0.5, seed=42):
+    """
+    Generate an RVDB-like / NCBI-like report pair over one shared taxonomy
+
+    Parameters:
+        n_lines: Lines per report (including unclassified/root/Viruses)
+        overlap: Fraction of taxa reported under the same taxid by both databases;
+                 the rest get database-specific taxids and names
+        seed: Random seed (fixtures are reproducible)
+    """
+    rng = np.random.default_rng(seed)
+    parents, ranks = generate_taxonomy(max(n_lines - 3, len(MAIN_RANKS)), rng)
+    n = len(parents)
+
+    taxids = rng.choice(np.arange(11, 3000000), size=n, replace=False)
+    names = np.array([f"Synthetic virus {t}" for t in taxids], dtype=object)
+
+    # NCBI-like database: same tree, own read counts, non-shared taxa renamed
+    shared = rng.random(n) < overlap
+    shared[:len(MAIN_RANKS)] = True
+    ncbi_taxids = np.where(shared, taxids, taxids + 3000000)
+    ncbi_names = np.where(shared, names, np.array([f"Synthetic virus {t}" for t in ncbi_taxids],
+                                                   dtype=object))
+
+    write_kraken_report(rvdb_file, parents, ranks, taxids, names,
+                        simulate_direct_reads(ranks, rng), 700000, (300, 30000))
+    write_kraken_report(ncbi_file, parents, ranks, ncbi_taxids, ncbi_names,
+                        simulate_direct_reads(ranks, rng, scale=0.2), 900000, (500, 5000))
+
+
+def fixture_paths(fixtures_dir, n_lines, overlap, seed):
+    """
+    Fixture file pair for one synthetic case, generated on first use
+    """
+    stem = os.path.join(fixtures_dir, f"synthetic_{n_lines}_ov{overlap:g}_s{seed}")
+    rvdb_file, ncbi_file = f"{stem}_kraken2_RVDB.txt", f"{stem}_kraken2_NCBI.txt"
+    if not (os.path.exists(rvdb_file) and os.path.exists(ncbi_file)):
+        os.makedirs(fixtures_dir, exist_ok=True)
+        print(f"  Generating {n_lines}-line fixtures in {fixtures_dir}...")
+        generate_report_pair(n_lines, rvdb_file, ncbi_file, overlap, seed)
+    return rvdb_file, ncbi_file
+
+
+def _count_lines(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+
+def measure(stage, func, repeat=1):
+    """
+    Run one benchmark stage with console output suppressed
+
+    Returns:
+        (last return value, metrics dict: best wall time, all wall times, RSS before
+        the stage, peak RSS during it, and whether the peak is stage-scoped)
+    """
+    times = []
+    peak = 0.0
+    rss_before = None
+    scoped = True
+    for _ in range(repeat):
+        gc.collect()
+        scoped = integrate.reset_peak_rss() and scoped
+        rss_before = integrate.current_rss_mb()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+        peak = max(peak, integrate.peak_rss_mb())
+    metrics = {
+        'stage': stage,
+        'wall_s': round(min(times), 6),
+        'wall_s_all': [round(t, 6) for t in times],
+        'rss_before_mb': round(rss_before, 1) if rss_before is not None else None,
+        'peak_rss_mb': round(peak, 1),
+        'peak_rss_scope': 'stage' if scoped else 'process'
+    }
+    return result, metrics
+
+
+def benchmark_case(case, rvdb_file, ncbi_file, workdir, repeat=1):
+    """
+    Benchmark every integration stage on one report pair
+
+    Returns:
+        List of per-stage result records
+    """
+    prefix = os.path.join(workdir, case)
+    thresholds = (100, 50, 0)
+    records = []
+
+    def record(stage, func, rows=None):
+        result, metrics = measure(stage, func, repeat)
+        metrics['rows'] = rows(result) if rows else None
+        records.append(metrics)
+        print(f"  {stage:<24} {metrics['wall_s']:>10.4f} s  {metrics['peak_rss_mb']:>9.1f} MB")
+        return result
+
+    reports = record('parse', lambda: (integrate.parse_kraken_report(rvdb_file),
+                                       integrate.parse_kraken_report(ncbi_file)),
+                     rows=lambda r: len(r[0]) + len(r[1]))
+    del reports
+    df = record('integrate_total', lambda: integrate.integrate_results(
+        rvdb_file, ncbi_file, output_prefix=prefix, sample_id=case), rows=len)
+
+    shuffled = df.sample(frac=1.0, random_state=0)
+    record('sort', lambda: shuffled.sort_values(SORT_KEYS, ascending=SORT_ASCENDING, kind='stable'),
+           rows=len)
+    del shuffled
+
+    record('write_full_tsv', lambda: df.to_csv(f"{prefix}_full.tsv", sep='\t', index=False,
+                                               encoding='utf-8'))
+    try:
+        import pyarrow  # noqa: F401
+        for output_format in ('parquet', 'feather'):
+            record(f'write_full_{output_format}', lambda fmt=output_format: integrate.write_columnar(
+                df, f"{prefix}_full.{fmt}", fmt))
+    except ImportError:
+        print("  ⚠️  pyarrow not installed, skipping parquet/feather writers")
+
+    state = record('report_state', lambda: integrate.build_report_state(df))
+    record('print_summary', lambda: integrate.print_summary_statistics(state))
+    outputs = {'full': f"{prefix}_full.tsv"}
+    (outputs['high_confidence_species'],
+     outputs['high_confidence_all']) = record('write_high_confidence',
+                                              lambda: integrate.write_high_confidence(state, prefix))
+    outputs['candidate_viruses'] = record('write_candidate_viruses',
+                                          lambda: integrate.write_candidate_viruses(state, prefix))
+    outputs['venn'] = record('write_venn_data',
+                             lambda: integrate.write_venn_data(state, prefix, case))
+    record('write_summary_report', lambda: integrate.write_summary_report(
+        state, prefix, case, rvdb_file, ncbi_file, thresholds, outputs))
+
+    lines = _count_lines(rvdb_file) + _count_lines(ncbi_file)
+    for metrics in records:
+        metrics['case'] = case
+        metrics['input_lines'] = lines
+    return records
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(current, baseline_file):
+    """
+    Print per-stage wall time and peak RSS ratios against an earlier results file
+    """
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['case'], r['stage']): r for r in baseline['results']}
+
+    print("\n" + "="*70)
+    print(f"Comparison with {baseline_file} (version {baseline.get('git_commit') or 'unknown'})")
+    print("="*70)
+    print(f"{'Case':<18} {'Stage':<24} {'Time ratio':>10} {'RSS ratio':>10}")
+    for r in current['results']:
+        old = previous.get((r['case'], r['stage']))
+        if old is None:
+            continue
+        time_ratio = r['wall_s'] / old['wall_s'] if old['wall_s'] else float('nan')
+        rss_ratio = r['peak_rss_mb'] / old['peak_rss_mb'] if old['peak_rss_mb'] else float('nan')
+        # Sub-50 ms stages are dominated by timer noise
+        slower = r['wall_s'] - old['wall_s'] > REGRESSION_MIN_SECONDS
+        flag = '  ⚠️' if time_ratio > REGRESSION_RATIO and slower else ''
+        print(f"{r['case']:<18} {r['stage']:<24} {time_ratio:>9.2f}x {rss_ratio:>9.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Kraken2 integration script on synthetic and example reports")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Synthetic report sizes in lines (default 1000,100000,1000000)")
+    parser.add_argument('--overlap', type=float, default=0.5,
+                        help="Fraction of taxa shared by the two databases (default 0.5)")
+    parser.add_argument('--seed', type=int, default=42, help="Fixture random seed (default 42)")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Runs per stage, the best wall time is reported (default 1)")
+    parser.add_argument('--fixtures-dir', default='benchmark_fixtures',
+                        help="Directory for generated fixtures (reused across runs)")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="Machine-readable results file (default benchmark_results.json)")
+    parser.add_argument('--compare', metavar='RESULTS_JSON',
+                        help="Earlier results file to compare against")
+    parser.add_argument('--no-example', action='store_true',
+                        help="Skip the bundled Results-example case")
+    parser.add_argument('--generate-only', action='store_true',
+                        help="Only generate the synthetic fixtures")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    if not 0.0 <= args.overlap <= 1.0:
+        print("Error: --overlap must be between 0 and 1")
+        sys.exit(1)
+
+    cases = []
+    example = [os.path.join(EXAMPLE_DIR, name) for name in EXAMPLE_REPORTS]
+    if not args.no_example:
+        if all(os.path.exists(path) for path in example):
+            cases.append(('example', *example))
+        else:
+            print(f"⚠️  Results-example reports not found in {EXAMPLE_DIR}, skipping example case")
+    for n_lines in sizes:
+        cases.append((f"synthetic_{n_lines}",
+                      *fixture_paths(args.fixtures_dir, n_lines, args.overlap, args.seed)))
+    if args.generate_only:
+        print(f"✅ Fixtures ready in {args.fixtures_dir}")
+        return
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'parameters': {'sizes': sizes, 'overlap': args.overlap, 'seed': args.seed,
+                       'repeat': args.repeat},
+        'results': []
+    }
+
+    with tempfile.TemporaryDirectory(prefix='integration_bench_') as workdir:
+        for case, rvdb_file, ncbi_file in cases:
+            print("\n" + "="*70)
+            print(f"Benchmark case: {case}")
+            print("="*70)
+            results['results'].extend(benchmark_case(case, rvdb_file, ncbi_file, workdir, args.repeat))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Benchmark results saved to: {args.output}")
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
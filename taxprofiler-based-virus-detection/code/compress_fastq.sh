@@ -7,6 +7,16 @@ echo
 
 DATA_DIR="/scratch/sp96859/Meta-genome-data-analysis/Apptainer/taxprofiler/data/reads"
 
+# Multi-threaded BGZF compression with built-in verification (shared with the main workflow)
+BGZF_TOOL="${BGZF_TOOL:-$(cd "$(dirname "$0")/../../code/bin" 2>/dev/null && pwd)/bgzf.py}"
+THREADS="${THREADS:-${SLURM_CPUS_PER_TASK:-$(nproc)}}"
+
+if [ -f "$BGZF_TOOL" ]; then
+    echo "Compressor: $BGZF_TOOL (BGZF, $THREADS threads)"
+else
+    echo "⚠️ bgzf.py not found ($BGZF_TOOL), falling back to gzip"
+fi
+
 echo "🔍 Searching for FASTQ files to compress..."
 echo "Search directory: $DATA_DIR"
 echo
@@ -20,26 +30,27 @@ find "$DATA_DIR" -name "*.fastq" -not -name "*.gz" 2>/dev/null | while read fast
         echo "   Input: $fastq_file"
         echo "   Output: $compressed_file"
         
-        # Compress file using gzip
-        gzip -c "$fastq_file" > "$compressed_file"
+        # Compress to BGZF; the output is read back and checked against the input (CRC-32 and size)
+        if [ -f "$BGZF_TOOL" ]; then
+            python3 "$BGZF_TOOL" compress "$fastq_file" -o "$compressed_file" --threads "$THREADS"
+            status=$?
+        else
+            gzip -c "$fastq_file" > "$compressed_file" && gzip -t "$compressed_file" 2>/dev/null
+            status=$?
+        fi
         
-        if [ $? -eq 0 ]; then
+        if [ $status -eq 0 ]; then
             echo "   ✅ Compression successful"
+            echo "   ✅ Compressed file verification passed"
             
             # Display file size comparison
             original_size=$(du -h "$fastq_file" | cut -f1)
             compressed_size=$(du -h "$compressed_file" | cut -f1)
             echo "   Original size: $original_size"
             echo "   Compressed size: $compressed_size"
-            
-            # Verify compressed file
-            if gzip -t "$compressed_file" 2>/dev/null; then
-                echo "   ✅ Compressed file verification passed"
-            else
-                echo "   ❌ Compressed file verification failed"
-            fi
         else
-            echo "   ❌ Compression failed"
+            echo "   ❌ Compression or verification failed"
+            rm -f "$compressed_file" "${compressed_file}.bgzi"
         fi
         echo
     fi
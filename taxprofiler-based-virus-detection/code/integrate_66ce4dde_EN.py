@@ -8,63 +8,229 @@ Input files:
   - 66ce4dde_kraken2_RVDB.txt
   - 66ce4dde_kraken2_NCBI.txt
 
+Cohort mode (--batch) integrates every sample of a taxprofiler results
+directory in parallel and writes a combined cohort table.
+
 Author: Cursor AI Assistant
 Date: 2025-10-07
-Version: 2.0
+Version: 2.1
 """
 
+import numpy as np
 import pandas as pd
 import sys
 import os
+import csv
+import glob
+import argparse
+import contextlib
+import hashlib
+import json
+import pickle
+import resource
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Output formats for the integrated table (parquet/feather require pyarrow)
+OUTPUT_FORMATS = ['tsv', 'parquet', 'feather']
+
+# Confidence classes in output order (also the ordered categorical of columnar output)
+CONFIDENCE_LEVELS = ['High', 'Medium-High', 'Medium', 'Low-Medium', 'Low']
+
+# Default taxprofiler database names (db_name column of databases.csv)
+DEFAULT_RVDB_DB = 'kraken2_RVDB'
+DEFAULT_NCBI_DB = 'kraken2_NCBI'
+
+# Kraken2 report format (6 tab-separated columns, no header):
+# Percentage  Total_reads  Direct_reads  Rank  NCBI_TaxID  Name
+KRAKEN_REPORT_COLUMNS = ['percent', 'reads_total', 'reads_direct', 'rank', 'taxid', 'name']
+KRAKEN_REPORT_DTYPES = {
+    'percent': 'float64',
+    'reads_total': 'int64',
+    'reads_direct': 'int64',
+    'rank': 'category',
+    'taxid': 'int64',
+    'name': 'str'
+}
+
+# Parsed-report cache: bump the version whenever the parsed layout changes
+REPORT_CACHE_VERSION = 1
+DEFAULT_CACHE_MAX_MB = 2048
+
+def read_kraken_report(report_file, min_direct_reads=0):
+    """
+    Columnar read of a Kraken2 report
+    
+    The six report columns are loaded in one read with typed arrays and
+    filtered with a vector mask, instead of splitting and casting line by line.
+    
+    Returns:
+        DataFrame indexed by NCBI taxid (int) with columns
+        percent, reads_total, reads_direct, rank, name
+    """
+    try:
+        report = pd.read_csv(report_file, sep='\t', header=None,
+                             names=KRAKEN_REPORT_COLUMNS,
+                             usecols=range(len(KRAKEN_REPORT_COLUMNS)),
+                             dtype=KRAKEN_REPORT_DTYPES,
+                             quoting=csv.QUOTE_NONE,
+                             encoding='utf-8')
+    except pd.errors.EmptyDataError:
+        report = pd.DataFrame({col: pd.Series(dtype=dtype)
+                               for col, dtype in KRAKEN_REPORT_DTYPES.items()})
+    
+    # Only retain classifications with direct read assignments
+    # This avoids counting parent-level summaries (Kingdom, Phylum, etc.)
+    report = report[report['reads_direct'].to_numpy() > min_direct_reads]
+    
+    # Names carry the report's indentation; strip only the retained rows
+    report = report.assign(rank=report['rank'].str.strip(),
+                           name=report['name'].str.strip())
+    return report.set_index('taxid')
+
+def _file_sha256(path):
+    """SHA-256 of a file's content, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _atomic_pickle(obj, path):
+    """Write a pickle via a temporary file so concurrent readers never see partial data"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
 
-def parse_kraken_report(report_file, min_direct_reads=0):
+def load_cached_report(report_file, cache_dir):
+    """
+    Look up a parsed report in the on-disk cache
+    
+    Entries are keyed by the SHA-256 of the report content. A small per-path
+    stat record (size, mtime, hash) lets unchanged files skip re-hashing; if
+    size or mtime changed the content is hashed again, so a touched but
+    identical file still hits. Entries are validated against size, hash,
+    cache version and pandas version.
+    
+    Returns:
+        (report DataFrame or None on miss, content hash)
+    """
+    stat = os.stat(report_file)
+    stat_file = os.path.join(
+        cache_dir, hashlib.sha256(os.path.abspath(report_file).encode()).hexdigest() + '.stat')
+    
+    content_hash = None
+    try:
+        with open(stat_file, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        if record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+            content_hash = record['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+    
+    if content_hash is None:
+        content_hash = _file_sha256(report_file)
+        try:
+            tmp_path = f"{stat_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                           'sha256': content_hash}, f)
+            os.replace(tmp_path, stat_file)
+        except OSError:
+            pass
+    
+    entry_file = os.path.join(cache_dir, content_hash + '.pkl')
+    try:
+        with open(entry_file, 'rb') as f:
+            entry = pickle.load(f)
+        if (entry.get('version') == REPORT_CACHE_VERSION
+                and entry.get('pandas') == pd.__version__
+                and entry.get('size') == stat.st_size
+                and entry.get('sha256') == content_hash):
+            os.utime(entry_file)   # mark as recently used for eviction
+            return entry['report'], content_hash
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+        pass
+    return None, content_hash
+
+def store_cached_report(report, report_file, content_hash, cache_dir,
+                        cache_max_mb=DEFAULT_CACHE_MAX_MB):
+    """
+    Store a parsed report in the cache, then evict least recently used entries
+    until the cache is below cache_max_mb
+    """
+    entry = {
+        'version': REPORT_CACHE_VERSION,
+        'pandas': pd.__version__,
+        'size': os.path.getsize(report_file),
+        'sha256': content_hash,
+        'report': report
+    }
+    _atomic_pickle(entry, os.path.join(cache_dir, content_hash + '.pkl'))
+    
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pkl'):
+            try:
+                st = os.stat(os.path.join(cache_dir, name))
+                entries.append((st.st_mtime, st.st_size, name))
+            except OSError:
+                pass
+    total = sum(size for _, size, _ in entries)
+    limit = cache_max_mb * 1024 * 1024
+    for _, size, name in sorted(entries):
+        if total <= limit:
+            break
+        if name == content_hash + '.pkl':
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, name))
+            total -= size
+        except OSError:
+            pass
+
+def parse_kraken_report(report_file, min_direct_reads=0, cache_dir=None,
+                        cache_max_mb=DEFAULT_CACHE_MAX_MB):
     """
     Parse Kraken2 report file, retaining only classifications with direct read assignments
     
     Parameters:
         report_file: Path to Kraken2 report file
         min_direct_reads: Minimum direct reads (default 0, retains all with direct reads)
+        cache_dir: Optional parsed-report cache directory; the cache holds all
+                   taxa with direct reads, so threshold changes still hit it
+        cache_max_mb: Cache size bound, least recently used entries are evicted
     
     Returns:
-        Dictionary containing all classifications with direct read assignments
+        DataFrame indexed by NCBI taxid (int) with columns
+        percent, reads_total, reads_direct, rank, name
     """
     print(f"Parsing: {report_file}")
-    results = {}
     
     try:
-        with open(report_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                # Kraken2 report format:
-                # Percentage  Total_reads  Direct_reads  Rank  NCBI_TaxID  Name
-                fields = line.strip().split('\t')
-                
-                if len(fields) >= 6:
-                    percent = float(fields[0].strip())
-                    reads_total = int(fields[1].strip())
-                    reads_direct = int(fields[2].strip())
-                    rank = fields[3].strip()
-                    taxid = fields[4].strip()
-                    name = fields[5].strip()
-                    
-                    # Only retain classifications with direct read assignments
-                    # This avoids counting parent-level summaries (Kingdom, Phylum, etc.)
-                    if reads_direct > min_direct_reads:
-                        results[name] = {
-                            'percent': percent,
-                            'reads_total': reads_total,
-                            'reads_direct': reads_direct,
-                            'rank': rank,
-                            'taxid': taxid
-                        }
+        if cache_dir and min_direct_reads >= 0:
+            os.makedirs(cache_dir, exist_ok=True)
+            results, content_hash = load_cached_report(report_file, cache_dir)
+            if results is not None:
+                print(f"  - Loaded from cache ({content_hash[:12]})")
+            else:
+                results = read_kraken_report(report_file)
+                try:
+                    store_cached_report(results, report_file, content_hash,
+                                        cache_dir, cache_max_mb)
+                except OSError as e:
+                    print(f"  - Warning: Cannot write report cache: {e}")
+            if min_direct_reads > 0:
+                results = results[results['reads_direct'].to_numpy() > min_direct_reads]
+        else:
+            results = read_kraken_report(report_file, min_direct_reads)
         
         print(f"  - Parsed {len(results)} classification entries with direct reads")
         
         # Count by taxonomic rank
-        rank_counts = {}
-        for data in results.values():
-            rank = data['rank']
-            rank_counts[rank] = rank_counts.get(rank, 0) + 1
+        rank_counts = results['rank'].value_counts()
         
         print(f"  - Rank distribution: ", end="")
         rank_names = {'S': 'Species', 'G': 'Genus', 'F': 'Family', 'O': 'Order', 
@@ -81,6 +247,93 @@ def parse_kraken_report(report_file, min_direct_reads=0):
         print(f"Error message: {e}")
         sys.exit(1)
 
+def current_rss_mb():
+    """
+    Current resident set size in MB (Linux /proc; None where unavailable)
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss():
+    """
+    Reset the kernel's peak RSS mark so the next peak_rss_mb() covers one stage
+    
+    Returns:
+        False where unsupported (the peak then covers the whole process)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """
+    Peak resident set size in MB since process start or the last reset_peak_rss()
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+class StageMetrics:
+    """
+    Per-stage durations, row counts and peak memory of one integration run
+    
+    Stages run back to back, so each lap() closes the stage that started at the
+    previous lap (or at construction) and opens the next one.
+    """
+    
+    def __init__(self, sample_id):
+        self.sample_id = sample_id
+        self.stages = []
+        self.started = time.perf_counter()
+        self._lap_start = self.started
+        self._peak_scoped = reset_peak_rss()
+    
+    def lap(self, stage, rows=None):
+        """
+        Record the stage that just finished and start timing the next one
+        """
+        now = time.perf_counter()
+        peak = peak_rss_mb()
+        self.stages.append({
+            'stage': stage,
+            'seconds': round(now - self._lap_start, 6),
+            'rows': None if rows is None else int(rows),
+            'peak_rss_mb': round(peak, 1),
+            'peak_rss_scope': 'stage' if self._peak_scoped else 'process'
+        })
+        self._peak_scoped = reset_peak_rss()
+        self._lap_start = time.perf_counter()
+    
+    def write(self, output_file, **info):
+        """
+        Write the metrics JSON sidecar (info: extra top-level fields)
+        """
+        metrics = {
+            'sample_id': self.sample_id,
+            **info,
+            'total_seconds': round(time.perf_counter() - self.started, 6),
+            'peak_rss_mb': round(max((stage['peak_rss_mb'] for stage in self.stages), default=0.0), 1),
+            'stages': self.stages
+        }
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2)
+        return output_file
+
 def get_rank_priority(rank):
     """
     Get taxonomic rank priority (for sorting)
@@ -123,308 +376,389 @@ def get_rank_name(rank):
     }
     return rank_names.get(rank, rank)
 
-def integrate_results(rvdb_file, ncbi_file, 
-                     reads_threshold_high=100, 
-                     reads_threshold_medium=50,
-                     min_direct_reads=0,
-                     output_prefix='66ce4dde_integrated'):
+def infer_sample_id(report_file):
     """
-    Integrate classification results from two databases (improved version - only counts direct reads)
+    Infer the sample ID from a Kraken2 report filename
     
-    Parameters:
-        rvdb_file: RVDB database result file
-        ncbi_file: NCBI RefSeq database result file
-        reads_threshold_high: High confidence reads threshold
-        reads_threshold_medium: Medium confidence reads threshold
-        min_direct_reads: Minimum direct reads
-        output_prefix: Output file prefix
+    Handles both the renamed layout (66ce4dde_kraken2_RVDB.txt) and the
+    taxprofiler layout (66ce4dde_run_001_kraken2_RVDB.kraken2.kraken2.report.txt).
     """
+    name = os.path.basename(report_file)
+    if '_kraken2' in name:
+        return name.split('_kraken2')[0]
+    return name.split('.')[0]
+
+def join_reports(rvdb_results, ncbi_results):
+    """
+    One outer join of both parsed reports on taxid (so homonyms are not merged)
     
-    print("\n" + "="*70)
-    print("Kraken2 Results Integration Analysis (Improved v2)")
-    print("Sample: 66ce4dde")
-    print("Improvement: Only counts classifications with direct reads, avoiding parent duplication")
-    print("="*70 + "\n")
+    Returns:
+        DataFrame with *_rvdb / *_ncbi columns and a _merge indicator column
+        (left_only = RVDB only, right_only = NCBI only, both)
+    """
+    return pd.merge(rvdb_results, ncbi_results, how='outer',
+                    left_index=True, right_index=True,
+                    suffixes=('_rvdb', '_ncbi'), indicator=True)
+
+def to_columnar_dtypes(df):
+    """
+    Convert the integrated table to compact dtypes for columnar output
     
-    # Parse both report files (only retain classifications with direct reads)
-    rvdb_results = parse_kraken_report(rvdb_file, min_direct_reads)
-    ncbi_results = parse_kraken_report(ncbi_file, min_direct_reads)
-    
-    # Get all detected taxon names
-    all_taxa = set(rvdb_results.keys()) | set(ncbi_results.keys())
-    print(f"\nTotal detected: {len(all_taxa)} classification entries with direct reads")
-    
-    # Integration results
-    integrated = []
-    
-    for taxon in all_taxa:
-        rvdb_data = rvdb_results.get(taxon, {
-            'percent': 0, 
-            'reads_total': 0, 
-            'reads_direct': 0,
-            'rank': 'U',
-            'taxid': 'N/A'
-        })
-        
-        ncbi_data = ncbi_results.get(taxon, {
-            'percent': 0, 
-            'reads_total': 0,
-            'reads_direct': 0,
-            'rank': 'U',
-            'taxid': 'N/A'
-        })
-        
-        # Check if detected in both databases
-        in_rvdb = taxon in rvdb_results
-        in_ncbi = taxon in ncbi_results
-        in_both = in_rvdb and in_ncbi
-        
-        # Get maximum direct reads (this is the true read count)
-        max_direct_reads = max(rvdb_data['reads_direct'], ncbi_data['reads_direct'])
-        max_percent = max(rvdb_data['percent'], ncbi_data['percent'])
-        
-        # Determine confidence level (based on new principles)
-        # Two-dimensional classification: detection condition + read count
-        if in_both:
-            # Both databases detected
-            if max_direct_reads >= reads_threshold_high:
-                confidence = 'High'
-                priority = 1
-                description = 'BothDB-HighReads(≥100)'
-            elif max_direct_reads >= reads_threshold_medium:
-                confidence = 'Medium-High'
-                priority = 2
-                description = 'BothDB-MediumReads(50-99)'
-            else:
-                confidence = 'Low'
-                priority = 5
-                description = 'BothDB-LowReads(<50)'
-        else:
-            # Single database detected
-            source = 'RVDB' if in_rvdb else 'NCBI'
-            if max_direct_reads >= reads_threshold_high:
-                confidence = 'Medium'
-                priority = 3
-                description = f'{source}Only-HighReads(≥100)'
-            elif max_direct_reads >= reads_threshold_medium:
-                confidence = 'Low-Medium'
-                priority = 4
-                description = f'{source}Only-MediumReads(50-99)'
-            else:
-                confidence = 'Low'
-                priority = 5
-                description = f'{source}Only-LowReads(<50)'
-        
-        # Get taxonomic rank (prefer the one with data)
-        rank = rvdb_data['rank'] if in_rvdb else ncbi_data['rank']
-        taxid = rvdb_data['taxid'] if in_rvdb else ncbi_data['taxid']
-        
-        # Calculate average percentage
-        if in_both:
-            avg_percent = (rvdb_data['percent'] + ncbi_data['percent']) / 2
-        else:
-            avg_percent = max_percent
-        
-        integrated.append({
-            'Taxon_Name': taxon,
-            'Rank': rank,
-            'Rank_Name': get_rank_name(rank),
-            'Rank_Priority': get_rank_priority(rank),
-            'NCBI_TaxID': taxid,
-            'Confidence': confidence,
-            'Priority': priority,
-            'Description': description,
-            'In_Both': 'Yes' if in_both else 'No',
-            'In_RVDB': 'Yes' if in_rvdb else 'No',
-            'In_NCBI': 'Yes' if in_ncbi else 'No',
-            'RVDB_Reads_Direct': rvdb_data['reads_direct'],
-            'RVDB_Reads_Total': rvdb_data['reads_total'],
-            'RVDB_Percent': rvdb_data['percent'],
-            'NCBI_Reads_Direct': ncbi_data['reads_direct'],
-            'NCBI_Reads_Total': ncbi_data['reads_total'],
-            'NCBI_Percent': ncbi_data['percent'],
-            'Max_Direct_Reads': max_direct_reads,
-            'Max_Percent': max_percent,
-            'Avg_Percent': avg_percent
-        })
+    Low-cardinality text columns become dictionary-encoded categoricals,
+    counts and codes become the smallest fixed-width integers that hold them.
+    """
+    dtypes = {
+        'Taxon_Name': 'string',
+        'Rank': 'category',
+        'Rank_Name': 'category',
+        'Rank_Priority': 'uint8',
+        'NCBI_TaxID': 'uint32',
+        'Confidence': pd.CategoricalDtype(CONFIDENCE_LEVELS, ordered=True),
+        'Priority': 'uint8',
+        'Description': 'category',
+        'In_Both': pd.CategoricalDtype(['No', 'Yes']),
+        'In_RVDB': pd.CategoricalDtype(['No', 'Yes']),
+        'In_NCBI': pd.CategoricalDtype(['No', 'Yes']),
+        'Support': 'uint8',
+        'N_Databases': 'uint8',
+        'Detected_In': 'category',
+        'Sample': 'category'
+    }
+    columnar = df.reset_index(drop=True)
+    columnar = columnar.astype({col: dtype for col, dtype in dtypes.items() if col in columnar.columns})
+    for col in [c for c in columnar.columns if c.startswith('In_') and c not in dtypes]:
+        columnar[col] = columnar[col].astype(pd.CategoricalDtype(['No', 'Yes']))
+    for col in [c for c in columnar.columns if 'Reads' in c]:
+        dtype = 'uint32' if columnar[col].to_numpy().max(initial=0) < 2**32 else 'uint64'
+        columnar[col] = columnar[col].astype(dtype)
+    return columnar
+
+def write_columnar(df, output_file, output_format):
+    """
+    Write the integrated table as Parquet or Feather
     
-    # Convert to DataFrame
-    df = pd.DataFrame(integrated)
+    Parquet files get one row group per confidence class: rows are stably
+    sorted by Priority first, so a cohort table (concatenated per sample)
+    keeps its sample order within each class. Readers filtering on
+    Confidence only decode the matching groups; the high confidence and
+    candidate subsets are read as filters on this file instead of being
+    written as separate copies.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print(f"Error: {output_format} output requires pyarrow (pip install pyarrow)")
+        sys.exit(1)
     
-    # Sort: by priority, then rank, then direct reads
-    df = df.sort_values(
-        ['Priority', 'Rank_Priority', 'Max_Direct_Reads'], 
-        ascending=[True, True, False]
-    )
+    columnar = to_columnar_dtypes(df)
+    if output_format == 'parquet':
+        columnar = columnar.sort_values('Priority', kind='stable', ignore_index=True)
+    table = pa.Table.from_pandas(columnar, preserve_index=False)
     
-    # Save complete results
-    full_output = f"{output_prefix}_full.tsv"
-    df.to_csv(full_output, sep='\t', index=False, encoding='utf-8')
-    print(f"\n✅ Complete results saved to: {full_output}")
+    if output_format == 'feather':
+        import pyarrow.feather as feather
+        feather.write_feather(table, output_file)
+        return
     
-    # Generate summary statistics
+    priority = columnar['Priority'].to_numpy()
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(priority)) + 1, [len(priority)]))
+    with pq.ParquetWriter(output_file, table.schema) as writer:
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if end > start or len(priority) == 0:
+                writer.write_table(table.slice(start, end - start))
+
+def build_report_state(df):
+    """
+    Precompute everything the report writers need in one groupby pass
+    
+    Rows are grouped once by (Confidence, Rank, In_RVDB, In_NCBI); group sizes
+    give all counts and group row positions give every output subset, so no
+    writer has to re-filter or re-scan the integrated table.
+    
+    Parameters:
+        df: Integrated DataFrame (already sorted for output)
+    
+    Returns:
+        Dictionary with the table, group counts and row-position helpers
+    """
+    groups = df.groupby(['Confidence', 'Rank', 'In_RVDB', 'In_NCBI'],
+                        sort=False, observed=True).indices
+    counts = pd.Series({key: len(positions) for key, positions in groups.items()}, dtype='int64')
+    if len(counts):
+        counts.index = counts.index.set_names(['Confidence', 'Rank', 'In_RVDB', 'In_NCBI'])
+    else:
+        counts.index = pd.MultiIndex.from_tuples(
+            [], names=['Confidence', 'Rank', 'In_RVDB', 'In_NCBI'])
+    
+    def count(**levels):
+        """Number of rows matching the given group levels"""
+        selected = counts
+        for level, value in levels.items():
+            selected = selected[selected.index.get_level_values(level) == value]
+        return int(selected.sum())
+    
+    def rows(**levels):
+        """Rows matching the given group levels, in table order"""
+        keys = ['Confidence', 'Rank', 'In_RVDB', 'In_NCBI']
+        positions = [pos for key, pos in groups.items()
+                     if all(key[keys.index(level)] == value for level, value in levels.items())]
+        if positions:
+            return df.iloc[np.sort(np.concatenate(positions))]
+        return df.iloc[0:0]
+    
+    state = {
+        'df': df,
+        'counts': counts,
+        'count': count,
+        'rows': rows,
+        'total': int(counts.sum()),
+        'in_both': count(In_RVDB='Yes', In_NCBI='Yes'),
+        'rvdb_only': count(In_RVDB='Yes', In_NCBI='No'),
+        'ncbi_only': count(In_RVDB='No', In_NCBI='Yes'),
+        'confidence_counts': counts.groupby(level='Confidence').sum(),
+        'rank_counts': counts.groupby(level='Rank').sum(),
+    }
+    
+    # Species-level Venn sets (species rows indexed by taxid)
+    state['venn'] = {
+        'intersection': count(Rank='S', In_RVDB='Yes', In_NCBI='Yes'),
+        'rvdb_unique': count(Rank='S', In_RVDB='Yes', In_NCBI='No'),
+        'ncbi_unique': count(Rank='S', In_RVDB='No', In_NCBI='Yes'),
+    }
+    state['venn']['rvdb'] = state['venn']['intersection'] + state['venn']['rvdb_unique']
+    state['venn']['ncbi'] = state['venn']['intersection'] + state['venn']['ncbi_unique']
+    
+    state['high_confidence'] = rows(Confidence='High')
+    state['high_conf_species'] = rows(Confidence='High', Rank='S')
+    state['candidates_species'] = rows(Confidence='Medium', Rank='S')
+    return state
+
+def print_summary_statistics(state):
+    """
+    Print integration summary statistics from the precomputed report state
+    """
     print("\n" + "="*70)
     print("Integration Summary Statistics (based on direct read classifications)")
     print("="*70)
     
-    total_count = len(df)
-    high_conf = len(df[df['Confidence'] == 'High'])
-    medium_high_conf = len(df[df['Confidence'] == 'Medium-High'])
-    medium_conf = len(df[df['Confidence'] == 'Medium'])
-    low_medium_conf = len(df[df['Confidence'] == 'Low-Medium'])
-    low_conf = len(df[df['Confidence'] == 'Low'])
-    in_both = len(df[df['In_Both'] == 'Yes'])
+    total_count = state['total']
+    in_both = state['in_both']
+    confidence_counts = state['confidence_counts']
     
     print(f"\nTotal classifications: {total_count}")
-    print(f"  - Detected in both: {in_both} ({in_both/total_count*100:.1f}%)")
-    print(f"  - RVDB only: {len(df[df['In_RVDB']=='Yes']) - in_both}")
-    print(f"  - NCBI only: {len(df[df['In_NCBI']=='Yes']) - in_both}")
+    print(f"  - Detected in both: {in_both} ({in_both/max(total_count, 1)*100:.1f}%)")
+    print(f"  - RVDB only: {state['rvdb_only']}")
+    print(f"  - NCBI only: {state['ncbi_only']}")
     
     print(f"\nBy confidence level:")
-    print(f"  - High confidence (Both DB, ≥100 reads): {high_conf}")
-    print(f"  - Medium-High confidence (Both DB, 50-99 reads): {medium_high_conf}")
-    print(f"  - Medium confidence (Single DB, ≥100 reads): {medium_conf}")
-    print(f"  - Low-Medium confidence (Single DB, 50-99 reads): {low_medium_conf}")
-    print(f"  - Low confidence (Any, <50 reads): {low_conf}")
+    print(f"  - High confidence (Both DB, ≥100 reads): {confidence_counts.get('High', 0)}")
+    print(f"  - Medium-High confidence (Both DB, 50-99 reads): {confidence_counts.get('Medium-High', 0)}")
+    print(f"  - Medium confidence (Single DB, ≥100 reads): {confidence_counts.get('Medium', 0)}")
+    print(f"  - Low-Medium confidence (Single DB, 50-99 reads): {confidence_counts.get('Low-Medium', 0)}")
+    print(f"  - Low confidence (Any, <50 reads): {confidence_counts.get('Low', 0)}")
     
     # Statistics by taxonomic rank
     print(f"\nBy taxonomic rank:")
     for rank in ['S', 'G', 'F', 'O', 'C', 'P', 'K', 'D']:
-        count = len(df[df['Rank'] == rank])
+        count = state['rank_counts'].get(rank, 0)
         if count > 0:
             print(f"  - {get_rank_name(rank)}: {count}")
+
+def write_high_confidence(state, output_prefix, full_output=None, quiet=False):
+    """
+    Write the high confidence species / all-level tables
+    
+    With full_output (columnar mode) the subsets are not copied to separate
+    files; they are reported as filters on the full table instead.
+    quiet skips the Top 20 console table.
     
-    # Generate high confidence results (recommended for reporting)
+    Returns:
+        (species_output, all_high_output), None for files not written
+    """
     print("\n" + "="*70)
     print("High Confidence Results (Recommended for reporting)")
     print("="*70)
     
-    high_confidence = df[df['Confidence'] == 'High'].copy()
+    high_confidence = state['high_confidence']
+    high_conf_species = state['high_conf_species']
+    species_output = None
+    all_high_output = None
     
     if len(high_confidence) > 0:
-        # Save species-level high confidence results
-        high_conf_species = high_confidence[high_confidence['Rank'] == 'S'].copy()
-        
         if len(high_conf_species) > 0:
             # Save high confidence species results
-            species_output = f"{output_prefix}_high_confidence_species.tsv"
-            high_conf_species.to_csv(species_output, sep='\t', index=False, encoding='utf-8')
-            print(f"\n✅ High confidence species results saved to: {species_output}")
+            if full_output:
+                species_output = f"{full_output} [Confidence == 'High' & Rank == 'S']"
+                print(f"\n✅ High confidence species results: {species_output}")
+            else:
+                species_output = f"{output_prefix}_high_confidence_species.tsv"
+                high_conf_species.to_csv(species_output, sep='\t', index=False, encoding='utf-8')
+                print(f"\n✅ High confidence species results saved to: {species_output}")
             
             # Display top 20
-            print(f"\nHigh confidence species (Top 20, sorted by direct reads):")
-            print("-" * 130)
-            display_cols = ['Taxon_Name', 'RVDB_Reads_Direct', 'NCBI_Reads_Direct', 
-                          'RVDB_Percent', 'NCBI_Percent', 'Avg_Percent']
-            print(high_conf_species[display_cols].head(20).to_string(index=False))
+            if not quiet:
+                print(f"\nHigh confidence species (Top 20, sorted by direct reads):")
+                print("-" * 130)
+                display_cols = ['Taxon_Name', 'RVDB_Reads_Direct', 'NCBI_Reads_Direct', 
+                              'RVDB_Percent', 'NCBI_Percent', 'Avg_Percent']
+                print(high_conf_species[display_cols].head(20).to_string(index=False))
             
         # Save all-level high confidence results
-        all_high_output = f"{output_prefix}_high_confidence_all.tsv"
-        high_confidence.to_csv(all_high_output, sep='\t', index=False, encoding='utf-8')
-        print(f"\n✅ All-level high confidence results saved to: {all_high_output}")
+        if full_output:
+            all_high_output = f"{full_output} [Confidence == 'High']"
+            print(f"\n✅ All-level high confidence results: {all_high_output}")
+        else:
+            all_high_output = f"{output_prefix}_high_confidence_all.tsv"
+            high_confidence.to_csv(all_high_output, sep='\t', index=False, encoding='utf-8')
+            print(f"\n✅ All-level high confidence results saved to: {all_high_output}")
         
         # Statistics by level
         print(f"\nHigh confidence by taxonomic rank:")
         for rank in ['S', 'G', 'F', 'O', 'C', 'P', 'K']:
-            count = len(high_confidence[high_confidence['Rank'] == rank])
+            count = state['count'](Confidence='High', Rank=rank)
             if count > 0:
                 print(f"  - {get_rank_name(rank)}: {count}")
     else:
         print("\n⚠️  Warning: No high confidence results detected!")
     
-    # Generate candidate virus list (medium confidence)
+    return species_output, all_high_output
+
+def write_candidate_viruses(state, output_prefix, full_output=None, quiet=False):
+    """
+    Write the species-level candidate virus list (Medium confidence)
+    
+    With full_output (columnar mode) the list is reported as a filter on the
+    full table instead of being copied to a separate file.
+    quiet skips the Top 10 console table.
+    
+    Returns:
+        Output path, or None if there are no species-level candidates
+    """
     print("\n" + "="*70)
     print("Candidate Viruses (Require validation)")
     print("="*70)
     
-    candidates = df[df['Confidence'] == 'Medium'].copy()
-    
     # Display candidate counts by level
     print(f"\nCandidates by taxonomic rank:")
     for rank in ['S', 'G', 'F', 'O']:
-        count = len(candidates[candidates['Rank'] == rank])
+        count = state['count'](Confidence='Medium', Rank=rank)
         if count > 0:
             print(f"  - {get_rank_name(rank)}: {count}")
     
-    candidates_species = candidates[candidates['Rank'] == 'S']
+    candidates_species = state['candidates_species']
+    candidates_output = None
     
     if len(candidates_species) > 0:
-        candidates_output = f"{output_prefix}_candidate_viruses.tsv"
-        candidates_species.to_csv(candidates_output, sep='\t', index=False, encoding='utf-8')
-        print(f"\n✅ Candidate viruses (species-level) saved to: {candidates_output}")
+        if full_output:
+            candidates_output = f"{full_output} [Confidence == 'Medium' & Rank == 'S']"
+            print(f"\n✅ Candidate viruses (species-level): {candidates_output}")
+        else:
+            candidates_output = f"{output_prefix}_candidate_viruses.tsv"
+            candidates_species.to_csv(candidates_output, sep='\t', index=False, encoding='utf-8')
+            print(f"\n✅ Candidate viruses (species-level) saved to: {candidates_output}")
         
-        print(f"\nCandidate viruses species (Top 10, sorted by direct reads):")
-        print("-" * 130)
-        display_cols = ['Taxon_Name', 'In_RVDB', 'In_NCBI', 
-                       'Max_Direct_Reads', 'Max_Percent', 'Description']
-        print(candidates_species[display_cols].head(10).to_string(index=False))
+        if not quiet:
+            print(f"\nCandidate viruses species (Top 10, sorted by direct reads):")
+            print("-" * 130)
+            display_cols = ['Taxon_Name', 'In_RVDB', 'In_NCBI', 
+                           'Max_Direct_Reads', 'Max_Percent', 'Description']
+            print(candidates_species[display_cols].head(10).to_string(index=False))
     else:
         print("\nNo candidate viruses (species-level) detected.")
     
-    # Generate Venn diagram data (species-level only)
+    return candidates_output
+
+def write_venn_data(state, output_prefix, sample_id):
+    """
+    Write species-level Venn diagram data
+    
+    Intersection and unique species lists come straight from the precomputed
+    groups of species rows, so no per-species lookup is needed.
+    
+    Returns:
+        Output path
+    """
     print("\n" + "="*70)
     print("Generate Venn Diagram Data (Species-level only)")
     print("="*70)
     
-    # Only count species level
-    species_df = df[df['Rank'] == 'S']
-    rvdb_species = set(species_df[species_df['In_RVDB'] == 'Yes']['Taxon_Name'])
-    ncbi_species = set(species_df[species_df['In_NCBI'] == 'Yes']['Taxon_Name'])
-    intersection = rvdb_species & ncbi_species
+    venn = state['venn']
+    rows = state['rows']
+    intersection_df = rows(Rank='S', In_RVDB='Yes', In_NCBI='Yes')
+    intersection_df = intersection_df.iloc[
+        np.argsort(intersection_df['Taxon_Name'].to_numpy(dtype=object), kind='stable')]
+    rvdb_only_df = rows(Rank='S', In_RVDB='Yes', In_NCBI='No').sort_values(
+        'RVDB_Reads_Direct', ascending=False, kind='stable')
+    ncbi_only_df = rows(Rank='S', In_RVDB='No', In_NCBI='Yes').sort_values(
+        'NCBI_Reads_Direct', ascending=False, kind='stable')
     
     venn_output = f"{output_prefix}_venn_data.txt"
     with open(venn_output, 'w', encoding='utf-8') as f:
         f.write("="*70 + "\n")
-        f.write("Sample 66ce4dde - Venn Diagram Data\n")
+        f.write(f"Sample {sample_id} - Venn Diagram Data\n")
         f.write("(Species-level, only classifications with direct reads)\n")
         f.write("="*70 + "\n\n")
-        f.write(f"RVDB detected: {len(rvdb_species)} species\n")
-        f.write(f"NCBI detected: {len(ncbi_species)} species\n")
-        f.write(f"Intersection (high confidence): {len(intersection)} species\n")
-        f.write(f"RVDB unique: {len(rvdb_species - ncbi_species)} species\n")
-        f.write(f"NCBI unique: {len(ncbi_species - rvdb_species)} species\n\n")
+        f.write(f"RVDB detected: {venn['rvdb']} species\n")
+        f.write(f"NCBI detected: {venn['ncbi']} species\n")
+        f.write(f"Intersection (high confidence): {venn['intersection']} species\n")
+        f.write(f"RVDB unique: {venn['rvdb_unique']} species\n")
+        f.write(f"NCBI unique: {venn['ncbi_unique']} species\n\n")
         
         f.write("="*70 + "\n")
         f.write("Intersection Species List (alphabetically sorted)\n")
         f.write("="*70 + "\n")
-        for species in sorted(intersection):
+        for row in intersection_df.itertuples(index=False):
             # Add reads information
-            species_data = species_df[species_df['Taxon_Name'] == species].iloc[0]
-            f.write(f"{species}\n")
-            f.write(f"  RVDB: {species_data['RVDB_Reads_Direct']} direct reads ({species_data['RVDB_Percent']:.2f}%)\n")
-            f.write(f"  NCBI: {species_data['NCBI_Reads_Direct']} direct reads ({species_data['NCBI_Percent']:.2f}%)\n")
+            f.write(f"{row.Taxon_Name}\n")
+            f.write(f"  RVDB: {row.RVDB_Reads_Direct} direct reads ({row.RVDB_Percent:.2f}%)\n")
+            f.write(f"  NCBI: {row.NCBI_Reads_Direct} direct reads ({row.NCBI_Percent:.2f}%)\n")
         
         f.write("\n" + "="*70 + "\n")
         f.write("RVDB Unique Species List (Top 20, sorted by reads)\n")
         f.write("="*70 + "\n")
-        rvdb_only_df = species_df[(species_df['In_RVDB'] == 'Yes') & (species_df['In_NCBI'] == 'No')]
-        rvdb_only_df = rvdb_only_df.sort_values('RVDB_Reads_Direct', ascending=False)
-        for idx, row in rvdb_only_df.head(20).iterrows():
-            f.write(f"{row['Taxon_Name']}\n")
-            f.write(f"  RVDB: {row['RVDB_Reads_Direct']} direct reads ({row['RVDB_Percent']:.2f}%)\n")
+        for row in rvdb_only_df.head(20).itertuples(index=False):
+            f.write(f"{row.Taxon_Name}\n")
+            f.write(f"  RVDB: {row.RVDB_Reads_Direct} direct reads ({row.RVDB_Percent:.2f}%)\n")
         
         f.write("\n" + "="*70 + "\n")
         f.write("NCBI Unique Species List (Top 20, sorted by reads)\n")
         f.write("="*70 + "\n")
-        ncbi_only_df = species_df[(species_df['In_NCBI'] == 'Yes') & (species_df['In_RVDB'] == 'No')]
-        ncbi_only_df = ncbi_only_df.sort_values('NCBI_Reads_Direct', ascending=False)
-        for idx, row in ncbi_only_df.head(20).iterrows():
-            f.write(f"{row['Taxon_Name']}\n")
-            f.write(f"  NCBI: {row['NCBI_Reads_Direct']} direct reads ({row['NCBI_Percent']:.2f}%)\n")
+        for row in ncbi_only_df.head(20).itertuples(index=False):
+            f.write(f"{row.Taxon_Name}\n")
+            f.write(f"  NCBI: {row.NCBI_Reads_Direct} direct reads ({row.NCBI_Percent:.2f}%)\n")
     
     print(f"\n✅ Venn diagram data saved to: {venn_output}")
     print(f"\n📊 Species-level statistics (with direct reads):")
-    print(f"  - RVDB detected: {len(rvdb_species)} species")
-    print(f"  - NCBI detected: {len(ncbi_species)} species")
-    print(f"  - Intersection: {len(intersection)} species")
-    print(f"  - RVDB unique: {len(rvdb_species - ncbi_species)} species")
-    print(f"  - NCBI unique: {len(ncbi_species - rvdb_species)} species")
+    print(f"  - RVDB detected: {venn['rvdb']} species")
+    print(f"  - NCBI detected: {venn['ncbi']} species")
+    print(f"  - Intersection: {venn['intersection']} species")
+    print(f"  - RVDB unique: {venn['rvdb_unique']} species")
+    print(f"  - NCBI unique: {venn['ncbi_unique']} species")
+    
+    return venn_output
+
+def write_summary_report(state, output_prefix, sample_id, rvdb_file, ncbi_file,
+                         thresholds, outputs):
+    """
+    Write the text summary report from the precomputed report state
+    
+    Parameters:
+        thresholds: (reads_threshold_high, reads_threshold_medium, min_direct_reads)
+        outputs: Dictionary of generated file paths (None if not written)
+    
+    Returns:
+        Output path
+    """
+    reads_threshold_high, reads_threshold_medium, min_direct_reads = thresholds
+    confidence_counts = state['confidence_counts']
+    venn = state['venn']
+    high_conf_species = state['high_conf_species']
     
-    # Generate summary report
     summary_output = f"{output_prefix}_summary.txt"
     with open(summary_output, 'w', encoding='utf-8') as f:
         f.write("="*70 + "\n")
-        f.write("Sample 66ce4dde Virus Classification Integration Report\n")
+        f.write(f"Sample {sample_id} Virus Classification Integration Report\n")
         f.write("Improvement: Only counts direct read classifications, avoiding parent duplication\n")
         f.write("="*70 + "\n\n")
         
@@ -438,41 +772,219 @@ def integrate_results(rvdb_file, ncbi_file,
         f.write(f"  - Minimum direct reads: {min_direct_reads}\n\n")
         
         f.write("Integration Statistics (direct read classifications):\n")
-        f.write(f"  - Total classifications: {total_count}\n")
-        f.write(f"  - Both databases: {in_both}\n")
-        f.write(f"  - High confidence: {high_conf}\n")
-        f.write(f"  - Medium confidence: {medium_conf}\n")
-        f.write(f"  - Low confidence: {low_conf}\n\n")
+        f.write(f"  - Total classifications: {state['total']}\n")
+        f.write(f"  - Both databases: {state['in_both']}\n")
+        f.write(f"  - High confidence: {confidence_counts.get('High', 0)}\n")
+        f.write(f"  - Medium confidence: {confidence_counts.get('Medium', 0)}\n")
+        f.write(f"  - Low confidence: {confidence_counts.get('Low', 0)}\n\n")
         
         f.write("Species-level Statistics:\n")
-        f.write(f"  - RVDB species count: {len(rvdb_species)}\n")
-        f.write(f"  - NCBI species count: {len(ncbi_species)}\n")
-        f.write(f"  - Intersection species: {len(intersection)}\n")
-        f.write(f"  - RVDB unique: {len(rvdb_species - ncbi_species)}\n")
-        f.write(f"  - NCBI unique: {len(ncbi_species - rvdb_species)}\n\n")
+        f.write(f"  - RVDB species count: {venn['rvdb']}\n")
+        f.write(f"  - NCBI species count: {venn['ncbi']}\n")
+        f.write(f"  - Intersection species: {venn['intersection']}\n")
+        f.write(f"  - RVDB unique: {venn['rvdb_unique']}\n")
+        f.write(f"  - NCBI unique: {venn['ncbi_unique']}\n\n")
         
         if len(high_conf_species) > 0:
             f.write("="*70 + "\n")
             f.write("High Confidence Viruses (Top 10)\n")
             f.write("="*70 + "\n")
-            for i, (idx, row) in enumerate(high_conf_species.head(10).iterrows(), 1):
-                f.write(f"\n{i}. {row['Taxon_Name']}\n")
-                f.write(f"   RVDB: {row['RVDB_Reads_Direct']} direct reads ({row['RVDB_Percent']:.2f}%)\n")
-                f.write(f"   NCBI: {row['NCBI_Reads_Direct']} direct reads ({row['NCBI_Percent']:.2f}%)\n")
+            for i, row in enumerate(high_conf_species.head(10).itertuples(index=False), 1):
+                f.write(f"\n{i}. {row.Taxon_Name}\n")
+                f.write(f"   RVDB: {row.RVDB_Reads_Direct} direct reads ({row.RVDB_Percent:.2f}%)\n")
+                f.write(f"   NCBI: {row.NCBI_Reads_Direct} direct reads ({row.NCBI_Percent:.2f}%)\n")
         
         f.write("\n" + "="*70 + "\n")
         f.write("Generated Files List\n")
         f.write("="*70 + "\n")
-        f.write(f"1. {full_output} - Complete integration results\n")
-        if len(high_confidence) > 0:
-            f.write(f"2. {species_output} - High confidence species results\n")
-            f.write(f"3. {all_high_output} - All-level high confidence results\n")
-        if len(candidates_species) > 0:
-            f.write(f"4. {candidates_output} - Candidate virus list\n")
-        f.write(f"5. {venn_output} - Venn diagram data\n")
+        f.write(f"1. {outputs['full']} - Complete integration results\n")
+        if outputs.get('high_confidence_species'):
+            f.write(f"2. {outputs['high_confidence_species']} - High confidence species results\n")
+        if outputs.get('high_confidence_all'):
+            f.write(f"3. {outputs['high_confidence_all']} - All-level high confidence results\n")
+        if outputs.get('candidate_viruses'):
+            f.write(f"4. {outputs['candidate_viruses']} - Candidate virus list\n")
+        f.write(f"5. {outputs['venn']} - Venn diagram data\n")
         f.write(f"6. {summary_output} - This summary report\n")
     
     print(f"\n✅ Summary report saved to: {summary_output}")
+    return summary_output
+
+def integrate_results(rvdb_file, ncbi_file, 
+                     reads_threshold_high=100, 
+                     reads_threshold_medium=50,
+                     min_direct_reads=0,
+                     output_prefix=None,
+                     sample_id=None,
+                     output_format='tsv',
+                     cache_dir=None,
+                     cache_max_mb=DEFAULT_CACHE_MAX_MB,
+                     quiet=False,
+                     write_metrics=False):
+    """
+    Integrate classification results from two databases (improved version - only counts direct reads)
+    
+    Parameters:
+        rvdb_file: RVDB database result file
+        ncbi_file: NCBI RefSeq database result file
+        reads_threshold_high: High confidence reads threshold
+        reads_threshold_medium: Medium confidence reads threshold
+        min_direct_reads: Minimum direct reads
+        output_prefix: Output file prefix (default: <sample_id>_integrated)
+        sample_id: Sample ID used in reports (default: inferred from rvdb_file)
+        output_format: tsv (default), parquet or feather for the integrated table;
+                       columnar formats write subsets as filters, not copies
+        cache_dir: Optional parsed-report cache directory (see parse_kraken_report)
+        cache_max_mb: Parsed-report cache size bound in MB
+        quiet: Skip the console summary statistics and Top N tables
+        write_metrics: Write per-stage durations, row counts and peak memory
+                       to <output_prefix>_metrics.json
+    """
+    if sample_id is None:
+        sample_id = infer_sample_id(rvdb_file)
+    if output_prefix is None:
+        output_prefix = f"{sample_id}_integrated"
+    if output_format not in OUTPUT_FORMATS:
+        print(f"Error: Unknown output format {output_format} (choose from {', '.join(OUTPUT_FORMATS)})")
+        sys.exit(1)
+    
+    print("\n" + "="*70)
+    print("Kraken2 Results Integration Analysis (Improved v2)")
+    print(f"Sample: {sample_id}")
+    print("Improvement: Only counts classifications with direct reads, avoiding parent duplication")
+    print("="*70 + "\n")
+    
+    metrics = StageMetrics(sample_id)
+    
+    # Parse both report files (only retain classifications with direct reads)
+    rvdb_results = parse_kraken_report(rvdb_file, min_direct_reads, cache_dir, cache_max_mb)
+    metrics.lap('parse_rvdb', rows=len(rvdb_results))
+    ncbi_results = parse_kraken_report(ncbi_file, min_direct_reads, cache_dir, cache_max_mb)
+    metrics.lap('parse_ncbi', rows=len(ncbi_results))
+    
+    merged = join_reports(rvdb_results, ncbi_results)
+    metrics.lap('join', rows=len(merged))
+    print(f"\nTotal detected: {len(merged)} classification entries with direct reads")
+    
+    # Check if detected in both databases
+    in_rvdb = (merged['_merge'] != 'right_only').to_numpy()
+    in_ncbi = (merged['_merge'] != 'left_only').to_numpy()
+    in_both = in_rvdb & in_ncbi
+    
+    # Taxa missing from one database count as 0 reads / 0%
+    rvdb_direct = merged['reads_direct_rvdb'].fillna(0).astype('int64').to_numpy()
+    rvdb_total = merged['reads_total_rvdb'].fillna(0).astype('int64').to_numpy()
+    rvdb_percent = merged['percent_rvdb'].fillna(0.0).to_numpy()
+    ncbi_direct = merged['reads_direct_ncbi'].fillna(0).astype('int64').to_numpy()
+    ncbi_total = merged['reads_total_ncbi'].fillna(0).astype('int64').to_numpy()
+    ncbi_percent = merged['percent_ncbi'].fillna(0.0).to_numpy()
+    
+    # Get maximum direct reads (this is the true read count)
+    max_direct_reads = np.maximum(rvdb_direct, ncbi_direct)
+    max_percent = np.maximum(rvdb_percent, ncbi_percent)
+    
+    # Determine confidence level (based on new principles)
+    # Two-dimensional classification: detection condition + read count
+    high_reads = max_direct_reads >= reads_threshold_high
+    medium_reads = max_direct_reads >= reads_threshold_medium
+    conditions = [
+        in_both & high_reads,     # Both databases, high reads
+        in_both & medium_reads,   # Both databases, medium reads
+        in_both,                  # Both databases, low reads
+        high_reads,               # Single database, high reads
+        medium_reads              # Single database, medium reads
+    ]
+    confidence = np.select(conditions, ['High', 'Medium-High', 'Low', 'Medium', 'Low-Medium'],
+                           default='Low')
+    priority = np.select(conditions, [1, 2, 5, 3, 4], default=5)
+    source = np.where(in_both, 'BothDB-', np.where(in_rvdb, 'RVDBOnly-', 'NCBIOnly-'))
+    read_level = np.select([high_reads, medium_reads],
+                           ['HighReads(≥100)', 'MediumReads(50-99)'],
+                           default='LowReads(<50)')
+    description = np.char.add(source, read_level)
+    
+    # Get taxonomic rank and name (prefer RVDB when present)
+    rank = pd.Series(np.where(in_rvdb, merged['rank_rvdb'].astype(object),
+                              merged['rank_ncbi'].astype(object)))
+    name = np.where(in_rvdb, merged['name_rvdb'].astype(object),
+                    merged['name_ncbi'].astype(object))
+    unique_ranks = rank.unique()
+    
+    # Calculate average percentage
+    avg_percent = np.where(in_both, (rvdb_percent + ncbi_percent) / 2, max_percent)
+    
+    yes_no = np.array(['No', 'Yes'])
+    df = pd.DataFrame({
+        'Taxon_Name': name,
+        'Rank': rank,
+        'Rank_Name': rank.map({r: get_rank_name(r) for r in unique_ranks}),
+        'Rank_Priority': rank.map({r: get_rank_priority(r) for r in unique_ranks}),
+        'NCBI_TaxID': merged.index.to_numpy(),
+        'Confidence': confidence,
+        'Priority': priority,
+        'Description': description,
+        'In_Both': yes_no[in_both.astype(int)],
+        'In_RVDB': yes_no[in_rvdb.astype(int)],
+        'In_NCBI': yes_no[in_ncbi.astype(int)],
+        'RVDB_Reads_Direct': rvdb_direct,
+        'RVDB_Reads_Total': rvdb_total,
+        'RVDB_Percent': rvdb_percent,
+        'NCBI_Reads_Direct': ncbi_direct,
+        'NCBI_Reads_Total': ncbi_total,
+        'NCBI_Percent': ncbi_percent,
+        'Max_Direct_Reads': max_direct_reads,
+        'Max_Percent': max_percent,
+        'Avg_Percent': avg_percent
+    })
+    metrics.lap('classify', rows=len(df))
+    
+    # Sort: by priority, then rank, then direct reads
+    df = df.sort_values(
+        ['Priority', 'Rank_Priority', 'Max_Direct_Reads'], 
+        ascending=[True, True, False],
+        kind='stable'
+    )
+    metrics.lap('sort', rows=len(df))
+    
+    # Save complete results
+    full_output = f"{output_prefix}_full.{output_format}"
+    if output_format == 'tsv':
+        df.to_csv(full_output, sep='\t', index=False, encoding='utf-8')
+    else:
+        write_columnar(df, full_output, output_format)
+    metrics.lap('write_full', rows=len(df))
+    print(f"\n✅ Complete results saved to: {full_output}")
+    
+    # Shared report state: one groupby pass, reused by every writer
+    state = build_report_state(df)
+    metrics.lap('report_state', rows=len(state['counts']))
+    if not quiet:
+        print_summary_statistics(state)
+        metrics.lap('print_summary')
+    
+    outputs = {'full': full_output}
+    subset_source = full_output if output_format != 'tsv' else None
+    (outputs['high_confidence_species'],
+     outputs['high_confidence_all']) = write_high_confidence(state, output_prefix, subset_source, quiet)
+    metrics.lap('write_high_confidence', rows=len(state['high_confidence']))
+    outputs['candidate_viruses'] = write_candidate_viruses(state, output_prefix, subset_source, quiet)
+    metrics.lap('write_candidate_viruses', rows=len(state['candidates_species']))
+    outputs['venn'] = write_venn_data(state, output_prefix, sample_id)
+    metrics.lap('venn', rows=state['venn']['rvdb'] + state['venn']['ncbi_unique'])
+    outputs['summary'] = write_summary_report(
+        state, output_prefix, sample_id, rvdb_file, ncbi_file,
+        (reads_threshold_high, reads_threshold_medium, min_direct_reads), outputs)
+    metrics.lap('write_summary')
+    
+    if write_metrics:
+        metrics_output = metrics.write(
+            f"{output_prefix}_metrics.json",
+            inputs={'rvdb': rvdb_file, 'ncbi': ncbi_file},
+            thresholds={'reads_threshold_high': reads_threshold_high,
+                        'reads_threshold_medium': reads_threshold_medium,
+                        'min_direct_reads': min_direct_reads},
+            output_format=output_format)
+        print(f"✅ Stage metrics saved to: {metrics_output}")
     
     print("\n" + "="*70)
     print("✅ Integration analysis complete!")
@@ -480,36 +992,697 @@ def integrate_results(rvdb_file, ncbi_file,
     
     return df
 
+def parse_grid(spec):
+    """
+    Parse a threshold grid: comma list (50,100,150) and/or inclusive
+    ranges start:stop[:step] (50:200:25), e.g. "0,5:20:5"
+    """
+    values = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if ':' in part:
+            bounds = [int(x) for x in part.split(':')]
+            start, stop = bounds[0], bounds[1]
+            step = bounds[2] if len(bounds) > 2 else 1
+            values.extend(range(start, stop + 1, step))
+        else:
+            values.append(int(part))
+    return sorted(set(values))
+
+def _count_at_least(sorted_values, thresholds):
+    """Number of sorted_values >= each threshold (vectorized over thresholds)"""
+    return len(sorted_values) - np.searchsorted(sorted_values, thresholds, side='left')
+
+def sweep_thresholds(rvdb_file, ncbi_file,
+                     high_values, medium_values, min_direct_values,
+                     output_prefix=None,
+                     sample_id=None,
+                     cache_dir=None,
+                     cache_max_mb=DEFAULT_CACHE_MAX_MB):
+    """
+    Evaluate many (high, medium, min_direct) threshold combinations in one pass
+    
+    Both reports are parsed and joined once. For each min_direct value the
+    max-direct-read counts of dual- and single-database taxa are sorted once;
+    the counts of every confidence class for all (high, medium) pairs then come
+    from a single broadcast searchsorted, following the same ladder as
+    integrate_results. Species-level Venn sizes depend only on min_direct.
+    
+    Parameters:
+        high_values / medium_values / min_direct_values: Threshold grids
+        output_prefix: Output file prefix (default: <sample_id>_integrated)
+        sample_id: Sample ID (default: inferred from rvdb_file)
+        cache_dir / cache_max_mb: Parsed-report cache (see parse_kraken_report)
+    
+    Returns:
+        Tidy DataFrame, one row per threshold combination
+    """
+    if sample_id is None:
+        sample_id = infer_sample_id(rvdb_file)
+    if output_prefix is None:
+        output_prefix = f"{sample_id}_integrated"
+    
+    print("\n" + "="*70)
+    print("Kraken2 Results Integration - Threshold Sweep")
+    print(f"Sample: {sample_id}")
+    print("="*70 + "\n")
+    
+    # Parse once with all direct-read taxa; min_direct is applied per combination
+    merged = join_reports(parse_kraken_report(rvdb_file, 0, cache_dir, cache_max_mb),
+                          parse_kraken_report(ncbi_file, 0, cache_dir, cache_max_mb))
+    rvdb_direct = merged['reads_direct_rvdb'].fillna(0).astype('int64').to_numpy()
+    ncbi_direct = merged['reads_direct_ncbi'].fillna(0).astype('int64').to_numpy()
+    rvdb_species = (merged['rank_rvdb'].astype(object) == 'S').to_numpy()
+    ncbi_species = (merged['rank_ncbi'].astype(object) == 'S').to_numpy()
+    max_direct_reads = np.maximum(rvdb_direct, ncbi_direct)
+    
+    high_values = np.asarray(sorted(set(high_values)), dtype='int64')
+    medium_values = np.asarray(sorted(set(medium_values)), dtype='int64')
+    high_grid, medium_grid = [g.ravel() for g in np.meshgrid(high_values, medium_values, indexing='ij')]
+    upper = np.maximum(high_grid, medium_grid)
+    lower = np.minimum(high_grid, medium_grid)
+    
+    tables = []
+    for min_direct in sorted(set(min_direct_values)):
+        in_rvdb = rvdb_direct > min_direct
+        in_ncbi = ncbi_direct > min_direct
+        in_both = in_rvdb & in_ncbi
+        single = in_rvdb ^ in_ncbi
+        both_reads = np.sort(max_direct_reads[in_both])
+        single_reads = np.sort(max_direct_reads[single])
+        
+        both_high = _count_at_least(both_reads, high_grid)
+        both_upper = _count_at_least(both_reads, upper)
+        both_medium = _count_at_least(both_reads, medium_grid)
+        both_lower = _count_at_least(both_reads, lower)
+        single_high = _count_at_least(single_reads, high_grid)
+        single_upper = _count_at_least(single_reads, upper)
+        single_medium = _count_at_least(single_reads, medium_grid)
+        single_lower = _count_at_least(single_reads, lower)
+        
+        # Species rank follows integrate_results: RVDB rank if present, else NCBI
+        is_species = np.where(in_rvdb, rvdb_species, ncbi_species)
+        venn_rvdb = int(np.count_nonzero(is_species & in_rvdb))
+        venn_ncbi = int(np.count_nonzero(is_species & in_ncbi))
+        venn_both = int(np.count_nonzero(is_species & in_both))
+        
+        n = len(high_grid)
+        tables.append(pd.DataFrame({
+            'Min_Direct_Reads': np.full(n, min_direct),
+            'Reads_Threshold_High': high_grid,
+            'Reads_Threshold_Medium': medium_grid,
+            'Total': np.full(n, len(both_reads) + len(single_reads)),
+            'In_Both': np.full(n, len(both_reads)),
+            'High': both_high,
+            'Medium-High': both_medium - both_upper,
+            'Medium': single_high,
+            'Low-Medium': single_medium - single_upper,
+            'Low': (len(both_reads) - both_lower) + (len(single_reads) - single_lower),
+            'RVDB_Species': np.full(n, venn_rvdb),
+            'NCBI_Species': np.full(n, venn_ncbi),
+            'Intersection_Species': np.full(n, venn_both),
+            'RVDB_Unique_Species': np.full(n, venn_rvdb - venn_both),
+            'NCBI_Unique_Species': np.full(n, venn_ncbi - venn_both)
+        }))
+    
+    sweep_df = pd.concat(tables, ignore_index=True)
+    sweep_output = f"{output_prefix}_threshold_sweep.tsv"
+    sweep_df.to_csv(sweep_output, sep='\t', index=False, encoding='utf-8')
+    print(f"\n✅ Threshold sweep ({len(sweep_df)} combinations) saved to: {sweep_output}")
+    return sweep_df
+
+def integrate_multi_db(report_files,
+                       reads_threshold_high=100,
+                       reads_threshold_medium=50,
+                       min_direct_reads=0,
+                       min_support=2,
+                       output_prefix=None,
+                       sample_id=None,
+                       output_format='tsv',
+                       cache_dir=None,
+                       cache_max_mb=DEFAULT_CACHE_MAX_MB,
+                       quiet=False,
+                       write_metrics=False):
+    """
+    Integrate classification results from any number of Kraken2 databases
+    
+    Generalizes integrate_results: taxa are merged on taxid across all reports,
+    Support counts the databases detecting a taxon (k of N), and a taxon detected
+    in at least min_support databases takes the role of "detected in both".
+    
+    The merge is a single pass: the union of taxids is sorted once and every
+    report is scattered into preallocated per-database columns by position, so
+    memory is linear in the number of distinct taxa (times N read columns).
+    
+    Parameters:
+        report_files: {db_name: report path}, in databases.csv order; taxon name
+                      and rank come from the first database detecting the taxon
+        reads_threshold_high / reads_threshold_medium / min_direct_reads: see integrate_results
+        min_support: Databases required for the consensus classes (default 2)
+        output_prefix: Output file prefix (default: <sample_id>_integrated)
+        sample_id: Sample ID (default: inferred from the first report)
+        output_format: tsv, parquet or feather
+        cache_dir / cache_max_mb: Parsed-report cache (see parse_kraken_report)
+        quiet: Skip the console banner, totals and support table
+        write_metrics: Write stage metrics to <output_prefix>_metrics.json
+    
+    Returns:
+        Integrated DataFrame with per-database In_/Reads/Percent columns
+    """
+    db_names = list(report_files)
+    n_db = len(db_names)
+    if sample_id is None:
+        sample_id = infer_sample_id(report_files[db_names[0]])
+    if output_prefix is None:
+        output_prefix = f"{sample_id}_integrated"
+    if output_format not in OUTPUT_FORMATS:
+        print(f"Error: Unknown output format {output_format} (choose from {', '.join(OUTPUT_FORMATS)})")
+        sys.exit(1)
+    
+    if not quiet:
+        print("\n" + "="*70)
+        print(f"Kraken2 Results Integration Analysis - {n_db} Databases")
+        print(f"Sample: {sample_id}")
+        print(f"Databases: {', '.join(db_names)}")
+        print("="*70 + "\n")
+    
+    metrics = StageMetrics(sample_id)
+    reports = []
+    for db in db_names:
+        reports.append(parse_kraken_report(report_files[db], min_direct_reads, cache_dir, cache_max_mb))
+        metrics.lap(f'parse_{db}', rows=len(reports[-1]))
+    taxids = np.unique(np.concatenate(
+        [report.index.to_numpy(dtype='int64') for report in reports] + [np.empty(0, dtype='int64')]))
+    n_taxa = len(taxids)
+    if not quiet:
+        print(f"\nTotal detected: {n_taxa} classification entries with direct reads")
+    
+    detected = np.zeros((n_db, n_taxa), dtype=bool)
+    reads_direct = np.zeros((n_db, n_taxa), dtype='int64')
+    reads_total = np.zeros((n_db, n_taxa), dtype='int64')
+    percent = np.zeros((n_db, n_taxa), dtype='float64')
+    name = np.empty(n_taxa, dtype=object)
+    rank = np.empty(n_taxa, dtype=object)
+    
+    for i, report in enumerate(reports):
+        pos = np.searchsorted(taxids, report.index.to_numpy(dtype='int64'))
+        # Name and rank from the first database that detects the taxon
+        new = ~detected[:i, pos].any(axis=0)
+        name[pos[new]] = report['name'].to_numpy(dtype=object)[new]
+        rank[pos[new]] = report['rank'].to_numpy(dtype=object)[new]
+        detected[i, pos] = True
+        reads_direct[i, pos] = report['reads_direct'].to_numpy()
+        reads_total[i, pos] = report['reads_total'].to_numpy()
+        percent[i, pos] = report['percent'].to_numpy()
+    del reports
+    metrics.lap('join', rows=n_taxa)
+    
+    support = detected.sum(axis=0)
+    max_direct_reads = reads_direct.max(axis=0, initial=0)
+    max_percent = percent.max(axis=0, initial=0.0)
+    avg_percent = percent.sum(axis=0) / np.maximum(support, 1)
+    
+    # Same ladder as integrate_results, with "both" -> support >= min_support
+    consensus = support >= min_support
+    high_reads = max_direct_reads >= reads_threshold_high
+    medium_reads = max_direct_reads >= reads_threshold_medium
+    conditions = [consensus & high_reads, consensus & medium_reads, consensus,
+                  high_reads, medium_reads]
+    confidence = np.select(conditions, ['High', 'Medium-High', 'Low', 'Medium', 'Low-Medium'],
+                           default='Low')
+    priority = np.select(conditions, [1, 2, 5, 3, 4], default=5)
+    read_level = np.select([high_reads, medium_reads],
+                           ['HighReads(≥100)', 'MediumReads(50-99)'],
+                           default='LowReads(<50)')
+    description = np.char.add(np.char.add(support.astype(str), f'of{n_db}DB-'), read_level)
+    
+    # Detection pattern as a bitmask, labelled once per distinct pattern
+    pattern = (detected.astype('int64') << np.arange(n_db)[:, None]).sum(axis=0)
+    labels = {code: ';'.join(db for j, db in enumerate(db_names) if code >> j & 1)
+              for code in np.unique(pattern)}
+    
+    rank = pd.Series(rank)
+    unique_ranks = rank.unique()
+    yes_no = np.array(['No', 'Yes'])
+    columns = {
+        'Taxon_Name': name,
+        'Rank': rank,
+        'Rank_Name': rank.map({r: get_rank_name(r) for r in unique_ranks}),
+        'Rank_Priority': rank.map({r: get_rank_priority(r) for r in unique_ranks}),
+        'NCBI_TaxID': taxids,
+        'Confidence': confidence,
+        'Priority': priority,
+        'Description': description,
+        'Support': support,
+        'N_Databases': np.full(n_taxa, n_db),
+        'Detected_In': pd.Series(pattern).map(labels)
+    }
+    for i, db in enumerate(db_names):
+        columns[f'In_{db}'] = yes_no[detected[i].astype(int)]
+    for i, db in enumerate(db_names):
+        columns[f'{db}_Reads_Direct'] = reads_direct[i]
+        columns[f'{db}_Reads_Total'] = reads_total[i]
+        columns[f'{db}_Percent'] = percent[i]
+    columns['Max_Direct_Reads'] = max_direct_reads
+    columns['Max_Percent'] = max_percent
+    columns['Avg_Percent'] = avg_percent
+    df = pd.DataFrame(columns)
+    metrics.lap('classify', rows=len(df))
+    
+    # Sort: by priority, then rank, then direct reads
+    df = df.sort_values(
+        ['Priority', 'Rank_Priority', 'Max_Direct_Reads'], 
+        ascending=[True, True, False],
+        kind='stable'
+    )
+    metrics.lap('sort', rows=len(df))
+    
+    full_output = f"{output_prefix}_multidb_full.{output_format}"
+    if output_format == 'tsv':
+        df.to_csv(full_output, sep='\t', index=False, encoding='utf-8')
+    else:
+        write_columnar(df, full_output, output_format)
+    metrics.lap('write_full', rows=len(df))
+    print(f"\n✅ Complete results saved to: {full_output}")
+    
+    # Support and detection pattern summaries
+    support_counts = df['Support'].value_counts().sort_index(ascending=False)
+    confidence_counts = df['Confidence'].value_counts()
+    species_patterns = df.loc[df['Rank'] == 'S', 'Detected_In'].value_counts()
+    
+    summary_output = f"{output_prefix}_multidb_summary.txt"
+    with open(summary_output, 'w', encoding='utf-8') as f:
+        f.write("="*70 + "\n")
+        f.write(f"Sample {sample_id} Virus Classification Integration Report ({n_db} databases)\n")
+        f.write("Improvement: Only counts direct read classifications, avoiding parent duplication\n")
+        f.write("="*70 + "\n\n")
+        
+        f.write("Database Information:\n")
+        for i, db in enumerate(db_names):
+            f.write(f"  - {db}: {os.path.basename(report_files[db])} "
+                    f"({int(detected[i].sum())} classifications)\n")
+        f.write("\n")
+        
+        f.write("Integration Parameters:\n")
+        f.write(f"  - High confidence reads threshold: {reads_threshold_high}\n")
+        f.write(f"  - Medium confidence reads threshold: {reads_threshold_medium}\n")
+        f.write(f"  - Minimum direct reads: {min_direct_reads}\n")
+        f.write(f"  - Minimum supporting databases (consensus): {min_support}\n\n")
+        
+        f.write("Integration Statistics (direct read classifications):\n")
+        f.write(f"  - Total classifications: {len(df)}\n")
+        for k, count in support_counts.items():
+            f.write(f"  - Detected in {k} of {n_db} databases: {count}\n")
+        for level in CONFIDENCE_LEVELS:
+            f.write(f"  - {level} confidence: {confidence_counts.get(level, 0)}\n")
+        
+        f.write("\n" + "="*70 + "\n")
+        f.write("Species-level Detection Patterns\n")
+        f.write("="*70 + "\n")
+        for detected_in, count in species_patterns.items():
+            f.write(f"  {count:>6}  {detected_in}\n")
+    metrics.lap('write_summary')
+    
+    print(f"✅ Summary report saved to: {summary_output}")
+    if write_metrics:
+        metrics_output = metrics.write(
+            f"{output_prefix}_metrics.json",
+            inputs=report_files,
+            thresholds={'reads_threshold_high': reads_threshold_high,
+                        'reads_threshold_medium': reads_threshold_medium,
+                        'min_direct_reads': min_direct_reads,
+                        'min_support': min_support},
+            output_format=output_format)
+        print(f"✅ Stage metrics saved to: {metrics_output}")
+    if not quiet:
+        print(f"\n📊 Support (databases detecting each classification):")
+        for k, count in support_counts.items():
+            print(f"  - {k} of {n_db}: {count}")
+    
+    print("\n" + "="*70)
+    print("✅ Integration analysis complete!")
+    print("="*70 + "\n")
+    
+    return df
+
+def parse_report_specs(specs):
+    """
+    Parse DB=PATH report arguments into {db_name: path}, in argument order
+    """
+    report_files = {}
+    for spec in specs:
+        db_name, sep, path = spec.partition('=')
+        db_name = db_name.strip()
+        if not sep or not db_name or not path:
+            print(f"Error: Expected DB=PATH, got {spec}")
+            sys.exit(1)
+        if db_name in report_files:
+            print(f"Error: Database {db_name} given more than once")
+            sys.exit(1)
+        if not os.path.exists(path):
+            print(f"Error: Cannot find {db_name} result file: {path}")
+            sys.exit(1)
+        report_files[db_name] = path
+    if len(report_files) < 2:
+        print("Error: Multi-database integration needs at least two reports (--reports DB=PATH ...)")
+        sys.exit(1)
+    return report_files
+
+def read_samplesheet(samplesheet_file):
+    """
+    Read sample IDs from a taxprofiler samplesheet.csv (first occurrence order)
+    """
+    samples = []
+    with open(samplesheet_file, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            sample = (row.get('sample') or '').strip()
+            if sample and sample not in samples:
+                samples.append(sample)
+    return samples
+
+def read_databases(databases_file, tool='kraken2'):
+    """
+    Read database names for one profiler from a taxprofiler databases.csv
+    """
+    db_names = []
+    with open(databases_file, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if (row.get('tool') or '').strip() == tool:
+                db_names.append(row['db_name'].strip())
+    return db_names
+
+def find_kraken_report(results_dir, sample, db_name):
+    """
+    Locate the Kraken2 report of one sample/database pair
+    
+    Looks for the renamed layout (<sample>_<db_name>.txt) first, then for the
+    taxprofiler layout (kraken2/<db_name>/<sample>[_<run>]_<db_name>*.report.txt).
+    
+    Returns:
+        Path to the report, or None if not found
+    """
+    patterns = [
+        os.path.join(results_dir, f"{sample}_{db_name}.txt"),
+        os.path.join(results_dir, 'kraken2', db_name, f"{sample}_{db_name}*report.txt"),
+        os.path.join(results_dir, 'kraken2', db_name, f"{sample}_*_{db_name}*report.txt"),
+        os.path.join(results_dir, '**', f"{sample}_{db_name}*report.txt"),
+    ]
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if matches:
+            if len(matches) > 1:
+                print(f"Warning: {len(matches)} {db_name} reports for {sample}, using {matches[0]}")
+            return matches[0]
+    return None
+
+def discover_samples(results_dir, db_name):
+    """
+    Discover sample IDs from the report filenames of one database
+    
+    Without run merging taxprofiler names reports per run, so the returned
+    IDs then carry the run accession (e.g. 66ce4dde_run_001).
+    """
+    samples = set()
+    for path in glob.glob(os.path.join(results_dir, f"*_{db_name}.txt")):
+        samples.add(os.path.basename(path)[:-len(f"_{db_name}.txt")])
+    for path in glob.glob(os.path.join(results_dir, '**', f"*_{db_name}*report.txt"), recursive=True):
+        samples.add(os.path.basename(path).split(f"_{db_name}")[0])
+    return sorted(samples)
+
+def _integrate_sample(job):
+    """
+    Process pool worker: integrate one sample, console output goes to a per-sample log
+    
+    job is (integrate function, sample, positional inputs, outdir, keyword options)
+    """
+    integrate, sample, inputs, outdir, options = job
+    output_prefix = os.path.join(outdir, f"{sample}_integrated")
+    with open(f"{output_prefix}_log.txt", 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log):
+        df = integrate(*inputs,
+                       output_prefix=output_prefix,
+                       sample_id=sample,
+                       **options)
+    return sample, df
+
+def integrate_cohort(results_dir, samplesheet_file=None, databases_file=None,
+                     outdir='.', jobs=None,
+                     reads_threshold_high=100,
+                     reads_threshold_medium=50,
+                     min_direct_reads=0,
+                     rvdb_db=DEFAULT_RVDB_DB,
+                     ncbi_db=DEFAULT_NCBI_DB,
+                     output_format='tsv',
+                     cache_dir=None,
+                     cache_max_mb=DEFAULT_CACHE_MAX_MB,
+                     multi_db=False,
+                     min_support=2,
+                     quiet=False,
+                     write_metrics=False):
+    """
+    Integrate every sample of a taxprofiler results directory in parallel
+    
+    Parameters:
+        results_dir: taxprofiler results directory (or a flat directory of reports)
+        samplesheet_file: Optional samplesheet.csv restricting/ordering the samples
+        databases_file: Optional databases.csv (used to validate the database names)
+        outdir: Output directory for per-sample files and the cohort table
+        jobs: Number of worker processes (default: all cores)
+        reads_threshold_high / reads_threshold_medium / min_direct_reads: see integrate_results
+        rvdb_db / ncbi_db: db_name of the RVDB and NCBI Kraken2 databases
+        output_format: tsv, parquet or feather (per-sample and cohort tables)
+        cache_dir / cache_max_mb: Parsed-report cache shared by all workers
+        multi_db: Integrate all Kraken2 databases of databases_file (required)
+                  with integrate_multi_db instead of the RVDB/NCBI pair
+        min_support: Consensus database count for multi_db mode
+        quiet / write_metrics: Per-sample console tables and metrics sidecars
+                               (see integrate_results)
+    
+    Returns:
+        Combined cohort DataFrame (all samples, Sample column first)
+    """
+    if multi_db:
+        if not databases_file:
+            print("Error: Multi-database integration requires databases.csv (--databases)")
+            sys.exit(1)
+        db_names = read_databases(databases_file)
+        if not db_names:
+            print(f"Error: No kraken2 databases listed in {databases_file}")
+            sys.exit(1)
+    elif databases_file:
+        db_names = read_databases(databases_file)
+        for db_name in (rvdb_db, ncbi_db):
+            if db_name not in db_names:
+                print(f"Error: Database {db_name} not listed in {databases_file} ({', '.join(db_names)})")
+                sys.exit(1)
+    
+    if samplesheet_file:
+        samples = read_samplesheet(samplesheet_file)
+    else:
+        samples = discover_samples(results_dir, db_names[0] if multi_db else rvdb_db)
+    
+    os.makedirs(outdir, exist_ok=True)
+    options = {
+        'reads_threshold_high': reads_threshold_high,
+        'reads_threshold_medium': reads_threshold_medium,
+        'min_direct_reads': min_direct_reads,
+        'output_format': output_format,
+        'cache_dir': cache_dir,
+        'cache_max_mb': cache_max_mb,
+        'quiet': quiet,
+        'write_metrics': write_metrics
+    }
+    if multi_db:
+        options['min_support'] = min_support
+    
+    print("\n" + "="*70)
+    print("Kraken2 Results Integration - Cohort Mode")
+    print(f"Results directory: {results_dir}")
+    print(f"Samples: {len(samples)}")
+    print("="*70 + "\n")
+    
+    jobs_list = []
+    for sample in samples:
+        if multi_db:
+            report_files = {db: find_kraken_report(results_dir, sample, db) for db in db_names}
+        else:
+            report_files = {db: find_kraken_report(results_dir, sample, db) for db in (rvdb_db, ncbi_db)}
+        missing = [db for db, path in report_files.items() if path is None]
+        if missing:
+            print(f"⚠️  Skipping {sample}: no {', '.join(missing)} report found")
+            continue
+        if multi_db:
+            jobs_list.append((integrate_multi_db, sample, (report_files,), outdir, options))
+        else:
+            jobs_list.append((integrate_results, sample, tuple(report_files.values()), outdir, options))
+    
+    results = {}
+    failed = []
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(jobs_list) or 1))
+    
+    if jobs == 1:
+        for job in jobs_list:
+            try:
+                sample, df = _integrate_sample(job)
+                results[sample] = df
+                print(f"✅ {sample}: {len(df)} classifications")
+            except (Exception, SystemExit) as e:
+                failed.append(job[1])
+                print(f"❌ {job[1]}: integration failed ({e})")
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(_integrate_sample, job): job[1] for job in jobs_list}
+            for future in as_completed(futures):
+                sample = futures[future]
+                try:
+                    _, df = future.result()
+                    results[sample] = df
+                    print(f"✅ {sample}: {len(df)} classifications")
+                except (Exception, SystemExit) as e:
+                    failed.append(sample)
+                    print(f"❌ {sample}: integration failed ({e})")
+    
+    # Combined cohort table, in samplesheet/discovery order
+    frames = []
+    for sample in samples:
+        if sample in results:
+            frames.append(results[sample].assign(Sample=sample))
+    if frames:
+        cohort_df = pd.concat(frames, ignore_index=True)
+        cohort_df = cohort_df[['Sample'] + [c for c in cohort_df.columns if c != 'Sample']]
+    else:
+        cohort_df = pd.DataFrame()
+    
+    table_name = 'multidb_full' if multi_db else 'full'
+    cohort_output = os.path.join(outdir, f"cohort_integrated_{table_name}.{output_format}")
+    if output_format == 'tsv':
+        cohort_df.to_csv(cohort_output, sep='\t', index=False, encoding='utf-8')
+    elif frames:
+        write_columnar(cohort_df, cohort_output, output_format)
+    
+    print("\n" + "="*70)
+    print(f"✅ Integrated {len(results)}/{len(samples)} samples with {jobs} worker(s)")
+    if failed:
+        print(f"❌ Failed samples: {', '.join(sorted(failed))} (see *_integrated_log.txt)")
+    print(f"✅ Cohort table saved to: {cohort_output}")
+    print("="*70 + "\n")
+    
+    return cohort_df
+
 def main():
     """
     Main function
     """
+    parser = argparse.ArgumentParser(
+        description="Integrate Kraken2 RVDB and NCBI reports (single sample or --batch cohort)")
     # Default file paths (new filenames)
-    rvdb_file = "66ce4dde_kraken2_RVDB.txt"
-    ncbi_file = "66ce4dde_kraken2_NCBI.txt"
+    parser.add_argument('rvdb_file', nargs='?', default="66ce4dde_kraken2_RVDB.txt",
+                        help="RVDB Kraken2 report")
+    parser.add_argument('ncbi_file', nargs='?', default="66ce4dde_kraken2_NCBI.txt",
+                        help="NCBI Kraken2 report")
+    # Optional: set thresholds from command line
+    parser.add_argument('reads_threshold_high', nargs='?', type=int, default=100,
+                        help="High confidence reads threshold (default 100)")
+    parser.add_argument('reads_threshold_medium', nargs='?', type=int, default=50,
+                        help="Medium confidence reads threshold (default 50)")
+    parser.add_argument('min_direct_reads', nargs='?', type=int, default=0,
+                        help="Minimum direct reads (default 0, retains all with direct reads)")
+    parser.add_argument('--batch', metavar='RESULTS_DIR',
+                        help="Integrate every sample found in a taxprofiler results directory")
+    parser.add_argument('--samplesheet', help="taxprofiler samplesheet.csv (batch mode)")
+    parser.add_argument('--databases', help="taxprofiler databases.csv (batch mode)")
+    parser.add_argument('--outdir', default='.', help="Output directory (batch mode, default .)")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Worker processes (batch mode, default: all cores)")
+    parser.add_argument('--rvdb-db', default=DEFAULT_RVDB_DB, help="RVDB db_name in databases.csv")
+    parser.add_argument('--ncbi-db', default=DEFAULT_NCBI_DB, help="NCBI db_name in databases.csv")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='tsv',
+                        help="Integrated table format; parquet/feather need pyarrow (default tsv)")
+    parser.add_argument('--cache-dir',
+                        help="Parsed-report cache directory (re-runs with new thresholds skip parsing)")
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_CACHE_MAX_MB,
+                        help=f"Parsed-report cache size limit in MB (default {DEFAULT_CACHE_MAX_MB})")
+    parser.add_argument('--multi-db', action='store_true',
+                        help="Batch mode: integrate all Kraken2 databases listed in --databases")
+    parser.add_argument('--reports', nargs='+', metavar='DB=PATH',
+                        help="Integrate one sample's reports from any number of Kraken2 databases")
+    parser.add_argument('--min-support', type=int, default=2,
+                        help="Multi-database mode: databases required for consensus (default 2)")
+    parser.add_argument('--quiet', action='store_true',
+                        help="Skip the console summary statistics and Top N tables")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Write per-stage timings, row counts and peak memory to <prefix>_metrics.json")
+    parser.add_argument('--sweep', action='store_true',
+                        help="Threshold sweep: count confidence classes for every threshold combination")
+    parser.add_argument('--sweep-high', help="High thresholds, e.g. 50:200:25 or 50,100,150 (sweep mode)")
+    parser.add_argument('--sweep-medium', help="Medium thresholds, e.g. 25:100:25 (sweep mode)")
+    parser.add_argument('--sweep-min-direct', help="Minimum direct reads, e.g. 0,1,5,10 (sweep mode)")
+    parser.add_argument('--high', type=int, help="High confidence reads threshold (overrides positional)")
+    parser.add_argument('--medium', type=int, help="Medium confidence reads threshold (overrides positional)")
+    parser.add_argument('--min-direct', type=int, help="Minimum direct reads (overrides positional)")
+    # Intermixed: positional reports/thresholds may follow options such as --output-format
+    args = parser.parse_intermixed_args()
     
-    # Use command line arguments if provided
-    if len(sys.argv) >= 3:
-        rvdb_file = sys.argv[1]
-        ncbi_file = sys.argv[2]
+    reads_threshold_high = args.high if args.high is not None else args.reads_threshold_high
+    reads_threshold_medium = args.medium if args.medium is not None else args.reads_threshold_medium
+    min_direct_reads = args.min_direct if args.min_direct is not None else args.min_direct_reads
     
-    # Optional: set thresholds from command line
-    reads_threshold_high = 100
-    reads_threshold_medium = 50
-    min_direct_reads = 0  # Minimum direct reads, 0 = retain all with direct reads
+    if args.batch:
+        if not os.path.isdir(args.batch):
+            print(f"Error: Cannot find results directory: {args.batch}")
+            sys.exit(1)
+        integrate_cohort(args.batch, args.samplesheet, args.databases,
+                         outdir=args.outdir, jobs=args.jobs,
+                         reads_threshold_high=reads_threshold_high,
+                         reads_threshold_medium=reads_threshold_medium,
+                         min_direct_reads=min_direct_reads,
+                         rvdb_db=args.rvdb_db, ncbi_db=args.ncbi_db,
+                         output_format=args.output_format,
+                         cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb,
+                         multi_db=args.multi_db, min_support=args.min_support,
+                         quiet=args.quiet, write_metrics=args.metrics)
+        return
+    
+    if args.reports:
+        if (args.rvdb_file, args.ncbi_file) != (parser.get_default('rvdb_file'), parser.get_default('ncbi_file')):
+            print("Error: --reports takes no positional reports or thresholds (use --high/--medium/--min-direct)")
+            sys.exit(1)
+        integrate_multi_db(parse_report_specs(args.reports),
+                           reads_threshold_high, reads_threshold_medium, min_direct_reads,
+                           min_support=args.min_support,
+                           output_format=args.output_format,
+                           cache_dir=args.cache_dir,
+                           cache_max_mb=args.cache_max_mb,
+                           quiet=args.quiet,
+                           write_metrics=args.metrics)
+        return
     
-    if len(sys.argv) >= 4:
-        reads_threshold_high = int(sys.argv[3])
-    if len(sys.argv) >= 5:
-        reads_threshold_medium = int(sys.argv[4])
-    if len(sys.argv) >= 6:
-        min_direct_reads = int(sys.argv[5])
+    rvdb_file = args.rvdb_file
+    ncbi_file = args.ncbi_file
+    
+    if args.sweep:
+        for path, label in ((rvdb_file, 'RVDB'), (ncbi_file, 'NCBI')):
+            if not os.path.exists(path):
+                print(f"Error: Cannot find {label} result file: {path}")
+                sys.exit(1)
+        sweep_thresholds(rvdb_file, ncbi_file,
+                         parse_grid(args.sweep_high or reads_threshold_high),
+                         parse_grid(args.sweep_medium or reads_threshold_medium),
+                         parse_grid(args.sweep_min_direct or min_direct_reads),
+                         cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb)
+        return
     
     # Check if files exist
     if not os.path.exists(rvdb_file):
         print(f"Error: Cannot find RVDB result file: {rvdb_file}")
         print("\nUsage:")
         print("  python integrate_66ce4dde_EN.py [RVDB_file] [NCBI_file] [high_threshold] [medium_threshold] [min_direct_reads]")
+        print("  python integrate_66ce4dde_EN.py --batch RESULTS_DIR [--samplesheet samplesheet.csv] [--databases databases.csv] [--outdir DIR] [--jobs N]")
+        print("  python integrate_66ce4dde_EN.py --reports DB=PATH DB=PATH [DB=PATH ...] [--min-support K]")
         print("\nExample:")
         print("  python integrate_66ce4dde_EN.py \\")
         print("    66ce4dde_kraken2_RVDB.txt \\")
@@ -529,8 +1702,12 @@ def main():
     integrate_results(rvdb_file, ncbi_file, 
                      reads_threshold_high, 
                      reads_threshold_medium,
-                     min_direct_reads)
+                     min_direct_reads,
+                     output_format=args.output_format,
+                     cache_dir=args.cache_dir,
+                     cache_max_mb=args.cache_max_mb,
+                     quiet=args.quiet,
+                     write_metrics=args.metrics)
 
 if __name__ == "__main__":
     main()
-